@@ -1,9 +1,14 @@
 # coding:utf-8
+import os
+import json
 import numpy as np
 # import tensorflow as tf
 import random
 import math
-import operator
+
+LANE_NUMBER = 3  # left, mid, right
+VEHICLE_NUMBER = 3  # vehicles kept per leader/follower side
+VEHICLE_DATA_SIZE = 4 * VEHICLE_NUMBER
 
 
 class DataProcess:
@@ -20,15 +25,11 @@ class DataProcess:
         self.laneData = []
         self.speed = 10
 
-    def _chosen_vehicle(self, vehicle, number=3):
+    def _chosen_vehicle(self, vehicle, number=3):  # the Surrounding lists are ordered nearest first
         if vehicle!=None:
-            sored_vehicle = sorted(vehicle, key=operator.itemgetter('relative_lane_position_abs'))
-        else:
-            sored_vehicle = []
-        if len(sored_vehicle) > number:
-            return sored_vehicle[0:number]
+            return vehicle[:number]
         else:
-            return sored_vehicle
+            return []
 
     def _vehicle_data_process(self, leader, follower, speed):
         vehicle_data = np.array([200.0,speed,200.0,speed,200.0,speed,-200.0,speed,-200.0,speed,-200.0,speed])
@@ -65,7 +66,180 @@ class DataProcess:
         return self.rightVehicleData
 
 
+class BatchDataProcess:
+    """writes the (left, mid, right) vehicle data of n_env environments into one preallocated buffer
+
+    observation[i] has the layout of DataProcess, row 0/1/2 is get_left/mid/right_vehicle_data() of environment i.
+    The buffer is updated in place and never reallocated, the policy can keep a reference to it.
+    """
+    LEADER_COLUMN = np.array([4, 2, 0])  # nearest leader goes to column 4, the third one to column 0
+    FOLLOWER_COLUMN = np.array([6, 8, 10])
+
+    def __init__(self, n_env, dtype=np.float32, buffer=None):
+        self.nEnv = n_env
+        if buffer is None:
+            self.observation = np.zeros((n_env, LANE_NUMBER, VEHICLE_DATA_SIZE), dtype=dtype)
+        else:  # e.g. an array over shared memory, written in place by several processes
+            self.observation = buffer.reshape(n_env, LANE_NUMBER, VEHICLE_DATA_SIZE)
+
+    def get_observation(self):
+        return self.observation
+
+    def get_env_observation(self, env_index):
+        return self.observation[env_index]
+
+    def set_surrounding_data(self, env_index, surrounding, speed):
+        lane_data = self.observation[env_index]
+        lane_data[:, 0:6:2] = 200.0
+        lane_data[:, 6::2] = -200.0
+        lane_data[:, 1::2] = speed
+        if getattr(surrounding, 'columnar', False):
+            self._set_columnar_data(lane_data, surrounding, speed)
+            return
+        lanes = ((surrounding.get_left_leader_neighbor_list(), surrounding.get_left_follower_neighbor_list()),
+                 (surrounding.get_mid_leader_neighbor_list(), surrounding.get_mid_follower_neighbor_list()),
+                 (surrounding.get_right_leader_neighbor_list(), surrounding.get_right_follower_neighbor_list()))
+        for lane, (leader, follower) in enumerate(lanes):  # nearest first
+            for i, vehicle in enumerate((leader or [])[:VEHICLE_NUMBER]):
+                lane_data[lane, self.LEADER_COLUMN[i]] = vehicle['relative_lane_position']
+                lane_data[lane, self.LEADER_COLUMN[i] + 1] = vehicle['speed'] - speed
+            for i, vehicle in enumerate((follower or [])[:VEHICLE_NUMBER]):
+                lane_data[lane, self.FOLLOWER_COLUMN[i]] = vehicle['relative_lane_position']
+                lane_data[lane, self.FOLLOWER_COLUMN[i] + 1] = vehicle['speed'] - speed
+
+    def _set_columnar_data(self, lane_data, surrounding, speed):
+        table = surrounding.get_neighbor_table()
+        rows = surrounding.get_classify_rows()
+        for lane, lane_rows in enumerate((rows[-1], rows[0], rows[1])):  # LEFT, MID, RIGHT
+            for side_rows, column in zip(lane_rows, (self.LEADER_COLUMN, self.FOLLOWER_COLUMN)):
+                chosen = side_rows[:VEHICLE_NUMBER]  # nearest first
+                lane_data[lane, column[:len(chosen)]] = table.relativePositionX[chosen]
+                lane_data[lane, column[:len(chosen)] + 1] = table.speed[chosen] - speed
+
+
+class SumTree:
+    """array-backed binary tree, every node holds the sum of its two children, the leaves the priorities
+
+    Leaf i is tree[capacity + i], the root is tree[1]. Updates and searches take O(log n) and are
+    vectorized over a batch of indices.
+    """
+    def __init__(self, capacity, tree=None):
+        self.capacity = 1 << max(int(capacity) - 1, 0).bit_length()  # leaves, a power of two
+        self.tree = np.zeros(2 * self.capacity) if tree is None else tree
+
+    def total(self):
+        return self.tree[1]
+
+    def get(self, indices):
+        return self.tree[self.capacity + np.asarray(indices)]
+
+    def update(self, indices, priorities):
+        nodes = self.capacity + np.asarray(indices)
+        self.tree[nodes] = priorities
+        nodes = np.unique(nodes >> 1)
+        while nodes[0] >= 1:
+            self.tree[nodes] = self.tree[2 * nodes] + self.tree[2 * nodes + 1]
+            if nodes[0] == 1:
+                break
+            nodes = np.unique(nodes >> 1)
+
+    def find(self, values):
+        """leaf indices whose prefix sum interval contains values, values in [0, total())"""
+        values = np.array(values, dtype=np.float64)
+        nodes = np.ones(len(values), dtype=np.int64)
+        while nodes[0] < self.capacity:  # all nodes are on the same level
+            left = self.tree[2 * nodes]
+            right = values >= left
+            values -= np.where(right, left, 0.0)
+            nodes = 2 * nodes + right
+        return nodes - self.capacity
+
+
+class ReplayBuffer:
+    """fixed-capacity ring buffer of (obs, action, reward, next_obs, done) with prioritized sampling
+
+    obs and next_obs have the (LANE_NUMBER, VEHICLE_DATA_SIZE) layout of DataProcess/BatchDataProcess.
+    With a directory every array is a .npy memmap in it, so the buffer can be larger than the RAM and
+    is reopened with its content by the next ReplayBuffer on the same directory.
+    """
+    def __init__(self, capacity, directory=None, dtype=np.float32, alpha=0.6, beta=0.4, epsilon=1e-6, seed=None):
+        self.capacity = capacity
+        self.directory = directory
+        self.alpha = alpha  # 0 samples uniformly
+        self.beta = beta  # importance sampling correction, 1 corrects fully
+        self.epsilon = epsilon  # keeps transitions with zero td error sampleable
+        self.rng = np.random.default_rng(seed)
+        self.position = 0  # next row to write
+        self.size = 0
+        self.maxPriority = 1.0
+        observation_shape = (capacity, LANE_NUMBER, VEHICLE_DATA_SIZE)
+        self.observation = self._array('observation', observation_shape, dtype)
+        self.action = self._array('action', (capacity,), np.int16)
+        self.reward = self._array('reward', (capacity,), np.float32)
+        self.nextObservation = self._array('next_observation', observation_shape, dtype)
+        self.done = self._array('done', (capacity,), np.bool_)
+        tree_capacity = SumTree(capacity).capacity
+        self.tree = SumTree(capacity, self._array('priority_tree', (2 * tree_capacity,), np.float64))
+        if directory is not None and os.path.isfile(os.path.join(directory, 'meta.json')):
+            with open(os.path.join(directory, 'meta.json')) as f:
+                meta = json.load(f)
+            self.position, self.size, self.maxPriority = meta['position'], meta['size'], meta['max_priority']
+
+    def _array(self, name, shape, dtype):
+        if self.directory is None:
+            return np.zeros(shape, dtype=dtype)
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, name + '.npy')
+        if os.path.isfile(path):
+            array = np.load(path, mmap_mode='r+')
+            if array.shape != shape or array.dtype != dtype:
+                raise ValueError("%s has shape %s %s, expected %s %s" % (path, array.shape, array.dtype, shape,
+                                                                         np.dtype(dtype)))
+            return array
+        return np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=shape)
+
+    def __len__(self):
+        return self.size
+
+    def add(self, observation, action, reward, next_observation, done):
+        self.add_batch(observation[None], [action], [reward], next_observation[None], [done])
 
+    def add_batch(self, observation, action, reward, next_observation, done):
+        """one transition per row, e.g. one step of all environments of a VecEnv"""
+        n = len(action)
+        rows = (self.position + np.arange(n)) % self.capacity
+        self.observation[rows] = observation
+        self.action[rows] = action
+        self.reward[rows] = reward
+        self.nextObservation[rows] = next_observation
+        self.done[rows] = done
+        self.tree.update(rows, self.maxPriority)  # new transitions are sampled at least once with high priority
+        self.position = int((self.position + n) % self.capacity)
+        self.size = min(self.size + n, self.capacity)
+        return rows
 
+    def sample(self, batch_size, beta=None):
+        """(observation, action, reward, next_observation, done, weight, rows), rows for update_priorities"""
+        beta = self.beta if beta is None else beta
+        total = self.tree.total()
+        # one value per equal segment of the priority mass, spreads the batch over the buffer
+        values = (np.arange(batch_size) + self.rng.random(batch_size)) * (total / batch_size)
+        rows = np.minimum(self.tree.find(np.minimum(values, np.nextafter(total, 0))), self.size - 1)
+        probability = self.tree.get(rows) / total
+        weight = (self.size * probability) ** -beta
+        weight /= weight.max()
+        return (self.observation[rows], self.action[rows], self.reward[rows], self.nextObservation[rows],
+                self.done[rows], weight.astype(np.float32), rows)
 
+    def update_priorities(self, rows, td_error):
+        priority = (np.abs(np.asarray(td_error, dtype=np.float64)) + self.epsilon) ** self.alpha
+        self.tree.update(rows, priority)
+        self.maxPriority = max(self.maxPriority, float(priority.max()))
 
+    def flush(self):  # the arrays are written by the OS anyway, this makes the buffer reopenable
+        if self.directory is None:
+            return
+        for array in (self.observation, self.action, self.reward, self.nextObservation, self.done, self.tree.tree):
+            array.flush()
+        with open(os.path.join(self.directory, 'meta.json'), 'w') as f:
+            json.dump({'position': self.position, 'size': self.size, 'max_priority': self.maxPriority}, f)
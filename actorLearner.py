@@ -0,0 +1,405 @@
+# coding:utf-8
+import os
+import sys
+import time
+import optparse
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import numpy as np
+
+# we need to import python modules from the $SUMO_HOME/tools directory
+if 'SUMO_HOME' in os.environ:
+    tools = os.path.join(os.environ['SUMO_HOME'], 'tools')
+    sys.path.append(tools)
+else:
+    sys.exit("please declare environment variable 'SUMO_HOME'")
+
+from traci.exceptions import FatalTraCIError  # noqa
+from surrounding import Traffic  # noqa
+from roadNetwork import RoadNetwork
+from laneChangeEnv import LaneChangeEnv, ACTION_NUMBER
+from RL_brain import ReplayBuffer, LANE_NUMBER, VEHICLE_DATA_SIZE
+from policyEngine import PolicyEngine, OBSERVATION_SIZE, save_weights
+
+CACHE_LINE = 64  # bytes, counters written by different processes do not share a line
+WRITTEN, READ, POLICY_VERSION = 0, 1, 2  # header rows of a TransitionRing
+TRANSITION_FIELDS = (('observation', np.float32, (LANE_NUMBER, VEHICLE_DATA_SIZE)), ('action', np.int16, ()),
+                     ('reward', np.float32, ()), ('next_observation', np.float32, (LANE_NUMBER, VEHICLE_DATA_SIZE)),
+                     ('done', np.bool_, ()))
+# the learner sees the observation divided by this, relative positions up to 200 m and speeds up to ~30 m/s
+OBSERVATION_SCALE = np.tile(np.array([200.0, 30.0], dtype=np.float32), OBSERVATION_SIZE // 2)
+POLL_INTERVAL = 0.001  # s an actor waits for the learner if its ring is full
+
+
+def _aligned(offset):
+    return -(-offset // CACHE_LINE) * CACHE_LINE
+
+
+class TransitionRing:
+    """single-producer single-consumer ring of transitions in a multiprocessing.shared_memory block
+
+    The block starts with three int64 counters on their own cache lines: transitions written (only the
+    actor writes it), transitions read (only the learner writes it) and the policy version the actor
+    acts with. Each field of TRANSITION_FIELDS follows as one array. push() fills a row before it bumps
+    the written counter, consume() hands the rows to a sink as views before it bumps the read counter,
+    so no lock is needed and nothing is pickled. name=None creates the block, otherwise it is attached.
+    """
+    def __init__(self, capacity, name=None):
+        self.capacity = capacity
+        offset_list = []
+        offset = 3 * CACHE_LINE
+        for field, dtype, shape in TRANSITION_FIELDS:
+            offset_list.append(offset)
+            offset = _aligned(offset + capacity * int(np.prod(shape)) * np.dtype(dtype).itemsize)
+        self.sharedMemory = shared_memory.SharedMemory(name=name, create=name is None, size=offset)
+        self.name = self.sharedMemory.name
+        self.header = np.ndarray((3, CACHE_LINE // 8), dtype=np.int64, buffer=self.sharedMemory.buf)
+        if name is None:
+            self.header[:] = 0
+        self.arrays = tuple(np.ndarray((capacity,) + shape, dtype=dtype, buffer=self.sharedMemory.buf, offset=offset)
+                            for (field, dtype, shape), offset in zip(TRANSITION_FIELDS, offset_list))
+        self.observation, self.action, self.reward, self.nextObservation, self.done = self.arrays
+
+    def __len__(self):  # transitions waiting for the learner
+        return int(self.header[WRITTEN, 0] - self.header[READ, 0])
+
+    def get_written(self):
+        return int(self.header[WRITTEN, 0])
+
+    def get_policy_version(self):
+        return int(self.header[POLICY_VERSION, 0])
+
+    def set_policy_version(self, version):
+        self.header[POLICY_VERSION, 0] = version
+
+    def push(self, observation, action, reward, next_observation, done):
+        """copy one transition into the ring, False if the ring is full"""
+        written = int(self.header[WRITTEN, 0])
+        if written - int(self.header[READ, 0]) >= self.capacity:
+            return False
+        row = written % self.capacity
+        self.observation[row] = observation
+        self.action[row] = action
+        self.reward[row] = reward
+        self.nextObservation[row] = next_observation
+        self.done[row] = done
+        self.header[WRITTEN, 0] = written + 1  # publishes the row
+        return True
+
+    def consume(self, sink, max_rows=None):
+        """call sink(observation, action, reward, next_observation, done) on views of the waiting rows
+
+        A wrapped ring is handed over in two calls. The rows are released to the actor once sink returns,
+        sink has to copy what it keeps (ReplayBuffer.add_batch does). Returns the number of rows.
+        """
+        read = int(self.header[READ, 0])
+        n = int(self.header[WRITTEN, 0]) - read
+        if max_rows is not None:
+            n = min(n, max_rows)
+        if n <= 0:
+            return 0
+        start = read % self.capacity
+        first = min(n, self.capacity - start)
+        sink(*(array[start:start + first] for array in self.arrays))
+        if first < n:
+            sink(*(array[:n - first] for array in self.arrays))
+        self.header[READ, 0] = read + n
+        return n
+
+    def close(self):
+        self.arrays = self.observation = self.action = self.reward = self.nextObservation = self.done = None
+        self.header = None  # the block can't be closed while arrays point into it
+        self.sharedMemory.close()
+
+    def unlink(self):
+        self.sharedMemory.unlink()
+
+
+class WeightBoard:
+    """the policy weights in a shared_memory block, published by the learner and read by every actor
+
+    A seqlock: the int64 sequence at the start is odd while publish() writes, readers copy the weights
+    and retry if the sequence changed meanwhile. The version of the weights is sequence // 2.
+    """
+    def __init__(self, layer_sizes, name=None):
+        self.layerSizes = tuple(layer_sizes)
+        self.shapeList = []
+        for inputs, outputs in zip(self.layerSizes[:-1], self.layerSizes[1:]):
+            self.shapeList += [(inputs, outputs), (outputs,)]
+        size = sum(int(np.prod(shape)) for shape in self.shapeList)
+        self.sharedMemory = shared_memory.SharedMemory(name=name, create=name is None, size=CACHE_LINE + 4 * size)
+        self.name = self.sharedMemory.name
+        self.sequence = np.ndarray((1,), dtype=np.int64, buffer=self.sharedMemory.buf)
+        if name is None:
+            self.sequence[0] = 0
+        self.parameters = np.ndarray((size,), dtype=np.float32, buffer=self.sharedMemory.buf, offset=CACHE_LINE)
+        self.copy = np.empty(size, dtype=np.float32)  # what read() returns views of
+        self.retries = 0
+
+    def get_version(self):
+        return int(self.sequence[0]) // 2
+
+    def publish(self, weights, biases):
+        """write a new set of weights, returns its version"""
+        sequence = int(self.sequence[0])
+        self.sequence[0] = sequence + 1
+        first = 0
+        for array in [array for pair in zip(weights, biases) for array in pair]:
+            self.parameters[first:first + array.size] = array.ravel()
+            first += array.size
+        self.sequence[0] = sequence + 2
+        return sequence // 2 + 1
+
+    def read(self, version=0):
+        """(version, weights, biases) if there are weights newer than version, else None
+
+        The arrays are views of a local copy, overwritten by the next read.
+        """
+        while True:
+            sequence = int(self.sequence[0])
+            if sequence // 2 <= version and not sequence & 1:
+                return None
+            if not sequence & 1:
+                self.copy[:] = self.parameters
+                if int(self.sequence[0]) == sequence:
+                    break
+            self.retries += 1
+            time.sleep(0)
+        array_list = []
+        first = 0
+        for shape in self.shapeList:
+            size = int(np.prod(shape))
+            array_list.append(self.copy[first:first + size].reshape(shape))
+            first += size
+        return sequence // 2, array_list[0::2], array_list[1::2]
+
+    def close(self):
+        self.sequence = self.parameters = None
+        self.sharedMemory.close()
+
+    def unlink(self):
+        self.sharedMemory.unlink()
+
+
+class DQNLearner:
+    """double DQN on an MLP in NumPy, with Adam and a Huber loss weighted for prioritized replay
+
+    The weights have the (inputs, outputs) layout of policyEngine. The network sees the observation
+    divided by OBSERVATION_SCALE, get_policy_weights() folds the scale into the first layer so a
+    PolicyEngine takes the raw DataProcess observation.
+    """
+    def __init__(self, hidden_layers=(64, 64), learning_rate=5e-4, gamma=0.99, target_interval=500, seed=0):
+        self.layerSizes = (OBSERVATION_SIZE,) + tuple(hidden_layers) + (ACTION_NUMBER,)
+        self.learningRate = learning_rate
+        self.gamma = gamma
+        self.targetInterval = target_interval  # updates between two copies into the target network
+        rng = np.random.default_rng(seed)
+        self.weights = [(rng.standard_normal((inputs, outputs)) * np.sqrt(2.0 / inputs)).astype(np.float32)
+                        for inputs, outputs in zip(self.layerSizes[:-1], self.layerSizes[1:])]
+        self.biases = [np.zeros(outputs, dtype=np.float32) for outputs in self.layerSizes[1:]]
+        self.targetWeights = [weight.copy() for weight in self.weights]
+        self.targetBiases = [bias.copy() for bias in self.biases]
+        self.moment = [np.zeros_like(array) for array in self.weights + self.biases]
+        self.velocity = [np.zeros_like(array) for array in self.weights + self.biases]
+        self.updates = 0
+
+    @staticmethod
+    def _forward(x, weights, biases):
+        """the input and output of every layer"""
+        activation_list = [x]
+        for i, (weight, bias) in enumerate(zip(weights, biases)):
+            x = x @ weight + bias
+            if i != len(weights) - 1:
+                np.maximum(x, 0.0, out=x)
+            activation_list.append(x)
+        return activation_list
+
+    def train(self, observation, action, reward, next_observation, done, weight=None):
+        """one gradient step on a batch, returns the td errors for ReplayBuffer.update_priorities"""
+        n = len(action)
+        rows = np.arange(n)
+        x = observation.reshape(n, OBSERVATION_SIZE) / OBSERVATION_SCALE
+        next_x = next_observation.reshape(n, OBSERVATION_SIZE) / OBSERVATION_SCALE
+        activation_list = self._forward(x, self.weights, self.biases)
+        q = activation_list[-1]
+        # the online network picks the next action, the target network values it
+        next_action = self._forward(next_x, self.weights, self.biases)[-1].argmax(axis=1)
+        next_q = self._forward(next_x, self.targetWeights, self.targetBiases)[-1][rows, next_action]
+        target = reward + self.gamma * np.where(done, 0.0, next_q)
+        td_error = q[rows, action] - target
+        gradient = np.zeros_like(q)
+        gradient[rows, action] = np.clip(td_error, -1.0, 1.0) * (1.0 if weight is None else weight) / n
+        weight_gradients, bias_gradients = [], []
+        for i in range(len(self.weights) - 1, -1, -1):
+            weight_gradients.append(activation_list[i].T @ gradient)
+            bias_gradients.append(gradient.sum(axis=0))
+            if i:
+                gradient = (gradient @ self.weights[i].T) * (activation_list[i] > 0)
+        self._adam(weight_gradients[::-1] + bias_gradients[::-1])
+        self.updates += 1
+        if self.updates % self.targetInterval == 0:
+            for target_array, array in zip(self.targetWeights + self.targetBiases, self.weights + self.biases):
+                target_array[:] = array
+        return td_error
+
+    def _adam(self, gradient_list, beta1=0.9, beta2=0.999, epsilon=1e-8):
+        t = self.updates + 1
+        step = self.learningRate * np.sqrt(1 - beta2 ** t) / (1 - beta1 ** t)
+        for array, gradient, moment, velocity in zip(self.weights + self.biases, gradient_list, self.moment,
+                                                      self.velocity):
+            moment *= beta1
+            moment += (1 - beta1) * gradient
+            velocity *= beta2
+            velocity += (1 - beta2) * gradient * gradient
+            array -= (step * moment / (np.sqrt(velocity) + epsilon)).astype(np.float32)
+
+    def get_policy_weights(self):
+        """(weights, biases) for the raw observation"""
+        return [self.weights[0] / OBSERVATION_SCALE[:, None]] + self.weights[1:], self.biases
+
+
+def _actor(actor_index, ring_name, ring_capacity, board_name, layer_sizes, stop, epsilon, seed, env_kwargs):
+    """rollout process: runs LaneChangeEnv episodes epsilon-greedy on the latest published weights"""
+    ring = TransitionRing(ring_capacity, ring_name)
+    board = WeightBoard(layer_sizes, board_name)
+    env = LaneChangeEnv(label='actor_%d' % actor_index, seed=seed, **env_kwargs)
+    rng = np.random.default_rng(seed)
+    policy = None
+    version = 0
+    try:
+        observation = env.reset()
+        previous = np.empty_like(observation)  # step() overwrites the observation in place
+        while not stop.is_set():
+            update = board.read(version)
+            if update is not None:
+                version, weights, biases = update
+                policy = PolicyEngine(weights, biases, max_batch=1)
+                ring.set_policy_version(version)
+            if policy is None or rng.random() < epsilon:
+                action = int(rng.integers(ACTION_NUMBER))
+            else:
+                action = int(policy.act(observation)[0])
+            previous[:] = observation
+            try:
+                observation, reward, done, info = env.step(action)
+            except FatalTraCIError:  # SUMO died, e.g. on a moveToXY far off the road, the transition is lost
+                env.close()
+                observation = env.reset()
+                continue
+            while not ring.push(previous, action, reward, observation, done):
+                if stop.is_set():
+                    return
+                time.sleep(POLL_INTERVAL)
+            if done:
+                observation = env.reset()
+    finally:
+        env.close()
+        ring.close()
+        board.close()
+
+
+class ActorLearner:
+    """n_actors rollout processes feeding a DQNLearner in this process through shared memory
+
+    Every actor owns a TransitionRing, train() drains all rings into a ReplayBuffer, runs the gradient
+    steps on large sampled batches and publishes the weights on the WeightBoard every publish_interval
+    updates. Actor i explores with epsilon ** (1 + 7 i / (n_actors - 1)), from epsilon down to about
+    epsilon ** 8, so the actors cover both exploration and the greedy policy.
+    """
+    def __init__(self, n_actors, learner=None, ring_capacity=4096, replay_capacity=100000, batch_size=256,
+                 min_replay=2000, publish_interval=20, epsilon=0.4, seed=0, sumo_binary='sumo',
+                 config_file='data/motorway.sumocfg', net_file='data/motorway.net.xml', **env_kwargs):
+        self.nActors = n_actors
+        self.learner = DQNLearner(seed=seed) if learner is None else learner
+        self.replayBuffer = ReplayBuffer(replay_capacity, seed=seed)
+        self.batchSize = batch_size
+        self.minReplay = min_replay  # transitions collected before the first update
+        self.publishInterval = publish_interval
+        self.received = 0
+        RoadNetwork(net_file)  # compile the cache once before the actors race for it
+        self.board = WeightBoard(self.learner.layerSizes)
+        self.board.publish(*self.learner.get_policy_weights())
+        self.ringList = [TransitionRing(ring_capacity) for i in range(n_actors)]
+        context = mp.get_context('spawn')
+        self.stop = context.Event()
+        env_kwargs.setdefault('regenerate_traffic', False)  # actors must not rewrite the shared route file
+        env_kwargs.update(sumo_binary=sumo_binary, config_file=config_file, net_file=net_file)
+        self.processes = []
+        for actor_index, ring in enumerate(self.ringList):
+            actor_epsilon = epsilon ** (1 + 7.0 * actor_index / max(n_actors - 1, 1))
+            process = context.Process(target=_actor, args=(actor_index, ring.name, ring_capacity, self.board.name,
+                                                           self.learner.layerSizes, self.stop, actor_epsilon,
+                                                           seed + 1000 * actor_index, env_kwargs), daemon=True)
+            process.start()
+            self.processes.append(process)
+
+    def collect(self):
+        """move the waiting transitions of every ring into the replay buffer, returns their number"""
+        n = 0
+        for ring in self.ringList:
+            n += ring.consume(self.replayBuffer.add_batch)
+        self.received += n
+        return n
+
+    def train(self, updates):
+        """run updates gradient steps, collecting in between, returns the published version"""
+        done_updates = 0
+        while done_updates < updates:
+            if not self.collect() and len(self.replayBuffer) < self.minReplay:
+                time.sleep(POLL_INTERVAL)
+            if not all(process.is_alive() for process in self.processes):
+                raise RuntimeError("an actor process died")
+            if len(self.replayBuffer) < self.minReplay:
+                continue
+            observation, action, reward, next_observation, done, weight, rows = \
+                self.replayBuffer.sample(self.batchSize)
+            td_error = self.learner.train(observation, action, reward, next_observation, done, weight)
+            self.replayBuffer.update_priorities(rows, td_error)
+            done_updates += 1
+            if self.learner.updates % self.publishInterval == 0:
+                self.board.publish(*self.learner.get_policy_weights())
+        return self.board.get_version()
+
+    def get_policy_lag(self):
+        """versions the weights of each actor are behind the published ones"""
+        version = self.board.get_version()
+        return [version - ring.get_policy_version() for ring in self.ringList]
+
+    def save(self, path):
+        save_weights(path, *self.learner.get_policy_weights())
+
+    def close(self):
+        self.stop.set()
+        for process in self.processes:
+            process.join()
+        for shared in self.ringList + [self.board]:
+            shared.close()
+            shared.unlink()
+
+
+def get_options():
+    optParser = optparse.OptionParser()
+    optParser.add_option("--actors", type="int", default=max(mp.cpu_count() - 1, 1), help="number of SUMO actors")
+    optParser.add_option("--updates", type="int", default=2000, help="number of gradient steps")
+    optParser.add_option("--batch-size", type="int", default=256, dest="batch_size")
+    optParser.add_option("--save", metavar="PATH", help="write the trained weights to PATH (.npz)")
+    options, args = optParser.parse_args()
+    return options
+
+
+if __name__ == "__main__":
+    options = get_options()
+    traffics = Traffic(trafficBase=0.4, trafficList=None)
+    trainer = ActorLearner(options.actors, batch_size=options.batch_size)
+    start = time.time()
+    try:
+        version = trainer.train(options.updates)
+        elapsed = time.time() - start
+        print("%d actors: %d transitions, %d updates in %.1f s (%.0f transitions/s, %.1f updates/s), "
+              "policy version %d, actor lag %s" % (options.actors, trainer.received, options.updates, elapsed,
+                                                   trainer.received / elapsed, options.updates / elapsed, version,
+                                                   trainer.get_policy_lag()))
+        if options.save:
+            trainer.save(options.save)
+    finally:
+        trainer.close()
@@ -0,0 +1,465 @@
+# coding:utf-8
+import os
+import sys
+import gc
+import gzip
+import json
+import time
+import shutil
+import optparse
+import tempfile
+import tracemalloc
+import numpy as np
+
+# we need to import python modules from the $SUMO_HOME/tools directory
+if 'SUMO_HOME' in os.environ:
+    tools = os.path.join(os.environ['SUMO_HOME'], 'tools')
+    sys.path.append(tools)
+else:
+    sys.exit("please declare environment variable 'SUMO_HOME'")
+
+import traci  # noqa
+import traci.constants as tc
+from egoVehicle import EgoVehicle
+from egoFleet import EgoFleet
+from trajectoryPlanner import CandidatePlanner
+from safetyFilter import SafetyFilter
+from policyEngine import PolicyEngine, OBSERVATION_SIZE
+from RL_brain import DataProcess
+from roadNetwork import RoadNetwork
+from kinematicSim import KinematicSimulation
+
+NET_FILE = 'data/motorway.net.xml'
+BENCH_DIR = 'data/bench'
+BASELINE_FILE = os.path.join(BENCH_DIR, 'baseline.json')
+STEP_LENGTH = 0.01  # of the recorded fixtures
+STEP_BUDGET_NS = 10 * 1000 * 1000  # the control loop runs at 100 Hz
+THRESHOLDS = {'ns_per_step': 1.3, 'peak_bytes_per_step': 1.5}  # allowed ratio to the baseline
+NS_FLOOR = 5000.0
+BYTES_FLOOR = 256.0
+EGO_START_STEP = 1001
+FIXTURE_STEPS = 200
+SETTLE_STEPS = 300  # driven before recording
+FLEET_SIZE = 64  # egos of the fleet benchmarks, all of them replay the fixture ego
+POLICY_LAYERS = (64, 64)  # hidden layers of the random policy
+# flows per density, (from, to, vtype, vehicles per second)
+DENSITIES = {
+    'light': [('gneE0', 'gneE7', 'pkw_f', 0.3), ('Zadao1', 'gneE8', 'pkw_m', 0.1)],
+    'medium': [('gneE0', 'gneE7', 'pkw_f', 0.5), ('gneE0', 'gneE7', 'pkw_m', 0.3), ('Zadao1', 'gneE8', 'pkw_m', 0.1)],
+    'jam': [('gneE0', 'gneE7', 'pkw_f', 1.0), ('gneE0', 'gneE7', 'pkw_m', 1.0), ('gneE0', 'gneE7', 'truck', 0.3),
+            ('Zadao1', 'gneE8', 'pkw_m', 0.3)],
+}
+
+
+def _write_scenario(directory, density, seed):
+    route_file = os.path.join(directory, 'bench.rou.xml')
+    with open(route_file, 'w') as routes:
+        print("""<routes>
+    <vType id="pkw_f" accel="0.8" decel="4.5" sigma="0" length="5" minGap="2.5" maxSpeed="25"/>
+    <vType id="pkw_m" accel="0.8" decel="4.5" sigma="0" length="5" minGap="2.5" maxSpeed="20"/>
+    <vType id="truck" accel="0.5" decel="4.5" sigma="0" length="12" minGap="2.5" maxSpeed="8"/>
+    <vType id="pkw_special" accel="0.8" decel="4.5" sigma="0" length="5" minGap="2.5" maxSpeed="0.000001"/>
+    <route id="route_ego" edges="gneE0 gneE1 gneE2 gneE3 gneE4 gneE5 gneE6 gneE7"/>""", file=routes)
+        for i, (start, end, vtype, rate) in enumerate(DENSITIES[density]):
+            print('    <flow id="f%d" type="%s" from="%s" to="%s" begin="0" end="3600" probability="%f" '
+                  'departLane="free" departSpeed="max"/>' % (i, vtype, start, end, rate), file=routes)
+        print('    <vehicle id="ego" type="pkw_special" route="route_ego" departLane="1" depart="10"/>', file=routes)
+        print("</routes>", file=routes)
+    config_file = os.path.join(directory, 'bench.sumocfg')
+    with open(config_file, 'w') as config:
+        print("""<configuration>
+    <input><net-file value="%s"/><route-files value="%s"/></input>
+    <time><begin value="0"/><step-length value="%s"/></time>
+    <processing><lateral-resolution value="1.6"/></processing>
+    <random_number><seed value="%d"/></random_number>
+</configuration>""" % (os.path.abspath(NET_FILE), route_file, STEP_LENGTH, seed), file=config)
+    return config_file
+
+
+def _encode(values):
+    return dict((str(variable), value) for variable, value in values.items())
+
+
+def _decode(values):
+    result = {}
+    for variable, value in values.items():
+        variable = int(variable)
+        result[variable] = tuple(value) if isinstance(value, list) else value
+    return result
+
+
+def record_fixture(density, path, sumo=False, seed=1, steps=FIXTURE_STEPS):
+    """drive the ego through a generated scenario and save what its subscriptions delivered"""
+    directory = tempfile.mkdtemp()
+    try:
+        config_file = _write_scenario(directory, density, seed)
+        if sumo:
+            traci.start(['sumo', '-c', config_file, '--no-step-log', '--no-warnings'], label='bench')
+            connection = traci.getConnection('bench')
+        else:
+            connection = KinematicSimulation.from_config(config_file, seed=seed)
+        network = RoadNetwork(NET_FILE)
+        for i in range(EGO_START_STEP):
+            connection.simulationStep()
+        while 'ego' not in connection.vehicle.getIDList():  # the ego departs late when the entry is jammed
+            connection.simulationStep()
+        ego = EgoVehicle('ego', network=network, connection=connection)
+        step_list = []
+        for i in range(SETTLE_STEPS + steps):
+            connection.simulationStep()
+            ego.fresh_data()
+            if i > 0 and len(ego.missionList) == 0:  # the first speed estimate starts from x = 0
+                ego.lane_keep_plan()
+            ego.drive()
+            if i < SETTLE_STEPS:
+                continue
+            step_list.append({'ego': _encode(ego.egoData.get_data()),
+                              'context': dict((name, _encode(values))
+                                              for name, values in ego.egoData.get_context().items())})
+        connection.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with gzip.open(path, 'wt') as f:
+        json.dump({'density': density, 'source': 'sumo' if sumo else 'kinematic', 'seed': seed,
+                   'steps': step_list}, f)
+
+
+def load_fixture(path):
+    with gzip.open(path, 'rt') as f:
+        fixture = json.load(f)
+    return [(_decode(step['ego']), dict((name, _decode(values)) for name, values in step['context'].items()))
+            for step in fixture['steps']]
+
+
+class FixtureConnection:
+    """stands in for traci and replays the subscription results of a fixture, one step per advance()"""
+    def __init__(self, step_list, network, ego_id='ego', step_length=STEP_LENGTH):
+        self.stepList = step_list
+        self.network = network
+        self.egoId = ego_id
+        self.egoIds = {ego_id}  # ids answered with the ego results
+        self.index = -1
+        self.vehicle = _FixtureVehicle(self)
+        self.simulation = _FixtureSimulation(step_length)
+        self.edge = _FixtureEdge(network)
+        self.lane = _FixtureLane(network)
+
+    def advance(self):  # the fixture is replayed in a loop
+        self.index = (self.index + 1) % len(self.stepList)
+
+    def get_results(self, vehicle_id):
+        ego, context = self.stepList[self.index]
+        return ego if vehicle_id in self.egoIds else context.get(vehicle_id, {})
+
+    def get_context(self):
+        return self.stepList[self.index][1]
+
+
+class _FixtureVehicle:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def subscribe(self, vehicle_id, variables):
+        pass
+
+    def subscribeContext(self, vehicle_id, domain, dist, variables):
+        pass
+
+    def moveToXY(self, *args, **kwargs):
+        pass
+
+    def getSubscriptionResults(self, vehicle_id):
+        return self.connection.get_results(vehicle_id)
+
+    def getContextSubscriptionResults(self, vehicle_id):
+        return self.connection.get_context()
+
+    def getPosition(self, vehicle_id):
+        return self.connection.get_results(vehicle_id).get(tc.VAR_POSITION, (0.0, 0.0))
+
+
+class _FixtureSimulation:
+    def __init__(self, step_length):
+        self.stepLength = step_length
+
+    def getDeltaT(self):
+        return self.stepLength
+
+
+class _FixtureEdge:
+    def __init__(self, network):
+        self.network = network
+
+    def getIDList(self):
+        return self.network.get_edge_id_list()
+
+    def getLaneNumber(self, edge_id):
+        return self.network.get_lane_number(edge_id)
+
+
+class _FixtureLane:
+    def __init__(self, network):
+        self.network = network
+
+    def getLength(self, lane_id):
+        return self.network.get_lane_length(lane_id)
+
+    def getMaxSpeed(self, lane_id):
+        return self.network.get_lane_max_speed(lane_id)
+
+
+# every benchmark returns (prepare, run), prepare() is called untimed before each timed run()
+def bench_fresh_data(connection, network):
+    ego = EgoVehicle('ego', network=network, connection=connection)
+    return connection.advance, ego.fresh_data
+
+
+def bench_fresh_data_multirate(connection, network):  # perception on every 5th step, extrapolated in between
+    ego = EgoVehicle('ego', network=network, connection=connection, perception_interval=5 * STEP_LENGTH)
+    return connection.advance, ego.fresh_data
+
+
+def bench_drive(connection, network):
+    ego = EgoVehicle('ego', network=network, connection=connection)
+
+    def prepare():
+        connection.advance()
+        ego.fresh_data()
+        if len(ego.missionList) == 0:
+            ego.lane_keep_plan()
+    return prepare, ego.drive
+
+
+def bench_classify(connection, network):
+    ego = EgoVehicle('ego', network=network, connection=connection)
+    surroundings = ego.surroundings
+
+    def prepare():
+        connection.advance()
+        ego.egoData.fresh()
+        surroundings.get_surroundings()
+        surroundings.get_neighbor_list()
+        surroundings.get_lane_index()
+    return prepare, surroundings._classify
+
+
+def bench_leading_following(connection, network):
+    ego = EgoVehicle('ego', network=network, connection=connection)
+
+    def prepare():
+        connection.advance()
+        ego.fresh_data()
+
+    def run():
+        ego._set_leading_vehicle()
+        ego._set_following_vehicle()
+    return prepare, run
+
+
+def bench_data_process(connection, network):
+    ego = EgoVehicle('ego', network=network, connection=connection)
+    data_process = DataProcess()
+
+    def prepare():
+        connection.advance()
+        ego.fresh_data()
+        data_process.set_surrounding_data(ego.surroundings, ego.get_speed())
+    return prepare, data_process.vehicle_surrounding_data_process
+
+
+def bench_set_surrounding_data(connection, network):
+    ego = EgoVehicle('ego', network=network, connection=connection)
+    data_process = DataProcess()
+
+    def prepare():
+        connection.advance()
+        ego.fresh_data()
+
+    def run():
+        data_process.set_surrounding_data(ego.surroundings, ego.get_speed())
+    return prepare, run
+
+
+def bench_candidate_plan(connection, network):
+    ego = EgoVehicle('ego', network=network, connection=connection)
+    planner = CandidatePlanner(budget=float('inf'))  # every candidate, the budget would hide regressions
+
+    def prepare():
+        connection.advance()
+        ego.fresh_data()
+
+    def run():
+        planner.plan(ego)
+    return prepare, run
+
+
+def bench_safety_filter(connection, network):
+    ego = EgoVehicle('ego', network=network, connection=connection, safety_filter=SafetyFilter())
+
+    def prepare():
+        connection.advance()
+        ego.fresh_data()
+
+    def run():
+        ego.safetyFilter.filter(ego, ego.vxCtl, 0.0)  # the lateral checks only run during a lane change
+    return prepare, run
+
+
+def bench_policy_decide(connection, network):  # observation and forward pass of a random 4 action MLP
+    rng = np.random.default_rng(0)
+    sizes = (OBSERVATION_SIZE,) + POLICY_LAYERS + (4,)
+    weights = [rng.normal(0.0, size ** -0.5, (size, next_size)) for size, next_size in zip(sizes, sizes[1:])]
+    policy = PolicyEngine(weights, [np.zeros(size) for size in sizes[1:]])
+    ego = EgoVehicle('ego', network=network, connection=connection)
+
+    def prepare():
+        connection.advance()
+        ego.fresh_data()
+
+    def run():
+        policy.decide(ego)
+    return prepare, run
+
+
+def bench_fleet_drive(connection, network):
+    connection.egoIds.update('ego%d' % i for i in range(1, FLEET_SIZE))
+    fleet = EgoFleet(network=network, connection=connection)
+    for i in range(FLEET_SIZE):
+        fleet.add('ego%d' % i if i else 'ego')
+
+    def prepare():
+        connection.advance()
+        fleet.fresh_data()
+        fleet.lane_keep_plan()  # the egos without a mission
+    return prepare, fleet.drive
+
+
+BENCHMARKS = {
+    'fresh_data': bench_fresh_data,
+    'fresh_data_multirate': bench_fresh_data_multirate,
+    'drive': bench_drive,
+    'classify': bench_classify,
+    'leading_following': bench_leading_following,
+    'data_process': bench_data_process,
+    'set_surrounding_data': bench_set_surrounding_data,
+    'candidate_plan': bench_candidate_plan,
+    'safety_filter': bench_safety_filter,
+    'policy_decide': bench_policy_decide,
+    'fleet_drive': bench_fleet_drive,
+}
+
+
+def measure(benchmark, step_list, network, repeat=10):
+    connection = FixtureConnection(step_list, network)
+    prepare, run = BENCHMARKS[benchmark](connection, network)
+    n = len(step_list)
+    perf_counter_ns = time.perf_counter_ns
+    for i in range(n):  # warm-up, fills the lazy caches
+        prepare()
+        run()
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        means = []
+        samples = []
+        for r in range(repeat):
+            total = 0
+            for i in range(n):
+                prepare()
+                start = perf_counter_ns()
+                run()
+                ns = perf_counter_ns() - start
+                total += ns
+                samples.append(ns)
+            means.append(total / n)
+        # allocations are measured in a separate pass, tracing slows every allocation down
+        tracemalloc.start()
+        peak = 0
+        blocks = 0
+        for i in range(n):
+            prepare()
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            before_blocks = sys.getallocatedblocks()
+            run()
+            blocks += sys.getallocatedblocks() - before_blocks
+            peak += tracemalloc.get_traced_memory()[1] - before
+        tracemalloc.stop()
+    finally:
+        if gc_enabled:
+            gc.enable()
+    samples.sort()
+    return {'ns_per_step': min(means), 'p99_ns': samples[int(0.99 * (len(samples) - 1))],
+            'peak_bytes_per_step': peak / n, 'net_blocks_per_step': blocks / n,
+            'budget_fraction': min(means) / STEP_BUDGET_NS, 'steps': n}
+
+
+def compare(results, baseline):
+    """names of the results that exceed their baseline by more than the thresholds"""
+    thresholds = baseline.get('thresholds', THRESHOLDS)
+    regressions = []
+    for name, result in results.items():
+        reference = baseline['results'].get(name)
+        if reference is None:
+            continue
+        for metric, ratio in thresholds.items():
+            # tiny values are mostly noise and far below the step budget, they are compared against a floor
+            floor = NS_FLOOR if metric == 'ns_per_step' else BYTES_FLOOR
+            if result[metric] > max(reference[metric], floor) * ratio:
+                regressions.append('%s %s: %.0f > %.0f x %.2f' % (name, metric, result[metric], reference[metric],
+                                                                 ratio))
+    return regressions
+
+
+def fixture_path(density):
+    return os.path.join(BENCH_DIR, density + '.json.gz')
+
+
+def get_options():
+    optParser = optparse.OptionParser()
+    optParser.add_option("--record", action="store_true", default=False,
+                         help="record the fixtures again instead of benchmarking")
+    optParser.add_option("--sumo", action="store_true", default=False,
+                         help="record the fixtures with sumo instead of the kinematic stand-in")
+    optParser.add_option("--update-baseline", action="store_true", default=False,
+                         help="write the results as the new baseline")
+    optParser.add_option("--density", default=','.join(DENSITIES), help="comma separated densities")
+    optParser.add_option("--benchmark", default=','.join(BENCHMARKS), help="comma separated benchmarks")
+    optParser.add_option("--repeat", type="int", default=10, help="timed passes over each fixture")
+    options, args = optParser.parse_args()
+    return options
+
+
+if __name__ == "__main__":
+    options = get_options()
+    densities = options.density.split(',')
+    if options.record:
+        for density in densities:
+            record_fixture(density, fixture_path(density), sumo=options.sumo)
+            print("recorded %s" % fixture_path(density))
+        sys.exit(0)
+
+    network = RoadNetwork(NET_FILE)
+    results = {}
+    print("%-32s %12s %10s %12s %10s %8s" % ('benchmark', 'ns/step', 'p99 ns', 'peak B/step', 'blocks', 'budget'))
+    for density in densities:
+        step_list = load_fixture(fixture_path(density))
+        for benchmark in options.benchmark.split(','):
+            name = '%s/%s' % (benchmark, density)
+            result = results[name] = measure(benchmark, step_list, network, options.repeat)
+            print("%-32s %12.0f %10d %12.0f %10.2f %7.3f%%" % (name, result['ns_per_step'], result['p99_ns'],
+                                                             result['peak_bytes_per_step'],
+                                                             result['net_blocks_per_step'],
+                                                             100 * result['budget_fraction']))
+    if options.update_baseline:
+        with open(BASELINE_FILE, 'w') as f:
+            json.dump({'thresholds': THRESHOLDS, 'python': sys.version.split()[0], 'results': results}, f, indent=1,
+                      sort_keys=True)
+        print("baseline written to %s" % BASELINE_FILE)
+    elif os.path.isfile(BASELINE_FILE):
+        with open(BASELINE_FILE) as f:
+            regressions = compare(results, json.load(f))
+        for regression in regressions:
+            print("REGRESSION " + regression)
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,89 @@
+# coding:utf-8
+import traci
+import traci.constants as tc
+
+EGO_VARIABLES = (tc.VAR_POSITION, tc.VAR_SPEED, tc.VAR_ROAD_ID, tc.VAR_LANE_INDEX, tc.VAR_EDGES)
+TRACKED_VARIABLES = (tc.VAR_POSITION, tc.VAR_SPEED, tc.VAR_LANE_INDEX)  # of the gap vehicles
+# what the getters return before the vehicle was seen in the simulation
+EGO_DEFAULTS = {tc.VAR_POSITION: (0.0, 0.0), tc.VAR_SPEED: 0.0, tc.VAR_ROAD_ID: '', tc.VAR_LANE_INDEX: -1,
+                tc.VAR_EDGES: ()}
+
+
+class EgoData:
+    """everything EgoVehicle and Surrounding read about the ego, taken from the subscription results
+
+    Subscription results arrive with simulationStep, so fresh() does not cost a TraCI round-trip.
+    Static lane data comes from the compiled RoadNetwork, or from traci once per edge without one.
+    traci returns {} for a vehicle that has left the simulation, the getters then keep the values of
+    the last step the vehicle was in it, is_present() tells the two apart.
+    Vehicles subscribed with track() (the gap vehicles of a lane change) are read and recorded with the ego.
+    """
+    def __init__(self, vehicle_id, network=None, connection=None, recorder=None):
+        self.id = vehicle_id
+        self.network = network
+        self.connection = traci if connection is None else connection
+        self.recorder = recorder  # TraceRecorder that keeps the results of every step
+        self.data = None
+        self.lastData = EGO_DEFAULTS  # results of the last step the vehicle was in the simulation
+        self.context = None
+        self.trackedDict = {}  # vehicle -> its own subscription results, of the tracked vehicles
+        self.laneNumberDict = {}  # edge -> lane number, filled on first use when there is no network
+
+    def subscribe(self):
+        self.connection.vehicle.subscribe(self.id, EGO_VARIABLES)
+
+    def fresh(self):  # once per simulation step
+        self.data = self.connection.vehicle.getSubscriptionResults(self.id)
+        self.context = self.connection.vehicle.getContextSubscriptionResults(self.id)
+        for vehicle_id in self.trackedDict:
+            self.trackedDict[vehicle_id] = self.connection.vehicle.getSubscriptionResults(vehicle_id)
+        if self.recorder is not None:
+            self.recorder.record(self.data, self.context, self.trackedDict)
+        if self.data:
+            self.lastData = self.data
+
+    def track(self, vehicle_ids, variables=TRACKED_VARIABLES):
+        """subscribe vehicle_ids on their own, in place of the vehicles tracked before; the results of the
+        subscription are available at once and are recorded with the current step"""
+        self.trackedDict = {}
+        for vehicle_id in vehicle_ids:
+            self.connection.vehicle.subscribe(vehicle_id, variables)
+            self.trackedDict[vehicle_id] = self.connection.vehicle.getSubscriptionResults(vehicle_id)
+        if self.recorder is not None:
+            self.recorder.record_tracked(self.trackedDict)
+
+    def get_tracked(self, vehicle_id):
+        """the results of a tracked vehicle, {} once it has left the simulation and for untracked vehicles"""
+        return self.trackedDict.get(vehicle_id, {})
+
+    def get_data(self):
+        return self.data
+
+    def get_context(self):
+        return self.context
+
+    def is_present(self):
+        """whether the vehicle was in the simulation on the last fresh()"""
+        return bool(self.data)
+
+    def get_position(self):
+        return self.lastData[tc.VAR_POSITION]
+
+    def get_speed(self):
+        return self.lastData[tc.VAR_SPEED]
+
+    def get_road_id(self):
+        return self.lastData[tc.VAR_ROAD_ID]
+
+    def get_lane_index(self):
+        return self.lastData[tc.VAR_LANE_INDEX]
+
+    def get_route(self):
+        return self.lastData[tc.VAR_EDGES]
+
+    def get_lane_number(self, edge):
+        if self.network is not None:
+            return self.network.get_lane_number(edge)
+        if edge not in self.laneNumberDict:
+            self.laneNumberDict[edge] = self.connection.edge.getLaneNumber(edge)
+        return self.laneNumberDict[edge]
@@ -0,0 +1,426 @@
+# coding:utf-8
+import math
+import traci
+import traci.constants as tc
+import numpy as np
+from egoVehicle import LANE_WIDTH, RADAR_LIMIT
+from egoGroup import get_traci_connection, run_batched
+from egoData import TRACKED_VARIABLES
+
+# mission stage of an ego, the c_type (and m_type) of the first mission of EgoVehicle.missionList
+IDLE = 0
+PRE_CHANGE = 1  # lane_change_plan: reach the gap
+CHANGE = 2  # move into the target lane
+POST_CHANGE = 3  # match the speed of the gap front vehicle
+KEEP_STEP1 = 4  # lane_keep_plan: reach the safe distance to the leader
+KEEP_STEP2 = 5  # match the speed of the leader
+NEXT_STAGE = np.array([IDLE, CHANGE, POST_CHANGE, IDLE, KEEP_STEP2, IDLE], dtype=np.int8)
+MISSIONS_LEFT = np.array([0, 3, 2, 1, 2, 1], dtype=np.int16)  # len(missionList) per stage
+LEFT, MID, RIGHT = 0, 1, 2  # lane code of a gap, as lane_change_plan expects it
+VIRTUAL_SPEED = 120 / 3.6
+EGO_VARIABLES = (tc.VAR_POSITION, tc.VAR_SPEED, tc.VAR_ROAD_ID)
+CONTEXT_VARIABLES = (tc.VAR_LANE_INDEX, tc.VAR_POSITION, tc.VAR_SPEED, tc.VAR_ROAD_ID)
+
+# (column, dtype, initial value) of every ego, the EgoVehicle attribute of the same name unless noted
+FIELDS = (
+    ('x', float, 0.0), ('y', float, 0.0), ('preX', float, 0.0), ('preY', float, 0.0),
+    ('vx0', float, 0.0), ('vx', float, 0.0), ('vy', float, 0.0), ('yLane', float, 0.0),
+    ('edgeID', object, ''), ('nLane', int, 0), ('laneIndex', int, -1), ('preLaneIndex', int, -1),
+    ('goalLaneIndex', int, -1), ('state', np.int8, 0),
+    ('stage', np.int8, IDLE),
+    # axCtl, ayCtl, vxCtl, vyCtl of the current mission, nan where the mission holds None
+    ('missionAx', float, 0.0), ('missionAy', float, 0.0), ('missionVx', float, np.nan), ('missionVy', float, np.nan),
+    ('missionStart', int, 0),  # tick before which PRE_CHANGE does not complete, the startTick of a candidate plan
+    ('axCtl', float, 0.0), ('ayCtl', float, 0.0), ('vxCtl', float, 8.0), ('vyCtl', float, 0.0),
+    ('angleCtl', float, 90.0),
+    ('leaderName', object, 'virtual_l'), ('leaderVirtual', np.int8, 1), ('leaderX', float, 0.0),
+    ('leaderY', float, 0.0), ('leaderSpeed', float, VIRTUAL_SPEED),
+    ('followerName', object, 'virtual_f'), ('followerVirtual', np.int8, 1), ('followerX', float, 0.0),
+    ('followerY', float, 0.0), ('followerSpeed', float, VIRTUAL_SPEED),
+    ('gapFrontName', object, ''), ('gapFrontVirtual', np.int8, 1), ('gapFrontLane', np.int8, LEFT),
+    ('gapFrontX', float, 0.0), ('gapFrontY', float, 0.0), ('gapFrontSpeed', float, 0.0),
+    ('gapFrontRelativeX', float, 0.0),
+    ('gapRearName', object, ''), ('gapRearVirtual', np.int8, 1), ('gapRearLane', np.int8, LEFT),
+    ('gapRearX', float, 0.0), ('gapRearY', float, 0.0), ('gapRearSpeed', float, 0.0),
+)
+
+
+def _piecewise(conditions, values, default):
+    """the value of the first true condition per row, default where none is true
+
+    Filled back to front by masked assignment, np.select costs several times more on a few
+    dozen rows.
+    """
+    result = np.full(np.shape(conditions[0]), default)
+    for condition, value in zip(conditions[::-1], values[::-1]):
+        result[condition] = value
+    return result
+
+
+def pre_change_ax(mean_x):
+    """acceleration towards the gap, from the mean relative position of the gap vehicles"""
+    return _piecewise([(-200 <= mean_x) & (mean_x < -120), (-120 <= mean_x) & (mean_x < -50),
+                      (-50 <= mean_x) & (mean_x < 0), (0 <= mean_x) & (mean_x < 50), (50 <= mean_x) & (mean_x < 120)],
+                     [-8.0, -4.0, -2.0, 2.0, 4.0], 8.0)
+
+
+def post_change_ax(distance, relative_speed):
+    faster = relative_speed > 0
+    slower = relative_speed < 0
+    return _piecewise([faster & (distance > 100), faster & (50 <= distance) & (distance < 100),
+                      faster & (distance >= 0), faster,
+                      slower & (distance > 100), slower & (50 <= distance) & (distance < 100),
+                      slower & (distance >= 0), slower],
+                     [8.0, 4.0, 2.0, -8.0, -2.0, -4.0, -8.0, -6.0], 0.0)
+
+
+def lane_keep_step1_ax(distance, relative_speed, safe_distance):
+    faster = relative_speed > 0
+    slower = relative_speed < 0
+    return _piecewise([faster & (distance > safe_distance + 100),
+                      faster & (50 + safe_distance <= distance) & (distance < safe_distance + 100),
+                      faster & (safe_distance <= distance) & (distance < 50 + safe_distance),
+                      slower & (distance > safe_distance + 100),
+                      slower & (50 + safe_distance <= distance) & (distance < safe_distance + 100),
+                      slower & (safe_distance <= distance) & (distance < 50 + safe_distance * 3.6), slower],
+                     [8.0, 4.0, 2.0, 3.0, 1.0, -3.0, -8.0], 0.0)
+
+
+def lane_keep_step2_ax(relative_speed):
+    return _piecewise([relative_speed > 0.0, relative_speed < 0.0], [2.0, -2.0], 0.0)
+
+
+class EgoFleet:
+    """many ego vehicles as NumPy columns, their missions advance together
+
+    Each ego runs the missions of EgoVehicle (lane_change_plan, lane_keep_plan) with the same
+    completion checks and control laws, but the mission list is one stage column and every step
+    is a handful of masked array operations over all egos. Only reading the subscription results
+    and sending moveToXY stay one call per ego, the moveToXY commands go out with the next
+    simulationStep as in EgoGroup. The leader and follower of all egos are found in one pass over
+    the concatenated context subscriptions. A plan only starts on an ego without a mission.
+    """
+    def __init__(self, network=None, connection=None, time_step=None, capacity=64):
+        self.connection = traci if connection is None else connection
+        self.traciConnection = get_traci_connection(self.connection)
+        self.network = network
+        self.timeStep = self.connection.simulation.getDeltaT() if time_step is None else time_step
+        if network is not None:
+            self.laneNumberDict = network.get_lane_number_dict()
+        else:
+            self.laneNumberDict = dict((edge, self.connection.edge.getLaneNumber(edge))
+                                       for edge in self.connection.edge.getIDList())
+        self.tick = 0  # fresh_data calls, as EgoVehicle.tick
+        self.idList = []
+        self.rowDict = {}  # vehicle id -> row
+        self.size = 0
+        self.buffer = {}
+        self._allocate(capacity)
+
+    def _allocate(self, capacity):
+        for name, dtype, value in FIELDS:
+            column = np.full(capacity, value, dtype=dtype)
+            if name in self.buffer:
+                column[:self.size] = self.buffer[name][:self.size]
+            self.buffer[name] = column
+        self._bind()
+
+    def _bind(self):  # the columns are views of the first size rows of the buffer
+        for name, dtype, value in FIELDS:
+            setattr(self, name, self.buffer[name][:self.size])
+
+    def __len__(self):
+        return self.size
+
+    def get_ego_id_list(self):
+        return list(self.idList)
+
+    def get_row(self, vehicle_id):
+        return self.rowDict[vehicle_id]
+
+    def add(self, vehicle_id):
+        if self.size == len(self.buffer['x']):
+            self._allocate(2 * self.size)
+        row = self.size
+        for name, dtype, value in FIELDS:
+            self.buffer[name][row] = value
+        self.idList.append(vehicle_id)
+        self.rowDict[vehicle_id] = row
+        self.size += 1
+        self._bind()
+        self.connection.vehicle.subscribe(vehicle_id, EGO_VARIABLES)
+        self.connection.vehicle.subscribeContext(vehicle_id, tc.CMD_GET_VEHICLE_VARIABLE, RADAR_LIMIT,
+                                                 CONTEXT_VARIABLES)
+        return row
+
+    def remove(self, vehicle_id):  # the last row moves into the gap
+        row = self.rowDict.pop(vehicle_id)
+        last = self.size - 1
+        if row != last:
+            for name, dtype, value in FIELDS:
+                self.buffer[name][row] = self.buffer[name][last]
+            self.idList[row] = self.idList[last]
+            self.rowDict[self.idList[row]] = row
+        self.idList.pop()
+        self.size -= 1
+        self._bind()
+
+    def get_mission_count(self):
+        """len(missionList) of every ego"""
+        return MISSIONS_LEFT[self.stage]
+
+    def fresh_data(self):
+        """read the subscriptions of all egos and perceive, egos that have left are removed and returned"""
+        vehicle = self.connection.vehicle
+        data_list = [vehicle.getSubscriptionResults(vehicle_id) for vehicle_id in self.idList]
+        arrived = [vehicle_id for vehicle_id, data in zip(self.idList, data_list) if not data]
+        if arrived:
+            for vehicle_id in arrived:
+                self.remove(vehicle_id)
+            data_list = [vehicle.getSubscriptionResults(vehicle_id) for vehicle_id in self.idList]
+        if self.size == 0:
+            return arrived
+        self.tick += 1
+        self._set_state(data_list)
+        self._set_leading_following()
+        self._track_gaps()
+        return arrived
+
+    def _set_state(self, data_list):  # EgoVehicle._set_xy ... _set_n_lane
+        position = np.array([data[tc.VAR_POSITION] for data in data_list], dtype=float)
+        self.preX[:] = self.x
+        self.preY[:] = self.y
+        self.x[:] = position[:, 0]
+        self.y[:] = position[:, 1]
+        on_road = self.x > 0
+        if on_road.all():
+            on_road = slice(None)
+        x, y = self.x[on_road], self.y[on_road]
+        vx = (x - self.preX[on_road]) / self.timeStep
+        vy = (y - self.preY[on_road]) / self.timeStep
+        self.vx[on_road] = vx
+        self.vy[on_road] = vy
+        self.vx0[on_road] = np.fromiter((data[tc.VAR_SPEED] for data in data_list), float, self.size)[on_road]
+        # the lane index is taken with the lane number of the previous step, as EgoVehicle does
+        n_lane = self.nLane[on_road]
+        lane_index = n_lane - np.ceil(-y / LANE_WIDTH).astype(int)
+        self.laneIndex[on_road] = lane_index
+        self.yLane[on_road] = y - (- n_lane + lane_index + 0.5) * LANE_WIDTH
+        moving = vx != 0
+        self.angleCtl[on_road] = np.where(moving, 90 - np.arctan(np.divide(vy, vx, where=moving,
+                                                                           out=np.zeros_like(vy))) / math.pi * 180.0,
+                                          90)
+        edge_list = [data[tc.VAR_ROAD_ID] for data in data_list]
+        self.edgeID[on_road] = np.array(edge_list, dtype=object)[on_road]
+        self.nLane[on_road] = np.fromiter((self.laneNumberDict[edge] for edge in self.edgeID[on_road]), int,
+                                          len(x))
+
+    def _set_leading_following(self):
+        """nearest vehicle ahead and behind in the ego lane, from all context subscriptions at once"""
+        vehicle = self.connection.vehicle
+        context_list = [vehicle.getContextSubscriptionResults(vehicle_id) or {} for vehicle_id in self.idList]
+        counts = np.fromiter((len(context) for context in context_list), int, self.size)
+        values = [value for context in context_list for value in context.values()]
+        names = np.array([name for context in context_list for name in context], dtype=object)
+        owner = np.repeat(np.arange(self.size), counts)
+        position = np.array([value[tc.VAR_POSITION] for value in values], dtype=float).reshape(-1, 2)
+        speed = np.fromiter((value[tc.VAR_SPEED] for value in values), float, len(values))
+        lane_key = np.fromiter((self.laneNumberDict[value[tc.VAR_ROAD_ID]] - value[tc.VAR_LANE_INDEX]
+                                for value in values), int, len(values))
+        relative_x = position[:, 0] - self.x[owner]
+        # lane counted from the left, the key of Surrounding
+        same_lane = lane_key == np.ceil(-self.y / LANE_WIDTH).astype(int)[owner]
+        starts = np.cumsum(counts) - counts
+        index = np.arange(len(values))
+        # ties keep the order of NeighborIndex, the first leader and the last follower of the context
+        leader = self._nearest(np.lexsort((index, np.where(same_lane & (relative_x > 0), position[:, 0], np.inf),
+                                           owner)), starts, counts, same_lane & (relative_x > 0))
+        follower = self._nearest(np.lexsort((-index, np.where(same_lane & (relative_x < 0), -position[:, 0], np.inf),
+                                             owner)), starts, counts, same_lane & (relative_x < 0))
+        for prefix, rows, offset in (('leader', leader, RADAR_LIMIT), ('follower', follower, -RADAR_LIMIT)):
+            real = rows >= 0
+            rows = rows[real]
+            getattr(self, prefix + 'Virtual')[:] = ~real
+            getattr(self, prefix + 'Name')[:] = 'virtual_l' if offset > 0 else 'virtual_f'
+            getattr(self, prefix + 'Name')[real] = names[rows]
+            getattr(self, prefix + 'X')[:] = self.x + offset
+            getattr(self, prefix + 'X')[real] = position[rows, 0]
+            getattr(self, prefix + 'Y')[:] = self.y
+            getattr(self, prefix + 'Y')[real] = position[rows, 1]
+            getattr(self, prefix + 'Speed')[:] = VIRTUAL_SPEED
+            getattr(self, prefix + 'Speed')[real] = speed[rows]
+
+    def _nearest(self, order, starts, counts, candidate):  # first context row of every ego in order, -1 if none
+        rows = np.full(self.size, -1)
+        has = counts > 0
+        first = order[starts[has]]
+        rows[has] = np.where(candidate[first], first, -1)
+        return rows
+
+    def _track_gaps(self):
+        """follow the gap vehicles of the running lane changes, as EgoVehicle.fresh_data does"""
+        rows = np.flatnonzero((self.state == 2) & (self.stage != IDLE))
+        if len(rows) == 0:
+            return
+        vehicle = self.connection.vehicle
+        x, y = self.x[rows], self.y[rows]
+        for prefix in ('gapFront', 'gapRear'):
+            name_list = getattr(self, prefix + 'Name')[rows]
+            real = getattr(self, prefix + 'Virtual')[rows] == 0
+            result_list = [vehicle.getSubscriptionResults(name) if is_real else None
+                           for name, is_real in zip(name_list, real)]
+            found = np.fromiter((bool(result) for result in result_list), bool, len(rows))
+            position = np.array([result[tc.VAR_POSITION] if result else (0.0, 0.0) for result in result_list],
+                                dtype=float).reshape(-1, 2)
+            speed = np.fromiter((result[tc.VAR_SPEED] if result else 0.0 for result in result_list), float, len(rows))
+            lane = getattr(self, prefix + 'Lane')[rows]
+            # only a vehicle seen beside the ego in the gap lane is taken over
+            seen = found & (((lane == LEFT) & (1.0 <= position[:, 1] - y) & (position[:, 1] - y <= 4.3)) |
+                            ((lane == RIGHT) & (1.0 <= y - position[:, 1]) & (y - position[:, 1] <= 4.3)))
+            mid = found & (lane == MID)  # a gap in the ego lane follows the leader and follower
+            gap_x = getattr(self, prefix + 'X')
+            # a gap vehicle that is not seen, or is virtual, is extrapolated at its last speed
+            unseen = rows[~seen & ~mid]
+            gap_x[unseen] += getattr(self, prefix + 'Speed')[unseen] * self.timeStep
+            source = 'leader' if prefix == 'gapFront' else 'follower'
+            for column, seen_value, mid_value in (('X', position[:, 0], getattr(self, source + 'X')[rows]),
+                                                  ('Y', position[:, 1], getattr(self, source + 'Y')[rows]),
+                                                  ('Speed', speed, getattr(self, source + 'Speed')[rows])):
+                target = getattr(self, prefix + column)
+                target[rows[seen]] = seen_value[seen]
+                target[rows[mid]] = mid_value[mid]
+        # EgoVehicle.fresh_data takes the relative position of the gap front vehicle from the gap rear vehicle
+        self.gapFrontRelativeX[rows] = self.gapRearX[rows] - x
+
+    def lane_change_plan(self, vehicle_id, gap_front_vehicle, gap_rear_vehicle, ax=None, duration=None):
+        """EgoVehicle.lane_change_plan for one ego, ax replaces the acceleration of pre_change_to_lane and the
+        lane change does not start before duration seconds, as in EgoVehicle.candidate_lane_change_plan"""
+        row = self.rowDict[vehicle_id]
+        if self.stage[row] != IDLE:
+            return False
+        relative_x_list = []
+        for prefix, gap_vehicle in (('gapFront', gap_front_vehicle), ('gapRear', gap_rear_vehicle)):
+            relative_x = gap_vehicle.get('relative_position_x')
+            if gap_vehicle['virtual'] == 0:
+                # like EgoData.track, the results of the subscription are available at once
+                self.connection.vehicle.subscribe(gap_vehicle['name'], TRACKED_VARIABLES)
+                tracked = self.connection.vehicle.getSubscriptionResults(gap_vehicle['name'])
+                relative_x = tracked[tc.VAR_POSITION][0] - self.x[row]
+            relative_x_list.append(relative_x)
+            getattr(self, prefix + 'Name')[row] = gap_vehicle['name']
+            getattr(self, prefix + 'Virtual')[row] = gap_vehicle['virtual']
+            getattr(self, prefix + 'Lane')[row] = gap_vehicle['lane_index']
+            getattr(self, prefix + 'X')[row] = gap_vehicle['position_x']
+            getattr(self, prefix + 'Y')[row] = gap_vehicle['position_y']
+            getattr(self, prefix + 'Speed')[row] = gap_vehicle['speed']
+        self.gapFrontRelativeX[row] = relative_x_list[0]
+        self._start(np.array([row]), PRE_CHANGE)
+        mean_x = 0.5 * (relative_x_list[1] + relative_x_list[0])
+        self.missionAx[row] = float(pre_change_ax(mean_x)) if ax is None else ax
+        if duration is not None:
+            self.missionStart[row] = self.tick + int(round(duration / self.timeStep))
+        self.goalLaneIndex[row] = self.laneIndex[row] + {LEFT: 1, MID: 0, RIGHT: -1}[gap_front_vehicle['lane_index']]
+        self.state[row] = 2
+        return True
+
+    def lane_keep_plan(self, vehicle_ids=None):
+        """EgoVehicle.lane_keep_plan for the given egos, all of them by default, returns the rows planned"""
+        if vehicle_ids is None:
+            rows = np.arange(self.size)
+        else:
+            rows = np.array([self.rowDict[vehicle_id] for vehicle_id in vehicle_ids], dtype=int)
+        rows = rows[self.stage[rows] == IDLE]
+        self._start(rows, KEEP_STEP1)
+        self.missionAx[rows] = lane_keep_step1_ax(self.leaderX[rows] - self.x[rows],
+                                                  self.leaderSpeed[rows] - self.vx[rows], self.leaderSpeed[rows] * 2.0)
+        self.state[rows] = 1
+        return rows
+
+    def _start(self, rows, stage):  # the next mission, as _form_mission(stage, stage, 0, 0, None, None)
+        self.stage[rows] = stage
+        self.missionAx[rows] = 0.0
+        self.missionAy[rows] = 0.0
+        self.missionVx[rows] = np.nan
+        self.missionVy[rows] = np.nan
+        self.missionStart[rows] = 0
+
+    def step(self):
+        """advance the missions and control laws of all egos, the moveToXY targets as (x, y, angle)"""
+        stage = self.stage.copy()
+        busy = stage != IDLE
+        x, vx = self.x, self.vx
+        leader_distance = self.leaderX - x
+        leader_relative_speed = self.leaderSpeed - vx
+        safe_distance = self.leaderSpeed * 2.0
+        # the completion checks of the first mission, only for the stages some ego is in
+        done = np.zeros(self.size, dtype=bool)
+        for check_stage in np.flatnonzero(np.bincount(stage, minlength=len(NEXT_STAGE))[1:]) + 1:
+            rows = np.flatnonzero(stage == check_stage)
+            done[rows] = self._complete(check_stage, rows, leader_distance[rows], leader_relative_speed[rows],
+                                        safe_distance[rows])
+        running = busy & ~done
+        # running missions, axCtl is read before lane_keep_step1 updates the mission
+        rows = np.flatnonzero(running)
+        if len(rows):
+            self.axCtl[rows] = self.missionAx[rows]
+            self.ayCtl[rows] = self.missionAy[rows]
+            keep = rows[stage[rows] == KEEP_STEP1]
+            self.missionAx[keep] = lane_keep_step1_ax(leader_distance[keep], leader_relative_speed[keep],
+                                                      safe_distance[keep])
+            s, v = stage[rows], vx[rows]
+            hold = (s == PRE_CHANGE) & (self.gapFrontRelativeX[rows] < 10) & (v < self.gapFrontSpeed[rows] * 0.7)
+            accelerated = self.vxCtl[rows] + self.timeStep * self.axCtl[rows]
+            free = np.where(hold, self.vxCtl[rows], np.where((s == KEEP_STEP1) & (v < 0), 0, accelerated))
+            mission_vx = self.missionVx[rows]
+            self.vxCtl[rows] = np.where(np.isnan(mission_vx), free, mission_vx + self.timeStep * self.axCtl[rows])
+            mission_vy = self.missionVy[rows]
+            base_vy = np.where(np.isnan(mission_vy), self.vyCtl[rows], mission_vy)
+            self.vyCtl[rows] = base_vy + self.timeStep * self.ayCtl[rows]
+        # completed missions hand over to the next one
+        rows = np.flatnonzero(done)
+        if len(rows):
+            s = stage[rows]
+            self.preLaneIndex[rows[s == CHANGE]] = self.laneIndex[rows[s == CHANGE]]
+            self._start(rows, NEXT_STAGE[s])
+            self.state[rows[NEXT_STAGE[s] == IDLE]] = 0
+            change = rows[s == PRE_CHANGE]  # change_to_lane
+            direction = np.sign(self.goalLaneIndex[change] - self.laneIndex[change])
+            self.missionVy[change] = np.where(direction != 0, direction * LANE_WIDTH /
+                                              (1.0 / 60.0 * np.abs(vx[change]) + 3), np.nan)
+            post = rows[s == CHANGE]  # post_change_to_lane
+            self.missionAx[post] = post_change_ax(self.gapFrontX[post] - x[post], self.gapFrontSpeed[post] - vx[post])
+            keep = rows[s == KEEP_STEP1]  # lane_keep_step2
+            self.missionAx[keep] = lane_keep_step2_ax(leader_relative_speed[keep])
+            self.vxCtl[rows] = vx[rows]
+            self.vyCtl[rows] = 0
+            self.axCtl[rows] = 0
+            self.ayCtl[rows] = 0
+        target_x = x + self.timeStep * self.vxCtl
+        target_y = np.where(busy, self.y + self.timeStep * self.vyCtl, self.y)
+        angle = np.where(busy, self.angleCtl, 90)
+        return target_x, target_y, angle
+
+    def _complete(self, stage, rows, leader_distance, leader_relative_speed, safe_distance):
+        x, vx = self.x[rows], self.vx[rows]
+        if stage == PRE_CHANGE:  # has_pre_change_to_lane_complete
+            return ((self.gapRearX[rows] + 10 < x) & (x < self.gapFrontX[rows] - 10) &
+                    (self.missionStart[rows] <= self.tick))
+        if stage == CHANGE:  # has_lane_change_complete
+            return (self.laneIndex[rows] == self.goalLaneIndex[rows]) & (np.abs(self.yLane[rows]) < 0.1)
+        if stage == POST_CHANGE:  # has_post_change_to_lane
+            front_speed = self.gapFrontSpeed[rows]
+            return (front_speed - 1.0 < vx) & (vx < front_speed + 1.0)
+        if stage == KEEP_STEP1:  # has_lane_keep_step1
+            return (safe_distance - 10.0 < leader_distance) & (leader_distance < safe_distance + 10.0)
+        return (-0.1 < leader_relative_speed) & (leader_relative_speed < 0.1)  # has_lane_keep_step2
+
+    def drive(self):
+        if self.size == 0:
+            return
+        target_x, target_y, angle = self.step()
+        run_batched(self.traciConnection, lambda: self._move(target_x.tolist(), target_y.tolist(), angle.tolist()))
+
+    def _move(self, target_x, target_y, angle):
+        move = self.connection.vehicle.moveToXY
+        for vehicle_id, x, y, a in zip(self.idList, target_x, target_y, angle):
+            move(vehicle_id, '', 2, x, y, a, 2)
@@ -0,0 +1,122 @@
+# coding:utf-8
+import traci
+import traci.constants as tc
+from egoVehicle import EgoVehicle
+
+
+class EgoGroup:
+    """several EgoVehicle in one simulation, each with its own missions
+
+    The subscription results of all egos arrive with the one simulationStep message. The moveToXY
+    commands of drive() are queued on the traci connection and go out together with the next
+    simulationStep instead of one round-trip per ego.
+    """
+    def __init__(self, network=None, columnar=False, connection=None, perception_interval=0.0, context_filter=None):
+        self.connection = traci if connection is None else connection
+        self.network = network
+        self.columnar = columnar
+        self.perceptionInterval = perception_interval
+        self.contextFilter = context_filter  # surrounding.ContextFilter shared by all egos
+        self.egoDict = {}  # vehicle id -> EgoVehicle, in the order they were added
+        self.traciConnection = get_traci_connection(self.connection)
+
+    def add(self, vehicle_id, recorder=None):
+        ego_vehicle = EgoVehicle(vehicle_id, network=self.network, columnar=self.columnar,
+                                 connection=self.connection, recorder=recorder,
+                                 perception_interval=self.perceptionInterval, context_filter=self.contextFilter)
+        self.egoDict[vehicle_id] = ego_vehicle
+        return ego_vehicle
+
+    def remove(self, vehicle_id):
+        return self.egoDict.pop(vehicle_id)
+
+    def get_ego(self, vehicle_id):
+        return self.egoDict[vehicle_id]
+
+    def get_ego_list(self):
+        return list(self.egoDict.values())
+
+    def __len__(self):
+        return len(self.egoDict)
+
+    def __iter__(self):
+        return iter(list(self.egoDict.values()))
+
+    def fresh_data(self):
+        """fresh_data() of every ego, egos that have left the simulation are removed and returned"""
+        arrived = []
+        for vehicle_id, ego_vehicle in list(self.egoDict.items()):
+            if not self.connection.vehicle.getSubscriptionResults(vehicle_id):
+                arrived.append(self.egoDict.pop(vehicle_id))
+                continue
+            ego_vehicle.fresh_data()
+        return arrived
+
+    def drive(self):
+        run_batched(self.traciConnection, self._drive_all)
+
+    def _drive_all(self):
+        for ego_vehicle in self.egoDict.values():
+            ego_vehicle.drive()
+
+
+BATCHED_TRACI_VERSION = (1, 28)  # traci release whose Connection internals run_batched was checked against
+SET_COMMANDS = frozenset(value for name, value in vars(tc).items() if name.startswith('CMD_SET_'))
+
+
+def get_traci_connection(connection):
+    """the socket connection whose sends can be held back, None where drive() has to send directly
+
+    Holding back shadows the private Connection._sendExact, so it is only done for the pinned traci
+    release and a connection that has the internals it relies on.
+    """
+    if connection is traci:
+        connection = traci.getConnection()
+    if not supports_batching(connection):
+        return None
+    return connection
+
+
+def supports_batching(connection):
+    version = tuple(int(part) for part in traci.__version__.split('.')[:2] if part.isdigit())
+    if version != BATCHED_TRACI_VERSION:
+        return False
+    return all(hasattr(connection, name) for name in ('_sendExact', '_sendCmd', '_queue', '_string'))
+
+
+def run_batched(traci_connection, func):
+    """func() with the sends of traci_connection held back, the commands it issues go out with the next
+    simulationStep
+
+    Only set commands (moveToXY, setSpeed, ...) may be issued by func(), their answers carry no
+    value. Any other command raises RuntimeError and is taken off the pending message again.
+    """
+    if traci_connection is None:
+        return func()
+    # while _sendExact is shadowed, traci only appends the commands to the pending message, the
+    # next command that really sends (simulationStep) carries them and checks all their answers
+    traci_connection._sendExact = _HoldBack(traci_connection)
+    try:
+        return func()
+    finally:
+        del traci_connection._sendExact
+
+
+class _HoldBack:
+    """stands in for Connection._sendExact, accepts set commands and rejects everything else"""
+    def __init__(self, traci_connection):
+        self.connection = traci_connection
+        self.queueLength = len(traci_connection._queue)
+        self.stringLength = len(traci_connection._string)
+
+    def __call__(self):
+        connection = self.connection
+        command = connection._queue[-1]
+        if command not in SET_COMMANDS:
+            # drop the command so the held back set commands still go out intact
+            del connection._queue[self.queueLength:]
+            connection._string = connection._string[:self.stringLength]
+            raise RuntimeError("command 0x%02x needs an answer and cannot be held back in run_batched" % command)
+        self.queueLength = len(connection._queue)
+        self.stringLength = len(connection._string)
+        return None
@@ -4,9 +4,16 @@ import math
 import traci
 import traci.constants as tc
 from surrounding import Surrounding
+from egoData import EgoData
 
 LANE_WIDTH = 3.2
 RADAR_LIMIT = 200
+# 换道决策的动作
+NO_ACTION = 0
+LANE_KEEP = 1
+CHANGE_LEFT = 2
+CHANGE_RIGHT = 3
+ACTION_NUMBER = 4
 
 
 class EgoVehicle:
@@ -14,10 +21,17 @@ class EgoVehicle:
     def _form_mission(m_type, c_type, ax, ay, vx, vy):
         return {'m_type': m_type, 'c_type': c_type, 'axCtl': ax, 'ayCtl': ay, 'vxCtl': vx, 'vyCtl': vy}
 
-    def __init__(self, vehicle_id):
+    def __init__(self, vehicle_id, network=None, columnar=False, connection=None, recorder=None, time_step=None,
+                 perception_interval=0.0, safety_filter=None, context_filter=None):
         self.id = vehicle_id
+        self.connection = traci if connection is None else connection  # traci模块或者带label的traci连接
+        self.network = network  # 编译好的路网缓存(RoadNetwork)，为None时通过traci查询
         self.data = None  # 从subscribe订阅的所有数据
-        self.surroundings = Surrounding("ego")
+        # 和Surrounding共用的订阅数据，recorder(TraceRecorder)不为None时记录每一步的订阅结果
+        self.egoData = EgoData(vehicle_id, network=network, connection=self.connection, recorder=recorder)
+        # context_filter(surrounding.ContextFilter)为None时订阅200m内所有车道的周车
+        self.surroundings = Surrounding(vehicle_id, network=network, columnar=columnar, connection=self.connection,
+                                        ego_data=self.egoData, context_filter=context_filter)
         self.neighbourVehicles = None
         self.preX = 0  # 之前的一个位置，用来估算纵向车速
         self.preY = 0  # 之前的一个位置，用来横向车速
@@ -37,7 +51,12 @@ class EgoVehicle:
         self.nNextLane = 0
         self.laneX = 0
         self.laneY = 0
-        self.timeStep = 0.01
+        # 控制周期，为None时取仿真的step-length
+        self.timeStep = self.connection.simulation.getDeltaT() if time_step is None else time_step
+        # 感知(周车分类、前后车、gap车跟踪)每perceptionPeriod个控制周期做一次，其间按匀速外推周车状态
+        self.perceptionPeriod = max(1, int(round(perception_interval / self.timeStep)))
+        self.tick = 0
+        self.safetyFilter = safety_filter  # safetyFilter.SafetyFilter，在moveToXY之前按TTC和车头时距限制控制量
         self.goalX = 0
         self.goalY = 0
         self.axCtl = 0
@@ -61,23 +80,35 @@ class EgoVehicle:
         self.state = 0
 
     def _subscribe_ego_vehicle(self):
-        traci.vehicle.subscribe(self.id, (tc.VAR_POSITION, tc.VAR_SPEED, tc.VAR_ROAD_ID))
+        self.egoData.subscribe()
         self.surroundings.surrounding_init()
 
     def fresh_data(self):
-        self.data = traci.vehicle.getSubscriptionResults(self.id)
-        self.surroundings.get_surroundings()
-        self.neighbourVehicles = self.surroundings.get_neighbor_list()
-
-        if self.data is not None:
-            self._set_xy()
-            if self.x > 0:
-                self._set_speed()
-                self._set_lane_index()
-                self._set_y_lane_lateral()
-                self._set_angle()
-                self._set_road_id()
-                self._set_n_lane()
+        self.egoData.fresh()
+        self.data = self.egoData.get_data()
+        if not self.data:  # 自车已经离开仿真(traci返回{})，保持上一步的状态
+            return
+        perceive = self.tick % self.perceptionPeriod == 0
+        self.tick += 1
+        if perceive:
+            self.surroundings.get_surroundings()
+            self.neighbourVehicles = self.surroundings.get_neighbor_list()
+
+        self._set_xy()
+        if self.x > 0:
+            self._set_speed()
+            self._set_lane_index()
+            self._set_y_lane_lateral()
+            self._set_angle()
+            self._set_road_id()
+            self._set_n_lane()
+
+        if perceive and self.tick > 1:  # 第一次的速度估计从x=0开始，不可用
+            self.surroundings.adapt_context(self.vx)
+
+        if not perceive:
+            self._extrapolate_neighbours()
+            return
 
         if self.neighbourVehicles is not None:
             self.neighbourVehicles = self.surroundings.get_neighbor_list()
@@ -100,8 +131,8 @@ class EgoVehicle:
             gap_front_vehicle_y = 0
             gap_front_vehicle_vx = 0
             if self.gapRearVehicle['virtual'] == 0:  # 如果不是虚拟车
-                gap_rear_vehicle = traci.vehicle.getSubscriptionResults(self.gapRearVehicle['name'])
-                if gap_rear_vehicle is not None:
+                gap_rear_vehicle = self.egoData.get_tracked(self.gapRearVehicle['name'])
+                if gap_rear_vehicle:
                     gap_rear_vehicle_x = gap_rear_vehicle[tc.VAR_POSITION][0]
                     gap_rear_vehicle_y = gap_rear_vehicle[tc.VAR_POSITION][1]
                     gap_rear_vehicle_vx = gap_rear_vehicle[tc.VAR_SPEED]
@@ -128,14 +159,14 @@ class EgoVehicle:
                 self.gapRearVehicle['position_x'] = gap_rear_vehicle_x
                 self.gapRearVehicle['position_y'] = gap_rear_vehicle_y
                 self.gapRearVehicle['speed'] = gap_rear_vehicle_vx
-            elif is_need_front_virtual == 1:
-                self.gapRearVehicle['position_x'] = self.gapRearVehicle['speed'] * self.timeStep
+            elif is_need_rear_virtual == 1:
+                self.gapRearVehicle['position_x'] += self.gapRearVehicle['speed'] * self.timeStep
             self.gapRearVehicle['relative_position_x'] = self.gapRearVehicle['position_x'] - self.x
             self.gapRearVehicle['relative_position_y'] = self.gapRearVehicle['position_y'] - self.x
 
             if self.gapFrontVehicle['virtual'] == 0:
-                gap_front_vehicle = traci.vehicle.getSubscriptionResults(self.gapFrontVehicle['name'])
-                if gap_front_vehicle is not None:
+                gap_front_vehicle = self.egoData.get_tracked(self.gapFrontVehicle['name'])
+                if gap_front_vehicle:
                     gap_front_vehicle_x = gap_front_vehicle[tc.VAR_POSITION][0]
                     gap_front_vehicle_y = gap_front_vehicle[tc.VAR_POSITION][1]
                     gap_front_vehicle_vx = gap_front_vehicle[tc.VAR_SPEED]
@@ -166,6 +197,25 @@ class EgoVehicle:
             self.gapFrontVehicle['relative_position_x'] = self.gapRearVehicle['position_x'] - self.x
             self.gapFrontVehicle['relative_position_y'] = self.gapRearVehicle['position_y'] - self.x
 
+    def _extrapolate_neighbours(self):
+        """两次感知之间按匀速外推周车列表、前后车和gap车。gap车先从上一步的副本外推，周车列表里的车在
+        surroundings里原地外推，前后车再按外推后的列表重新确定(虚拟前后车和感知时一样放在自车前后RADAR_LIMIT)"""
+        if self.state == 2 and len(self.missionList) != 0:
+            self.gapFrontVehicle = self._extrapolate(self.gapFrontVehicle)
+            self.gapRearVehicle = self._extrapolate(self.gapRearVehicle)
+        if self.neighbourVehicles is not None:
+            self.surroundings.extrapolate(self.x, self.y, self.timeStep)
+            self._set_leading_vehicle()
+            self._set_following_vehicle()
+
+    def _extrapolate(self, vehicle):
+        vehicle = dict(vehicle)  # gap车可能就是周车列表里的车，列表里的车由surroundings外推
+        # 虚拟gap车和感知时一样按自己的速度前进，横向位置保持在目标车道
+        vehicle['position_x'] += vehicle['speed'] * self.timeStep
+        vehicle['relative_position_x'] = vehicle['position_x'] - self.x
+        vehicle['relative_position_y'] = vehicle['position_y'] - self.y
+        return vehicle
+
     def print_data(self):
         print("自车信息："+str(self.data)+'车速：'+str(self.vx))
         # print("他车信息"+str(self.neighbourVehicles))
@@ -207,10 +257,9 @@ class EgoVehicle:
             self.edgeID = self.data[tc.VAR_ROAD_ID]
 
     def _set_n_lane(self):
-        self.nLane = traci.edge.getLaneNumber(self.edgeID)
+        self.nLane = self.egoData.get_lane_number(self.edgeID)
 
-    def _set_leading_vehicle(self):
-        self.midFrontVehicleList.sort(key=lambda x: x['relative_position_x'])
+    def _set_leading_vehicle(self):  # surroundings的列表已经按距离由近到远排好序
         if len(self.midFrontVehicleList) != 0:
             self.leadingVehicle = self.midFrontVehicleList[0]
             self.leadingVehicle['virtual'] = 0
@@ -225,7 +274,6 @@ class EgoVehicle:
         self.leadingVehicle['relative_position_y'] = self.leadingVehicle['position_y'] - self.y
 
     def _set_following_vehicle(self):
-        self.midRearVehicleList.sort(key=lambda x: x['relative_position_x'],reverse=True)
         if len(self.midRearVehicleList) != 0:
             self.followingVehicle = self.midRearVehicleList[0]
             self.followingVehicle['virtual'] = 0
@@ -239,9 +287,18 @@ class EgoVehicle:
         self.followingVehicle['relative_position_x'] = self.followingVehicle['position_x'] - self.x
         self.followingVehicle['relative_position_y'] = self.followingVehicle['position_y'] - self.y
 
+    def _filter_control(self):
+        if self.safetyFilter is not None:
+            self.vxCtl, self.vyCtl = self.safetyFilter.filter(self, self.vxCtl, self.vyCtl)
+
     def drive(self):
+        """按当前任务下发一次moveToXY。EgoGroup/EgoFleet会在egoGroup.run_batched里调用drive，命令随下一次
+        simulationStep一起发出，所以这里只能发set命令(moveToXY, setSpeed等)，get和subscribe要放到fresh_data或者
+        规划里，否则run_batched抛出RuntimeError"""
         if len(self.missionList) == 0:
-            traci.vehicle.moveToXY(self.id, '', 2, self.x + self.timeStep * self.vxCtl,
+            if self.safetyFilter is not None:
+                self.vxCtl = self.safetyFilter.filter(self, self.vxCtl, 0)[0]
+            self.connection.vehicle.moveToXY(self.id, '', 2, self.x + self.timeStep * self.vxCtl,
                                    self.y, 90, 2)
         else:
             temp_check_type = self.missionList[0]["c_type"]
@@ -295,7 +352,8 @@ class EgoVehicle:
                 self.vyCtl = 0
                 self.axCtl = 0
                 self.ayCtl = 0
-            traci.vehicle.moveToXY(self.id, '', 2, self.x + self.timeStep * self.vxCtl,
+            self._filter_control()
+            self.connection.vehicle.moveToXY(self.id, '', 2, self.x + self.timeStep * self.vxCtl,
                                    self.y + self.timeStep * self.vyCtl, self.angleCtl, 2)
 
     def lane_change_plan(self, gap_front_vehicle, gap_rear_vehicle):
@@ -307,13 +365,15 @@ class EgoVehicle:
         # 加入虚拟车标志位之后需要改这个地方，目前的算法是针对真实车的
         # virtual_l
         # virtual_f
+        # 真实的gap车单独订阅，订阅结果立即可用，和自车数据一起记录(recorder)，前后车可以一个真实一个虚拟
+        self.egoData.track([vehicle['name'] for vehicle in (gap_front_vehicle, gap_rear_vehicle)
+                            if vehicle['virtual'] == 0])
         if gap_front_vehicle['virtual'] == 0:
-            traci.vehicle.subscribe(gap_front_vehicle['name'], (tc.VAR_POSITION, tc.VAR_SPEED, tc.VAR_LANE_INDEX))
-            traci.vehicle.subscribe(gap_rear_vehicle['name'], (tc.VAR_POSITION, tc.VAR_SPEED, tc.VAR_LANE_INDEX))
-            # >>>临时计算相对位置的函数，后期去掉
-            gap_front_vehicle['relative_position_x'] = traci.vehicle.getPosition(gap_front_vehicle['name'])[0] - self.x
-            gap_rear_vehicle['relative_position_x'] = traci.vehicle.getPosition(gap_rear_vehicle['name'])[0] - self.x
-            # <<<<<<<<<<<<<<<<<<<<<<<<<<
+            gap_front_vehicle['relative_position_x'] = \
+                self.egoData.get_tracked(gap_front_vehicle['name'])[tc.VAR_POSITION][0] - self.x
+        if gap_rear_vehicle['virtual'] == 0:
+            gap_rear_vehicle['relative_position_x'] = \
+                self.egoData.get_tracked(gap_rear_vehicle['name'])[tc.VAR_POSITION][0] - self.x
         self.gapFrontVehicle = gap_front_vehicle
         self.gapRearVehicle = gap_rear_vehicle
         self.pre_change_to_lane()
@@ -326,6 +386,53 @@ class EgoVehicle:
             self.goalLaneIndex = self.laneIndex - 1
         self.state = 2
 
+    def candidate_lane_change_plan(self, planner):
+        """由planner(trajectoryPlanner.CandidatePlanner)在所有候选gap和加速度曲线中选代价最小的可行方案再换道，
+        没有可行方案时不换道，返回None"""
+        plan = planner.plan(self)
+        if plan is None:
+            return None
+        self.lane_change_plan(plan['gap_front_vehicle'], plan['gap_rear_vehicle'])
+        self.missionList[0]['axCtl'] = plan['ax']  # 代替pre_change_to_lane里按距离分段的加速度
+        # 可行性是按duration之后开始换道检查的，在这之前即使进入了10m的窗口也不换道
+        self.missionList[0]['startTick'] = self.tick + int(round(plan['duration'] / self.timeStep))
+        return plan
+
+    def apply_action(self, action):
+        """按动作(NO_ACTION, LANE_KEEP, CHANGE_LEFT, CHANGE_RIGHT)规划任务，已有任务或者目标车道不存在时不规划"""
+        if action == NO_ACTION or len(self.missionList) != 0:  # a running mission is never interrupted
+            return
+        if action == LANE_KEEP:
+            self.lane_keep_plan()
+        elif action == CHANGE_LEFT and self.laneIndex < self.nLane - 1:
+            self.lane_change_plan(self.get_gap_vehicle(self.leftFrontVehicleList, 1, 0),
+                                  self.get_gap_vehicle(self.leftRearVehicleList, -1, 0))
+        elif action == CHANGE_RIGHT and self.laneIndex > 0:
+            self.lane_change_plan(self.get_gap_vehicle(self.rightFrontVehicleList, 1, 2),
+                                  self.get_gap_vehicle(self.rightRearVehicleList, -1, 2))
+
+    def get_gap_vehicle(self, vehicle_list, direction, lane_code):  # lane_code: 0 left, 2 right lane of the ego
+        if len(vehicle_list) != 0:
+            vehicle = dict(min(vehicle_list, key=lambda v: abs(v['relative_position_x'])))
+            vehicle['virtual'] = 0
+        else:
+            vehicle = {'virtual': 1, 'name': 'virtual_l' if direction > 0 else 'virtual_f',
+                       'position_x': self.x + direction * RADAR_LIMIT,
+                       'position_y': self.y + (1 if lane_code == 0 else -1) * LANE_WIDTH,
+                       'speed': 120 / 3.6}
+        vehicle['relative_position_x'] = vehicle['position_x'] - self.x
+        vehicle['relative_position_y'] = vehicle['position_y'] - self.y
+        vehicle['lane_index'] = lane_code
+        return vehicle
+
+    def policy_plan(self, policy):
+        """由policy(policyEngine.PolicyEngine)根据周车观测选择换道或者车道保持，返回选择的动作，已有任务时不做决策"""
+        if len(self.missionList) != 0:
+            return None
+        action = policy.decide(self)
+        self.apply_action(action)
+        return action
+
     def pre_change_to_lane(self):
         mean_x = 0.5 * (self.gapRearVehicle['relative_position_x'] + self.gapFrontVehicle['relative_position_x'])
         temp_ax = 0.0
@@ -344,6 +451,8 @@ class EgoVehicle:
         self.missionList[0]['axCtl'] = temp_ax
 
     def has_pre_change_to_lane_complete(self):
+        if self.tick < self.missionList[0].get('startTick', 0):  # 规划的换道开始时刻还没到
+            return False
         if self.gapRearVehicle['position_x']+10 < self.x < self.gapFrontVehicle['position_x']-10:
             return True
         else:
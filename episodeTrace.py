@@ -0,0 +1,376 @@
+# coding:utf-8
+import os
+import json
+import numpy as np
+import traci.constants as tc
+from egoVehicle import EgoVehicle
+from surrounding import ContextFilter
+from RL_brain import DataProcess
+
+TRACE_VERSION = 2
+CHUNK_STEPS = 1024  # the trace file grows by this many step blocks at a time
+MAX_VEHICLES = 96  # context vehicles per step block, the others go to the spill file
+MAX_TRACKED = 4  # vehicles the ego subscribes on its own (EgoData.track), the old and new gap vehicles of a step
+STEP_LENGTH = 0.01  # of the recorded simulation, traces without it were recorded at 0.01
+# result state of the ego subscription and of the context subscription
+MISSING = 0  # None
+EMPTY = 1  # {}
+PRESENT = 2
+
+VEHICLE_DTYPE = np.dtype([('name', 'i4'), ('x', 'f8'), ('y', 'f8'), ('speed', 'f8'), ('road', 'i4'),
+                          ('lane_index', 'i2'), ('lane_position', 'f8'), ('lane_position_lat', 'f8'),
+                          ('angle', 'f8'), ('route', 'i4')])
+# strings (names, edges, routes) are stored as index into the string table of the trace
+VARIABLES = (tc.VAR_POSITION, tc.VAR_SPEED, tc.VAR_ROAD_ID, tc.VAR_LANE_INDEX, tc.VAR_LANEPOSITION,
+             tc.VAR_LANEPOSITION_LAT, tc.VAR_ANGLE, tc.VAR_EDGES)
+
+
+def block_dtype(max_vehicles, max_tracked=MAX_TRACKED):
+    # spill is the first record of the context vehicles beyond max_vehicles in the spill file
+    return np.dtype([('step', 'i8'), ('ego_state', 'u1'), ('context_state', 'u1'), ('count', 'i4'),
+                     ('ego', VEHICLE_DTYPE), ('vehicles', VEHICLE_DTYPE, (max_vehicles,)), ('spill', 'i8'),
+                     ('tracked_count', 'u1'), ('tracked_state', 'u1', (max_tracked,)),
+                     ('tracked', VEHICLE_DTYPE, (max_tracked,)), ('valid', 'u1')])
+
+
+class TraceRecorder:
+    """appends the ego, context and tracked vehicle subscription results of every step to a memory-mapped trace
+
+    path.trace holds one fixed-width block per step, path.spill the context vehicles that do not fit
+    into their block, path.strings the string table (vehicle names, edges and routes, one per line) and
+    path.json the layout. Opening an existing trace appends to it. perception_interval and context_filter
+    (surrounding.ContextFilter) are those of the recorded EgoVehicle, replay() creates its ego with them.
+    """
+    def __init__(self, path, ego_id='ego', max_vehicles=MAX_VEHICLES, step_length=STEP_LENGTH,
+                 perception_interval=0.0, context_filter=None):
+        self.path = path
+        self.egoId = ego_id
+        self.meta = {'version': TRACE_VERSION, 'ego': ego_id, 'max_vehicles': max_vehicles, 'max_tracked': MAX_TRACKED,
+                     'step_length': step_length, 'ego_variables': None, 'context_variables': None,
+                     'tracked_variables': None, 'perception_interval': perception_interval,
+                     'context_filter': None if context_filter is None else context_filter.get_params()}
+        if os.path.isfile(path + '.json'):
+            self.meta = read_meta(path)
+        self.dtype = block_dtype(self.meta['max_vehicles'], self.meta['max_tracked'])
+        self.stringList = []
+        self.stringDict = {}
+        if os.path.isfile(path + '.strings'):
+            with open(path + '.strings', encoding='utf-8') as f:
+                for line in f:
+                    self._string_id(line.rstrip('\n'), write=False)
+        self.stringFile = open(path + '.strings', 'a', encoding='utf-8')
+        self.spillFile = open(path + '.spill', 'ab')
+        self.spillCount = os.path.getsize(path + '.spill') // VEHICLE_DTYPE.itemsize
+        self.count = len(TraceReader.blocks_of(path, self.dtype)) if os.path.isfile(path + '.trace') else 0
+        self.lastTracked = {}  # tracked vehicles of the last recorded step
+        self.capacity = 0
+        self.blocks = None
+        self._grow(self.count + CHUNK_STEPS)
+
+    def _grow(self, capacity):
+        if self.blocks is not None:
+            self.blocks.flush()
+            del self.blocks
+        with open(self.path + '.trace', 'ab') as f:
+            f.truncate(capacity * self.dtype.itemsize)
+        self.capacity = capacity
+        self.blocks = np.memmap(self.path + '.trace', dtype=self.dtype, mode='r+', shape=(capacity,))
+
+    def _string_id(self, string, write=True):
+        index = self.stringDict.get(string)
+        if index is None:
+            index = self.stringDict[string] = len(self.stringList)
+            self.stringList.append(string)
+            if write:
+                self.stringFile.write(string + '\n')
+        return index
+
+    def _variables(self, key, values):
+        variables = list(values)
+        if self.meta[key] is None:
+            for variable in variables:
+                if variable not in VARIABLES:
+                    raise ValueError("variable 0x%x can not be recorded" % variable)
+            self.meta[key] = variables
+        elif variables != self.meta[key]:
+            raise ValueError("the subscribed variables changed during the recording")
+
+    def _vehicle_record(self, name, values):  # a VEHICLE_DTYPE row as tuple, unsubscribed fields stay 0
+        x = y = speed = lane_position = lane_position_lat = angle = 0.0
+        road = route = lane_index = 0
+        for variable, value in values.items():
+            if variable == tc.VAR_POSITION:
+                x, y = value[0], value[1]
+            elif variable == tc.VAR_SPEED:
+                speed = value
+            elif variable == tc.VAR_ROAD_ID:
+                road = self._string_id(value)
+            elif variable == tc.VAR_LANE_INDEX:
+                lane_index = value
+            elif variable == tc.VAR_LANEPOSITION:
+                lane_position = value
+            elif variable == tc.VAR_LANEPOSITION_LAT:
+                lane_position_lat = value
+            elif variable == tc.VAR_ANGLE:
+                angle = value
+            elif variable == tc.VAR_EDGES:
+                route = self._string_id(' '.join(value))
+        return self._string_id(name), x, y, speed, road, lane_index, lane_position, lane_position_lat, angle, route
+
+    def record(self, ego_data, context, tracked=None):
+        """one step, ego_data and context as returned by getSubscriptionResults/getContextSubscriptionResults,
+        tracked as {vehicle: getSubscriptionResults(vehicle)} of the vehicles the ego subscribed on its own"""
+        if self.count == self.capacity:
+            self._grow(self.capacity + CHUNK_STEPS)
+        i = self.count
+        blocks = self.blocks
+        blocks['step'][i] = i
+        blocks['ego_state'][i] = MISSING if ego_data is None else (PRESENT if ego_data else EMPTY)
+        blocks['context_state'][i] = MISSING if context is None else (PRESENT if context else EMPTY)
+        if ego_data:
+            self._variables('ego_variables', ego_data)
+            blocks['ego'][i:i + 1] = [self._vehicle_record(self.egoId, ego_data)]
+        blocks['spill'][i] = self.spillCount
+        if context:
+            self._variables('context_variables', next(iter(context.values())))
+            records = [self._vehicle_record(name, values) for name, values in context.items()]
+            max_vehicles = self.meta['max_vehicles']
+            blocks['vehicles'][i, :min(len(records), max_vehicles)] = records[:max_vehicles]
+            if len(records) > max_vehicles:
+                np.array(records[max_vehicles:], dtype=VEHICLE_DTYPE).tofile(self.spillFile)
+                self.spillCount += len(records) - max_vehicles
+            blocks['count'][i] = len(context)
+        self._write_tracked(i, tracked or {})
+        blocks['valid'][i] = 1  # written last, a block without it was cut off by a crash
+        self.count += 1
+
+    def record_tracked(self, tracked):
+        """add vehicles subscribed after the results of the last recorded step to its tracked vehicles"""
+        if self.count:
+            merged = dict(self.lastTracked)
+            merged.update(tracked)
+            self._write_tracked(self.count - 1, merged)
+
+    def _write_tracked(self, i, tracked):
+        self.lastTracked = dict(tracked)
+        if len(tracked) > self.meta['max_tracked']:
+            raise ValueError("%d tracked vehicles, the trace holds %d per step" % (len(tracked),
+                                                                                  self.meta['max_tracked']))
+        blocks = self.blocks
+        blocks['tracked_count'][i] = len(tracked)
+        for j, (name, values) in enumerate(tracked.items()):
+            blocks['tracked_state'][i, j] = MISSING if values is None else (PRESENT if values else EMPTY)
+            if values:
+                self._variables('tracked_variables', values)
+            blocks['tracked'][i, j] = self._vehicle_record(name, values or {})
+
+    def flush(self):
+        self.blocks.flush()
+        self.stringFile.flush()
+        self.spillFile.flush()
+        with open(self.path + '.json', 'w') as f:
+            json.dump(self.meta, f)
+
+    def close(self):
+        self.flush()
+        del self.blocks
+        self.blocks = None
+        with open(self.path + '.trace', 'r+b') as f:  # drop the unused part of the last chunk
+            f.truncate(self.count * self.dtype.itemsize)
+        self.stringFile.close()
+        self.spillFile.close()
+
+
+def read_meta(path):
+    with open(path + '.json') as f:
+        meta = json.load(f)
+    if meta.get('version') != TRACE_VERSION:
+        raise ValueError("%s is a version %s trace, this code reads version %d" % (path, meta.get('version'),
+                                                                                  TRACE_VERSION))
+    return meta
+
+
+class TraceReader:
+    def __init__(self, path):
+        self.meta = read_meta(path)
+        self.dtype = block_dtype(self.meta['max_vehicles'], self.meta['max_tracked'])
+        self.blocks = self.blocks_of(path, self.dtype)
+        self.spill = np.zeros(0, dtype=VEHICLE_DTYPE)
+        if os.path.isfile(path + '.spill') and os.path.getsize(path + '.spill'):
+            self.spill = np.memmap(path + '.spill', dtype=VEHICLE_DTYPE, mode='r')
+        with open(path + '.strings', encoding='utf-8') as f:
+            self.stringList = [line.rstrip('\n') for line in f]
+        self.routeList = [tuple(string.split(' ')) for string in self.stringList]
+        self.egoVariables = [int(v) for v in self.meta['ego_variables'] or []]
+        self.contextVariables = [int(v) for v in self.meta['context_variables'] or []]
+        self.trackedVariables = [int(v) for v in self.meta['tracked_variables'] or []]
+
+    @staticmethod
+    def blocks_of(path, dtype):
+        size = os.path.getsize(path + '.trace') // dtype.itemsize
+        if size == 0:
+            return np.zeros(0, dtype=dtype)
+        blocks = np.memmap(path + '.trace', dtype=dtype, mode='r', shape=(size,))
+        return blocks[:int(np.count_nonzero(blocks['valid']))]  # blocks are written in order
+
+    def __len__(self):
+        return len(self.blocks)
+
+    def _decode(self, record, variables):
+        # record is the tuple of a VEHICLE_DTYPE row, in field order
+        name, x, y, speed, road, lane_index, lane_position, lane_position_lat, angle, route = record
+        values = {}
+        for variable in variables:
+            if variable == tc.VAR_POSITION:
+                values[variable] = (x, y)
+            elif variable == tc.VAR_SPEED:
+                values[variable] = speed
+            elif variable == tc.VAR_ROAD_ID:
+                values[variable] = self.stringList[road]
+            elif variable == tc.VAR_LANE_INDEX:
+                values[variable] = lane_index
+            elif variable == tc.VAR_LANEPOSITION:
+                values[variable] = lane_position
+            elif variable == tc.VAR_LANEPOSITION_LAT:
+                values[variable] = lane_position_lat
+            elif variable == tc.VAR_ANGLE:
+                values[variable] = angle
+            elif variable == tc.VAR_EDGES:
+                values[variable] = self.routeList[route]
+        return values
+
+    def get_step(self, index):
+        """(ego results, context results, tracked vehicle results) of a step, as the live run received them"""
+        block = self.blocks[index]
+        ego_state, context_state, count = int(block['ego_state']), int(block['context_state']), int(block['count'])
+        ego = None if ego_state == MISSING else {}
+        if ego_state == PRESENT:
+            ego = self._decode(block['ego'].tolist(), self.egoVariables)
+        context = None if context_state == MISSING else {}
+        if context_state == PRESENT:
+            records = block['vehicles'][:count].tolist()
+            if count > len(block['vehicles']):
+                spill = int(block['spill'])
+                records += self.spill[spill:spill + count - len(block['vehicles'])].tolist()
+            for record in records:
+                context[self.stringList[record[0]]] = self._decode(record, self.contextVariables)
+        tracked = {}
+        for state, record in zip(block['tracked_state'][:int(block['tracked_count'])].tolist(),
+                                 block['tracked'][:int(block['tracked_count'])].tolist()):
+            name = self.stringList[record[0]]
+            tracked[name] = None if state == MISSING else {}
+            if state == PRESENT:
+                tracked[name] = self._decode(record, self.trackedVariables)
+        return ego, context, tracked
+
+
+class TraceConnection:
+    """stands in for traci during a replay, simulationStep() moves on to the next recorded step"""
+    def __init__(self, reader):
+        self.reader = reader
+        self.egoId = reader.meta['ego']
+        self.index = -1
+        self.ego = None
+        self.context = None
+        self.tracked = {}
+        self.vehicle = _TraceVehicle(self)
+        self.simulation = _TraceSimulation(reader.meta.get('step_length', STEP_LENGTH))
+
+    def simulationStep(self, step=0.):
+        self.index += 1
+        self.ego, self.context, self.tracked = self.reader.get_step(self.index)
+
+    def has_next(self):
+        return self.index + 1 < len(self.reader)
+
+    def get_results(self, vehicle_id):
+        if vehicle_id == self.egoId:
+            return self.ego
+        return self.tracked.get(vehicle_id, {})  # like traci, {} for a vehicle without its own subscription
+
+
+class _TraceVehicle:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def subscribe(self, vehicle_id, variables):
+        pass
+
+    def subscribeContext(self, vehicle_id, domain, dist, variables):
+        pass
+
+    def addSubscriptionFilterLanes(self, *args, **kwargs):  # the recorded context is filtered already
+        pass
+
+    def addSubscriptionFilterLeadFollow(self, *args, **kwargs):
+        pass
+
+    def addSubscriptionFilterDownstreamDistance(self, *args, **kwargs):
+        pass
+
+    def addSubscriptionFilterUpstreamDistance(self, *args, **kwargs):
+        pass
+
+    def moveToXY(self, *args, **kwargs):
+        pass
+
+    def getSubscriptionResults(self, vehicle_id):
+        return self.connection.get_results(vehicle_id)
+
+    def getContextSubscriptionResults(self, vehicle_id):
+        return self.connection.context
+
+    def getPosition(self, vehicle_id):
+        results = self.connection.get_results(vehicle_id) or (self.connection.context or {}).get(vehicle_id, {})
+        return results[tc.VAR_POSITION]
+
+
+class _TraceSimulation:
+    def __init__(self, step_length):
+        self.stepLength = step_length
+
+    def getDeltaT(self):
+        return self.stepLength
+
+
+def replay(path, network, columnar=False, data_process=None, on_step=None):
+    """feed a trace through EgoVehicle.fresh_data, Surrounding and DataProcess without SUMO
+
+    The network is required, the lane data traci would otherwise be asked for is not in the trace.
+    The ego gets the perception interval and context filter of the recorded one.
+    on_step(index, ego_vehicle, data_process) is called before drive() and may issue the same plans as
+    the recorded run. Returns the number of replayed steps.
+    """
+    reader = TraceReader(path)
+    connection = TraceConnection(reader)
+    context_filter = reader.meta.get('context_filter')
+    if context_filter is not None:
+        context_filter = ContextFilter(**context_filter)
+    data_process = DataProcess() if data_process is None else data_process
+    ego_vehicle = None
+    while connection.has_next():
+        connection.simulationStep()
+        if not connection.ego:  # the ego has left the simulation
+            break
+        if ego_vehicle is None:  # created on the first recorded step, like the live EgoVehicle
+            ego_vehicle = EgoVehicle(connection.egoId, network=network, columnar=columnar, connection=connection,
+                                     perception_interval=reader.meta.get('perception_interval', 0.0),
+                                     context_filter=context_filter)
+        ego_vehicle.fresh_data()
+        if ego_vehicle.data:
+            data_process.set_surrounding_data(ego_vehicle.surroundings, ego_vehicle.get_speed())
+            data_process.vehicle_surrounding_data_process()
+        if on_step is not None:
+            on_step(connection.index, ego_vehicle, data_process)
+        ego_vehicle.drive()
+    return connection.index + 1 if connection.ego else connection.index
+
+
+if __name__ == "__main__":
+    # replay a trace recorded with runner.py --record PATH, e.g. python episodeTrace.py PATH
+    import sys
+    import time
+    from roadNetwork import RoadNetwork
+    start = time.time()
+    steps = replay(sys.argv[1], RoadNetwork(sys.argv[2] if len(sys.argv) > 2 else 'data/motorway.net.xml'))
+    print("%d steps replayed in %.3f s" % (steps, time.time() - start))
@@ -0,0 +1,686 @@
+# coding:utf-8
+import os
+import bisect
+import xml.etree.ElementTree as ET
+import numpy as np
+import traci.constants as tc
+from roadNetwork import RoadNetwork
+
+LANE_WIDTH = 3.2
+MAIN_LINE = ('gneE0', 'gneE1', 'gneE2', 'gneE3', 'gneE4', 'gneE5', 'gneE6', 'gneE7')
+HEADWAY = 1.0  # idm desired time headway
+IDM_DELTA = 4
+MAX_DECEL = 9.0
+LANE_CHANGE_PERIOD = 1.0  # s between two lane change decisions of a vehicle
+LANE_CHANGE_TICK = 0.1  # s, the decisions that are due are taken together at this interval
+LANE_CHANGE_THRESHOLD = 0.2  # acceleration advantage needed for a discretionary lane change
+KEEP_RIGHT_BIAS = 0.1
+SAFE_DECEL = 4.0  # a lane change must not make the new follower brake harder than this
+MANDATORY_DISTANCE = 200.0  # distance to a lane drop at which vehicles start to leave the lane
+DEFAULT_VTYPE = {'accel': 2.6, 'decel': 4.5, 'length': 5.0, 'minGap': 2.5, 'maxSpeed': 55.55}
+
+
+def _idm(v, v0, accel, decel, min_gap, gap, leader_speed):
+    """intelligent driver model, gap is inf on a free road"""
+    s_star = min_gap + np.maximum(0.0, v * HEADWAY + v * (v - leader_speed) / (2.0 * np.sqrt(accel * decel)))
+    return accel * (1.0 - (v / v0) ** IDM_DELTA - (s_star / np.maximum(gap, 0.01)) ** 2)
+
+
+class _Road:
+    """the main carriageway as one straight axis along x, lanes are counted as slots from the left"""
+    def __init__(self, network, main_line):
+        self.network = network
+        self.edgeIdList = list(main_line)
+        self.edgeRowDict = dict(zip(self.edgeIdList, range(len(self.edgeIdList))))
+        self.laneNumber = np.array([network.get_lane_number(edge) for edge in main_line])
+        self.slotNumber = int(self.laneNumber.max())
+        self.start = np.zeros(len(main_line))
+        self.end = np.zeros(len(main_line))
+        self.speed = np.full((len(main_line), self.slotNumber), np.inf)  # inf where there is no lane
+        self.allowed = np.zeros((len(main_line), self.slotNumber), dtype=bool)
+        for row, edge in enumerate(main_line):
+            n = self.laneNumber[row]
+            shape = np.asarray(network.get_lane_shape(edge + '_0'))
+            self.start[row] = shape[:, 0].min()
+            self.end[row] = shape[:, 0].max()
+            for index in range(n):
+                lane_id = '%s_%d' % (edge, index)
+                self.speed[row, n - 1 - index] = network.get_lane_max_speed(lane_id)
+                self.allowed[row, n - 1 - index] = network.get_lane_allows_passenger(lane_id)
+        # slots that end with their edge, vehicles have to leave them before the end of the edge
+        self.drops = np.zeros((len(main_line), self.slotNumber), dtype=bool)
+        self.drops[:-1] = ~self.allowed[1:]
+        self.nextStart = self.start[1:]
+        self.nextStartList = self.nextStart.tolist()
+        self.laneNumberList = self.laneNumber.tolist()
+
+    def edge_row(self, x):  # junction areas count to the edge before them
+        return np.searchsorted(self.nextStart, x, side='right')
+
+    def edge_row_of(self, x):  # edge_row and slot_of_y of a single point, without the NumPy call overhead
+        return bisect.bisect_right(self.nextStartList, x)
+
+    def slot_of(self, y, edge_row):
+        return min(max(int(-y / LANE_WIDTH), 0), self.laneNumberList[edge_row] - 1)
+
+    def entry_row(self, edge):  # first main line edge of a route starting on edge
+        if edge in self.edgeRowDict:
+            return self.edgeRowDict[edge]
+        to_node = self.network.get_edge_nodes(edge)[1]
+        for row, main_edge in enumerate(self.edgeIdList):
+            if self.network.get_edge_nodes(main_edge)[0] == to_node:
+                return row
+        raise ValueError("edge %s does not lead onto the main line" % edge)
+
+    def exit_row(self, edge):  # last main line edge of a route ending on edge
+        if edge in self.edgeRowDict:
+            return self.edgeRowDict[edge]
+        from_node = self.network.get_edge_nodes(edge)[0]
+        for row, main_edge in enumerate(self.edgeIdList):
+            if self.network.get_edge_nodes(main_edge)[1] == from_node:
+                return row
+        raise ValueError("edge %s can not be reached from the main line" % edge)
+
+    def route(self, from_edge, to_edge):
+        entry, exit = self.entry_row(from_edge), self.exit_row(to_edge)
+        route = self.edgeIdList[entry:exit + 1]
+        if from_edge not in self.edgeRowDict:
+            route = [from_edge] + route
+        if to_edge not in self.edgeRowDict:
+            route = route + [to_edge]
+        return tuple(route), entry, exit
+
+    def slot_of_y(self, y, edge_row):
+        return np.clip((-np.asarray(y) / LANE_WIDTH).astype(int), 0, self.laneNumber[edge_row] - 1)
+
+    @staticmethod
+    def y_of_slot(slot):
+        return -(slot + 0.5) * LANE_WIDTH
+
+
+class KinematicSimulation:
+    """in-process stand-in for the part of a traci connection this project uses
+
+    Vehicles drive on the main line of motorway.net.xml with IDM car-following and a simple
+    incentive/safety lane change model, all state is kept in NumPy arrays. Ramps are not modelled,
+    vehicles from/to a ramp enter/leave the main line at the junction. Vehicles driven by moveToXY
+    leave like the others once they are moved past the end of their route. It is passed as connection
+    to EgoVehicle, Surrounding or runner.run in place of traci.
+    """
+    def __init__(self, net_file, route_files, step_length=0.01, begin=0.0, end=None, seed=0,
+                 main_line=MAIN_LINE, network=None):
+        self.netFile = net_file
+        self.network = RoadNetwork(net_file) if network is None else network
+        self.road = _Road(self.network, main_line)
+        self.mainLine = main_line
+        self.vehicle = _VehicleDomain(self)
+        self.edge = _EdgeDomain(self)
+        self.lane = _LaneDomain(self)
+        self.simulation = _SimulationDomain(self)
+        self._reset(route_files, step_length, begin, end, seed)
+
+    @classmethod
+    def from_config(cls, config_file, seed=0, **kwargs):
+        config = _read_config(config_file)
+        return cls(config['net'], config['routes'], config['step'], config['begin'], config['end'], seed, **kwargs)
+
+    def _reset(self, route_files, step_length, begin, end, seed):
+        self.routeFiles = list(route_files)
+        self.deltaT = step_length
+        self.time = begin
+        self.stepCount = 0
+        self.laneChangeSteps = max(1, int(round(LANE_CHANGE_TICK / step_length)))
+        self.endTime = end
+        self.rng = np.random.default_rng(seed)
+        self.capacity = 0
+        self.nameList = []
+        self.routeList = []
+        self.rowDict = {}
+        self.freeRows = []
+        self.active = np.zeros(0, dtype=bool)
+        for field in ('controlled',):
+            setattr(self, field, np.zeros(0, dtype=bool))
+        for field in ('x', 'y', 'v', 'accel', 'decel', 'maxSpeed', 'length', 'minGap', 'exitX', 'nextChange'):
+            setattr(self, field, np.zeros(0))
+        self.slot = np.zeros(0, dtype=int)
+        self.edgeRow = np.zeros(0, dtype=int)
+        self.moves = {}  # row -> (x, y) applied with the next step, like moveToXY in sumo
+        self.vTypes = {}
+        self.routes = {}
+        self.departures = []  # (depart, id, vtype, route, depart lane, depart speed, depart pos), by depart time
+        self.flows = []
+        self.pending = []  # departed but not inserted yet
+        self.flowCount = {}
+        self.subscriptions = {}  # vehicle -> variables
+        self.contextSubscriptions = {}  # vehicle -> (distance, variables, filters)
+        self.subscriptionResults = {}
+        self.contextSubscriptionResults = {}
+        self.simulationSubscription = ()
+        for route_file in self.routeFiles:
+            self._read_routes(route_file)
+        self.departures.sort(key=lambda departure: departure[0])
+
+    def load(self, args):  # the arguments of traci.load, the options given there replace those of the config
+        def option(name, default):
+            return args[args.index(name) + 1] if name in args else default
+        config = _read_config(option('-c', None))
+        route_files = option('--route-files', None)
+        end = option('--end', config['end'])
+        self._reset(config['routes'] if route_files is None else route_files.split(','),
+                    float(option('--step-length', config['step'])), float(option('--begin', config['begin'])),
+                    None if end is None else float(end), int(option('--seed', 0)))
+
+    def close(self):
+        pass
+
+    # ---- demand ----
+    def _read_routes(self, route_file):
+        for elem in ET.parse(route_file).getroot():
+            if elem.tag == 'vType':
+                vtype = dict(DEFAULT_VTYPE)
+                for key in vtype:
+                    if elem.get(key) is not None:
+                        vtype[key] = float(elem.get(key))
+                self.vTypes[elem.get('id')] = vtype
+            elif elem.tag == 'route':
+                edges = elem.get('edges').split()
+                self.routes[elem.get('id')] = self.road.route(edges[0], edges[-1])
+            elif elem.tag in ('vehicle', 'trip'):
+                route = self._element_route(elem)
+                self.departures.append((float(elem.get('depart')), elem.get('id'), elem.get('type', 'DEFAULT_VEHTYPE'),
+                                        route, elem.get('departLane', 'first'), elem.get('departSpeed', '0'),
+                                        elem.get('departPos')))
+            elif elem.tag == 'flow':
+                begin = float(elem.get('begin', 0))
+                end = float(elem.get('end', 3600))
+                if elem.get('probability') is not None:
+                    rate = float(elem.get('probability'))
+                elif elem.get('vehsPerHour') is not None:
+                    rate = float(elem.get('vehsPerHour')) / 3600.0
+                elif elem.get('period') is not None:
+                    rate = 1.0 / float(elem.get('period'))
+                else:
+                    rate = float(elem.get('number')) / max(end - begin, 1e-6)
+                self.flows.append({'id': elem.get('id'), 'type': elem.get('type', 'DEFAULT_VEHTYPE'),
+                                   'route': self._element_route(elem), 'begin': begin, 'end': end, 'rate': rate,
+                                   'lane': elem.get('departLane', 'first'), 'speed': elem.get('departSpeed', '0')})
+                self.flowCount[elem.get('id')] = 0
+
+    def _element_route(self, elem):
+        if elem.get('route') is not None:
+            return self.routes[elem.get('route')]
+        return self.road.route(elem.get('from'), elem.get('to'))
+
+    def _depart(self):
+        while self.departures and self.departures[0][0] <= self.time + 1e-9:
+            self.pending.append(self.departures.pop(0)[1:])
+        for flow in self.flows:
+            if flow['begin'] <= self.time < flow['end'] and self.rng.random() < flow['rate'] * self.deltaT:
+                name = '%s.%d' % (flow['id'], self.flowCount[flow['id']])
+                self.flowCount[flow['id']] += 1
+                self.pending.append((name, flow['type'], flow['route'], flow['lane'], flow['speed'], None))
+        blocked = set()  # once a vehicle can't be inserted, the ones queued behind it on the same edge wait too
+        waiting = []
+        for vehicle in self.pending:
+            # a vehicle with its own depart position only waits for that position
+            entry = vehicle[2][1] if vehicle[5] is None else (vehicle[2][1], vehicle[5])
+            if entry in blocked or not self._insert(*vehicle):
+                blocked.add(entry)
+                waiting.append(vehicle)
+        self.pending = waiting
+
+    def _insert(self, name, vtype_id, route, depart_lane, depart_speed, depart_pos=None):
+        vtype = self.vTypes.get(vtype_id, DEFAULT_VTYPE)
+        edges, entry, exit = route
+        n = self.road.laneNumber[entry]
+        try:  # the front position on the entry edge, numeric departPos only
+            x = self.road.start[entry] + float(depart_pos)
+        except (TypeError, ValueError):
+            x = self.road.start[entry] + vtype['length']
+        if depart_lane in ('free', 'best', 'random', 'allowed'):
+            slots = [slot for slot in range(n) if self.road.allowed[entry, slot]]
+            if depart_lane == 'random':
+                self.rng.shuffle(slots)
+        elif depart_lane == 'first':
+            slots = [slot for slot in range(n - 1, -1, -1) if self.road.allowed[entry, slot]][:1]
+        else:
+            slots = [n - 1 - int(depart_lane)]
+        best = None
+        for slot in slots:
+            gap, leader_speed = self._insertion_gap(x, vtype, slot)
+            if gap is not None and (best is None or gap > best[1]):
+                best = (slot, gap, leader_speed)
+                if depart_lane != 'free':
+                    break
+        if best is None:
+            return False
+        slot, gap, leader_speed = best
+        v0 = min(vtype['maxSpeed'], self.road.speed[entry, slot])
+        safe = max(0.0, (gap - vtype['minGap']) / HEADWAY + leader_speed * 0.5)
+        if depart_speed == 'max':
+            speed = min(v0, safe)
+        elif depart_speed == 'desired':
+            speed = v0
+        elif depart_speed == 'random':
+            speed = min(self.rng.uniform(0, v0), safe)
+        else:
+            speed = float(depart_speed)
+        if speed > safe:
+            return False
+        self._add(name, edges, x, slot, speed, vtype, self.road.end[exit])
+        return True
+
+    def _insertion_gap(self, x, vtype, slot):
+        rows = np.flatnonzero(self.active & (self.slot == slot))
+        ahead = rows[self.x[rows] >= x]
+        behind = rows[self.x[rows] < x]
+        if len(behind) and (x - vtype['length'] - self.x[behind].max()) < self.minGap[behind].max():
+            return None, 0.0
+        if len(ahead) == 0:
+            return np.inf, 0.0
+        leader = ahead[np.argmin(self.x[ahead])]
+        gap = self.x[leader] - self.length[leader] - x
+        if gap < vtype['minGap']:
+            return None, 0.0
+        return gap, self.v[leader]
+
+    def _add(self, name, route, x, slot, speed, vtype, exit_x):
+        if not self.freeRows:
+            self._grow()
+        row = self.freeRows.pop()
+        self.nameList[row] = name
+        self.routeList[row] = route
+        self.rowDict[name] = row
+        self.active[row] = True
+        self.controlled[row] = False
+        self.x[row] = x
+        self.slot[row] = slot
+        self.y[row] = self.road.y_of_slot(slot)
+        self.v[row] = speed
+        self.accel[row] = vtype['accel']
+        self.decel[row] = vtype['decel']
+        self.maxSpeed[row] = vtype['maxSpeed']
+        self.length[row] = vtype['length']
+        self.minGap[row] = vtype['minGap']
+        self.exitX[row] = exit_x
+        self.nextChange[row] = self.time + self.rng.uniform(0, LANE_CHANGE_PERIOD)
+        self.edgeRow[row] = self.road.edge_row(x)
+
+    def _grow(self):
+        old = self.capacity
+        self.capacity = max(64, 2 * old)
+        for field in ('active', 'controlled', 'x', 'y', 'v', 'accel', 'decel', 'maxSpeed', 'length', 'minGap', 'exitX',
+                      'nextChange', 'slot', 'edgeRow'):
+            array = getattr(self, field)
+            grown = np.zeros(self.capacity, dtype=array.dtype)
+            grown[:old] = array
+            setattr(self, field, grown)
+        self.nameList.extend([None] * (self.capacity - old))
+        self.routeList.extend([None] * (self.capacity - old))
+        self.freeRows.extend(range(self.capacity - 1, old - 1, -1))
+
+    def _remove(self, row):
+        name = self.nameList[row]
+        del self.rowDict[name]
+        self.active[row] = False
+        self.freeRows.append(row)
+        self.subscriptionResults.pop(name, None)
+        self.contextSubscriptionResults.pop(name, None)
+
+    # ---- dynamics ----
+    def simulationStep(self, step=0.0):
+        self.time = round(self.time + self.deltaT, 9)
+        self.stepCount += 1
+        self._apply_moves()
+        self._depart()
+        rows = np.flatnonzero(self.active)
+        if len(rows):
+            self._drive(rows)
+            if self.stepCount % self.laneChangeSteps == 0:
+                self._change_lanes(rows)
+            arrived = rows[self.x[rows] >= self.exitX[rows]]
+            for row in arrived:
+                self._remove(row)
+        self._update_subscriptions()
+
+    def _apply_moves(self):
+        for row, (x, y) in self.moves.items():
+            if not self.active[row]:
+                continue
+            self.v[row] = abs(x - self.x[row]) / self.deltaT
+            self.x[row] = x
+            self.y[row] = y
+            self.edgeRow[row] = edge_row = self.road.edge_row_of(x)
+            self.slot[row] = self.road.slot_of(y, edge_row)
+            self.controlled[row] = True
+        self.moves = {}
+
+    def _leaders(self, rows):  # row of the vehicle ahead in the same slot, -1 if there is none
+        order = rows[np.lexsort((self.x[rows], self.slot[rows]))]
+        leader = np.full(len(order), -1)
+        same = self.slot[order[1:]] == self.slot[order[:-1]]
+        leader[:-1][same] = order[1:][same]
+        result = np.full(self.capacity, -1)
+        result[order] = leader
+        return result
+
+    def _drive(self, rows):
+        free = rows[~self.controlled[rows]]
+        if len(free) == 0:
+            return
+        leader = self._leaders(rows)[free]
+        x = self.x[free]
+        v = self.v[free]
+        edge = self.edgeRow[free]
+        slot = self.slot[free]
+        gap = np.where(leader >= 0, self.x[leader] - self.length[leader] - x, np.inf)
+        leader_speed = np.where(leader >= 0, self.v[leader], 0.0)
+        end_gap = np.where(self.road.drops[edge, slot], self.road.end[edge] - x, np.inf)
+        blocked = end_gap < gap  # the end of a dropping lane acts as a standing leader
+        gap = np.where(blocked, end_gap, gap)
+        leader_speed = np.where(blocked, 0.0, leader_speed)
+        v0 = np.minimum(self.maxSpeed[free], self.road.speed[edge, slot])
+        acc = _idm(v, v0, self.accel[free], self.decel[free], self.minGap[free], gap, leader_speed)
+        v = np.maximum(0.0, v + np.minimum(np.maximum(acc, -MAX_DECEL), self.accel[free]) * self.deltaT)
+        self.v[free] = v
+        self.x[free] = x + v * self.deltaT
+        self.edgeRow[free] = self.road.edge_row(self.x[free])
+
+    def _neighbors_in_slot(self, rows, x, target_slot):
+        """rows of the leader and follower at position x in target_slot, -1 if there is none"""
+        leader = np.full(len(x), -1)
+        follower = np.full(len(x), -1)
+        for slot in np.unique(target_slot):
+            in_slot = rows[self.slot[rows] == slot]
+            order = in_slot[np.argsort(self.x[in_slot])]
+            ask = np.flatnonzero(target_slot == slot)
+            if len(order) == 0:
+                continue
+            position = np.searchsorted(self.x[order], x[ask], side='right')
+            has_leader = position < len(order)
+            leader[ask[has_leader]] = order[position[has_leader]]
+            has_follower = position > 0
+            follower[ask[has_follower]] = order[position[has_follower] - 1]
+        return leader, follower
+
+    def _acceleration_behind(self, rows, x, leader, slot):  # acceleration of rows behind leader in slot
+        gap = np.where(leader >= 0, self.x[leader] - self.length[leader] - x, np.inf)
+        leader_speed = np.where(leader >= 0, self.v[leader], 0.0)
+        v0 = np.minimum(self.maxSpeed[rows], self.road.speed[self.edgeRow[rows], slot])
+        return _idm(self.v[rows], v0, self.accel[rows], self.decel[rows], self.minGap[rows], gap, leader_speed)
+
+    def _change_lanes(self, rows):
+        deciding = rows[~self.controlled[rows] & (self.nextChange[rows] <= self.time)]
+        if len(deciding) == 0:
+            return
+        self.nextChange[deciding] += LANE_CHANGE_PERIOD
+        x = self.x[deciding]
+        edge = self.edgeRow[deciding]
+        slot = self.slot[deciding]
+        near_end = self.road.end[edge] - x < MANDATORY_DISTANCE
+        mandatory = near_end & self.road.drops[edge, slot]
+        current_leader, _ = self._neighbors_in_slot(rows, x, slot)
+        current = self._acceleration_behind(deciding, x, current_leader, slot)
+        best_gain = np.full(len(deciding), -np.inf)
+        best_slot = slot.copy()
+        for direction, bias in ((-1, 0.0), (1, KEEP_RIGHT_BIAS)):  # -1 is left, the slots count from the left
+            target = np.clip(slot + direction, 0, self.road.slotNumber - 1)
+            valid = (target != slot) & self.road.allowed[edge, target] & ~(near_end & self.road.drops[edge, target])
+            if not valid.any():
+                continue
+            leader, follower = self._neighbors_in_slot(rows, x, target)
+            lead_gap = np.where(leader >= 0, self.x[leader] - self.length[leader] - x, np.inf)
+            follow_gap = np.where(follower >= 0, x - self.length[deciding] - self.x[follower], np.inf)
+            safe = (lead_gap > self.minGap[deciding]) & (follow_gap > 0)
+            has_follower = follower >= 0
+            follower_acc = np.zeros(len(deciding))
+            if has_follower.any():
+                f = follower[has_follower]
+                v0 = np.maximum(self.maxSpeed[f], 0.1)
+                follower_acc[has_follower] = _idm(self.v[f], v0, self.accel[f], self.decel[f], self.minGap[f],
+                                                  follow_gap[has_follower], self.v[deciding[has_follower]])
+            safe &= follower_acc > -SAFE_DECEL
+            gain = self._acceleration_behind(deciding, x, leader, target) - current + bias
+            threshold = np.where(mandatory, -np.inf, LANE_CHANGE_THRESHOLD)
+            better = valid & safe & (gain > threshold) & (gain > best_gain)
+            best_gain[better] = gain[better]
+            best_slot[better] = target[better]
+        changed = best_slot != slot
+        rows_changed = deciding[changed]
+        self.slot[rows_changed] = best_slot[changed]
+        self.y[rows_changed] = self.road.y_of_slot(self.slot[rows_changed])
+
+    # ---- subscriptions ----
+    def _value(self, row, variable):
+        if variable == tc.VAR_POSITION:
+            return float(self.x[row]), float(self.y[row])
+        if variable == tc.VAR_SPEED:
+            return float(self.v[row])
+        edge = self.edgeRow[row]
+        if variable == tc.VAR_ROAD_ID:
+            return self.mainLine[edge]
+        if variable == tc.VAR_LANE_INDEX:
+            return int(self.road.laneNumber[edge] - 1 - self.slot[row])
+        if variable == tc.VAR_LANEPOSITION:
+            return float(self.x[row] - self.road.start[edge])
+        if variable == tc.VAR_LANEPOSITION_LAT:
+            return float(self.y[row] - self.road.y_of_slot(self.slot[row]))
+        if variable == tc.VAR_EDGES:
+            return self.routeList[row]
+        if variable == tc.VAR_ANGLE:
+            return 90.0
+        raise NotImplementedError("variable 0x%x is not supported by KinematicSimulation" % variable)
+
+    def _values(self, row, variables):
+        return dict((variable, self._value(row, variable)) for variable in variables)
+
+    def _column(self, rows, variable):  # _value of every row as a list, computed for all rows at once
+        if variable == tc.VAR_POSITION:
+            return list(zip(self.x[rows].tolist(), self.y[rows].tolist()))
+        if variable == tc.VAR_SPEED:
+            return self.v[rows].tolist()
+        edge = self.edgeRow[rows]
+        if variable == tc.VAR_ROAD_ID:
+            return [self.mainLine[e] for e in edge.tolist()]
+        if variable == tc.VAR_LANE_INDEX:
+            return (self.road.laneNumber[edge] - 1 - self.slot[rows]).tolist()
+        if variable == tc.VAR_LANEPOSITION:
+            return (self.x[rows] - self.road.start[edge]).tolist()
+        if variable == tc.VAR_LANEPOSITION_LAT:
+            return (self.y[rows] - self.road.y_of_slot(self.slot[rows])).tolist()
+        if variable == tc.VAR_EDGES:
+            return [self.routeList[row] for row in rows.tolist()]
+        if variable == tc.VAR_ANGLE:
+            return [90.0] * len(rows)
+        raise NotImplementedError("variable 0x%x is not supported by KinematicSimulation" % variable)
+
+    def _update_subscriptions(self):
+        for name, variables in self.subscriptions.items():
+            row = self.rowDict.get(name)
+            if row is not None:
+                self.subscriptionResults[name] = self._values(row, variables)
+        active = np.flatnonzero(self.active)
+        for name, (distance, variables, filters) in self.contextSubscriptions.items():
+            row = self.rowDict.get(name)
+            if row is None:
+                continue
+            if filters:
+                near = self._filtered_context(row, active, distance, filters)
+            else:
+                near = active[(self.x[active] - self.x[row]) ** 2 + (self.y[active] - self.y[row]) ** 2 <= distance ** 2]
+            if len(near) <= 4:  # a handful of vehicles is cheaper one by one
+                self.contextSubscriptionResults[name] = dict((self.nameList[r], self._values(r, variables))
+                                                             for r in near.tolist())
+                continue
+            columns = [self._column(near, variable) for variable in variables]
+            values = [dict(zip(variables, row_values)) for row_values in zip(*columns)] if columns else [{}] * len(near)
+            self.contextSubscriptionResults[name] = dict(zip([self.nameList[r] for r in near.tolist()], values))
+
+    def _filtered_context(self, row, active, distance, filters):
+        """rows of a context subscription with filters, the way sumo applies them on a straight road: the
+        distances are taken along x, lane offsets are counted to the left and default to the ego lane"""
+        dx = self.x[active] - self.x[row]
+        offset = self.slot[row] - self.slot[active]  # slots are counted from the left
+        keep = ((dx <= filters.get('downstream', distance)) & (dx >= -filters.get('upstream', distance)) &
+                np.isin(offset, filters.get('lanes', (0,))))
+        if not filters.get('lead_follow'):
+            return active[keep]
+        keep &= active != row  # sumo leaves the ego out of the lead/follow result
+        near = []
+        for lane in np.unique(offset[keep]):
+            lane_rows = np.flatnonzero(keep & (offset == lane))
+            ahead = lane_rows[dx[lane_rows] >= 0]
+            behind = lane_rows[dx[lane_rows] < 0]
+            if len(ahead):
+                near.append(active[ahead[np.argmin(dx[ahead])]])
+            if len(behind):
+                near.append(active[behind[np.argmax(dx[behind])]])
+        return np.array(near, dtype=int)
+
+    def get_min_expected_number(self):
+        if self.endTime is not None and self.time >= self.endTime:
+            return 0
+        return (int(self.active.sum()) + len(self.pending) + len(self.departures) +
+                sum(1 for flow in self.flows if self.time < flow['end']))
+
+
+class _VehicleDomain:
+    def __init__(self, sim):
+        self.sim = sim
+        self.lastContext = None  # vehicle whose context subscription the filters go to
+
+    def subscribe(self, vehicle_id, variables):
+        # like in sumo subscribing a vehicle again adds the variables to its subscription, e.g. an ego that is
+        # the gap vehicle of another ego keeps its own variables
+        current = self.sim.subscriptions.get(vehicle_id, ())
+        self.sim.subscriptions[vehicle_id] = current + tuple(variable for variable in variables
+                                                             if variable not in current)
+        self.sim._update_subscriptions()
+
+    def subscribeContext(self, vehicle_id, domain, dist, variables):
+        # like in sumo the filters of an earlier subscription stay until they are set again
+        filters = self.sim.contextSubscriptions.get(vehicle_id, (None, None, {}))[2]
+        self.sim.contextSubscriptions[vehicle_id] = (dist, tuple(variables), filters)
+        self.lastContext = vehicle_id
+        self.sim._update_subscriptions()
+
+    def _add_filter(self, **filters):  # to the last context subscription
+        self.sim.contextSubscriptions[self.lastContext][2].update(filters)
+        self.sim._update_subscriptions()
+
+    def addSubscriptionFilterLanes(self, lanes, noOpposite=False, downstreamDist=None, upstreamDist=None):
+        self._add_filter(lanes=tuple(lanes))
+        if downstreamDist is not None:
+            self._add_filter(downstream=downstreamDist)
+        if upstreamDist is not None:
+            self._add_filter(upstream=upstreamDist)
+
+    def addSubscriptionFilterLeadFollow(self, lanes):
+        self._add_filter(lanes=tuple(lanes), lead_follow=True)
+
+    def addSubscriptionFilterDownstreamDistance(self, dist):
+        self._add_filter(downstream=dist)
+
+    def addSubscriptionFilterUpstreamDistance(self, dist):
+        self._add_filter(upstream=dist)
+
+    def unsubscribe(self, vehicle_id):
+        self.sim.subscriptions.pop(vehicle_id, None)
+        self.sim.subscriptionResults.pop(vehicle_id, None)
+
+    def unsubscribeContext(self, vehicle_id, domain, dist):
+        self.sim.contextSubscriptions.pop(vehicle_id, None)
+        self.sim.contextSubscriptionResults.pop(vehicle_id, None)
+
+    def getSubscriptionResults(self, vehicle_id):
+        return self.sim.subscriptionResults.get(vehicle_id, {})
+
+    def getContextSubscriptionResults(self, vehicle_id):
+        return self.sim.contextSubscriptionResults.get(vehicle_id, {})
+
+    def moveToXY(self, vehicle_id, edge_id, lane, x, y, angle=tc.INVALID_DOUBLE_VALUE, keepRoute=1, matchThreshold=100):
+        self.sim.moves[self.sim.rowDict[vehicle_id]] = (x, y)
+
+    def getIDList(self):
+        return [self.sim.nameList[row] for row in np.flatnonzero(self.sim.active)]
+
+    def getIDCount(self):
+        return int(self.sim.active.sum())
+
+    def getPosition(self, vehicle_id):
+        return self.sim._value(self.sim.rowDict[vehicle_id], tc.VAR_POSITION)
+
+    def getSpeed(self, vehicle_id):
+        return self.sim._value(self.sim.rowDict[vehicle_id], tc.VAR_SPEED)
+
+    def getRoadID(self, vehicle_id):
+        return self.sim._value(self.sim.rowDict[vehicle_id], tc.VAR_ROAD_ID)
+
+    def getLaneIndex(self, vehicle_id):
+        return self.sim._value(self.sim.rowDict[vehicle_id], tc.VAR_LANE_INDEX)
+
+    def getRoute(self, vehicle_id):
+        return self.sim._value(self.sim.rowDict[vehicle_id], tc.VAR_EDGES)
+
+
+class _EdgeDomain:
+    def __init__(self, sim):
+        self.sim = sim
+
+    def getIDList(self):
+        return self.sim.network.get_edge_id_list()
+
+    def getLaneNumber(self, edge_id):
+        return self.sim.network.get_lane_number(edge_id)
+
+
+class _LaneDomain:
+    def __init__(self, sim):
+        self.sim = sim
+
+    def getLength(self, lane_id):
+        return self.sim.network.get_lane_length(lane_id)
+
+    def getMaxSpeed(self, lane_id):
+        return self.sim.network.get_lane_max_speed(lane_id)
+
+
+class _SimulationDomain:
+    def __init__(self, sim):
+        self.sim = sim
+
+    def getTime(self):
+        return self.sim.time
+
+    def getDeltaT(self):
+        return self.sim.deltaT
+
+    def getMinExpectedNumber(self):
+        return self.sim.get_min_expected_number()
+
+    def subscribe(self, variables):
+        self.sim.simulationSubscription = tuple(variables)
+
+    def getSubscriptionResults(self):
+        result = {}
+        for variable in self.sim.simulationSubscription:
+            if variable == tc.VAR_MIN_EXPECTED_VEHICLES:
+                result[variable] = self.sim.get_min_expected_number()
+            elif variable == tc.VAR_TIME:
+                result[variable] = self.sim.time
+        return result
+
+
+def _read_config(config_file):
+    config_dir = os.path.dirname(os.path.abspath(config_file))
+    root = ET.parse(config_file).getroot()
+
+    def value(path, default=None):
+        elem = root.find(path)
+        return default if elem is None else elem.get('value')
+    end = value('time/end')
+    return {'net': os.path.join(config_dir, value('input/net-file')),
+            'routes': [os.path.join(config_dir, path) for path in value('input/route-files', '').split(',') if path],
+            'step': float(value('time/step-length', 1.0)),
+            'begin': float(value('time/begin', 0.0)),
+            'end': None if end is None else float(end)}
@@ -0,0 +1,144 @@
+# coding:utf-8
+import os
+import sys
+
+# we need to import python modules from the $SUMO_HOME/tools directory
+if 'SUMO_HOME' in os.environ:
+    tools = os.path.join(os.environ['SUMO_HOME'], 'tools')
+    sys.path.append(tools)
+else:
+    sys.exit("please declare environment variable 'SUMO_HOME'")
+
+from sumolib import checkBinary  # noqa
+import traci  # noqa
+import traci.constants as tc
+from egoVehicle import EgoVehicle, NO_ACTION, LANE_KEEP, CHANGE_LEFT, CHANGE_RIGHT, ACTION_NUMBER  # noqa, actions of step()
+from roadNetwork import RoadNetwork
+from surrounding import Traffic
+from RL_brain import BatchDataProcess
+from warmStart import SnapshotCache
+from scenarioGenerator import ScenarioCache, scenario_params
+
+
+def progress_reward(ego_vehicle):
+    return ego_vehicle.get_speed() / (120 / 3.6)
+
+
+class LaneChangeEnv:
+    """reset()/step(action) episodes around EgoVehicle, Surrounding and DataProcess
+
+    The SUMO process is started on the first reset() and reused afterwards, later episodes are
+    started with traci.load, the ego subscriptions are re-applied when the ego vehicle is created.
+    simulation (kinematicSim.KinematicSimulation) is loaded in place of SUMO.
+    """
+    def __init__(self, sumo_binary='sumo', config_file='data/motorway.sumocfg', net_file='data/motorway.net.xml',
+                 traffic_base=0.4, traffic_list=None, regenerate_traffic=True, ego_id='ego', ego_start_step=1001,
+                 max_steps=3000, seed=0, label='default', columnar=False, reward_function=progress_reward,
+                 data_process=None, env_index=0, warm_start=False, snapshot_dir=None, random_scenarios=False,
+                 perception_interval=0.0, context_filter=None, simulation=None):
+        self.sumoBinary = sumo_binary
+        self.configFile = config_file
+        self.network = RoadNetwork(net_file)
+        self.trafficBase = traffic_base
+        self.trafficList = traffic_list
+        self.regenerateTraffic = regenerate_traffic
+        # every episode gets the cached random scenario of its seed instead of the route file of the config
+        self.scenarioCache = ScenarioCache() if random_scenarios else None
+        self.routeFile = None
+        self.egoId = ego_id
+        self.egoStartStep = ego_start_step
+        self.maxSteps = max_steps
+        self.seed = seed
+        self.label = label
+        self.columnar = columnar
+        self.perceptionInterval = perception_interval  # seconds between two perception updates of the ego
+        self.contextFilter = context_filter  # surrounding.ContextFilter of the ego context subscription
+        self.rewardFunction = reward_function
+        self.warmStart = warm_start  # restore the state after the pre-roll instead of simulating it again
+        self.snapshotCache = None
+        if warm_start:
+            self.snapshotCache = SnapshotCache() if snapshot_dir is None else SnapshotCache(snapshot_dir)
+        self.simulation = simulation
+        self.connection = None
+        self.egoVehicle = None
+        self.dataProcess = BatchDataProcess(1) if data_process is None else data_process  # may be shared by envs
+        self.envIndex = env_index  # row of this env in dataProcess
+        self.episode = 0
+        self.stepCount = 0
+
+    def _sumo_args(self):
+        args = ["-c", self.configFile, "--seed", str(self.seed + self.episode), "--no-step-log", "--no-warnings"]
+        if self.routeFile is not None:
+            args += ["--route-files", self.routeFile]
+        if self.warmStart:  # the default precision saves the maxSpeed of pkw_special as 0.00, which can't be loaded
+            args += ["--save-state.precision", "8"]
+        return args
+
+    def _load(self):
+        if self.scenarioCache is not None:
+            self.routeFile = self.scenarioCache.get(scenario_params(self.trafficBase, self.seed + self.episode))
+        elif self.regenerateTraffic:
+            Traffic(trafficBase=self.trafficBase, trafficList=self.trafficList)
+        if self.connection is None and self.simulation is not None:
+            self.connection = self.simulation
+        if self.connection is None:
+            traci.start([checkBinary(self.sumoBinary)] + self._sumo_args(), label=self.label)
+            self.connection = traci.getConnection(self.label)
+        else:
+            self.connection.load(self._sumo_args())
+
+    def _pre_roll(self):
+        for i in range(self.egoStartStep):
+            self.connection.simulationStep()
+
+    def _warm_start(self):
+        # the rng of the episode seed is not part of the state, episodes still diverge after the restore
+        key = self.snapshotCache.key(self.configFile, {'base': self.trafficBase, 'list': self.trafficList,
+                                                       'routes': self.routeFile}, self.seed, self.egoStartStep)
+        if self.snapshotCache.has(key):
+            self.snapshotCache.restore(self.connection, key)
+        else:
+            self._pre_roll()
+            self.snapshotCache.save(self.connection, key)
+
+    def reset(self):
+        self._load()
+        if self.warmStart:
+            self._warm_start()
+        else:
+            self._pre_roll()
+        # delivered with every simulationStep, saves a getMinExpectedNumber round-trip per step, subscribed after
+        # the pre-roll since loadState drops the subscriptions
+        self.connection.simulation.subscribe((tc.VAR_MIN_EXPECTED_VEHICLES,))
+        self.episode += 1
+        self.stepCount = 0
+        # a new EgoVehicle subscribes again, subscriptions do not survive traci.load or a restored state
+        self.egoVehicle = EgoVehicle(self.egoId, network=self.network, columnar=self.columnar,
+                                     connection=self.connection, perception_interval=self.perceptionInterval,
+                                     context_filter=self.contextFilter)
+        self.egoVehicle.fresh_data()
+        return self._observe()
+
+    def step(self, action):
+        self._apply_action(action)
+        self.egoVehicle.drive()
+        self.connection.simulationStep()
+        self.stepCount += 1
+        if not self.connection.vehicle.getSubscriptionResults(self.egoId):  # ego has left the simulation
+            return self.dataProcess.get_env_observation(self.envIndex), 0.0, True, {'step': self.stepCount}
+        self.egoVehicle.fresh_data()
+        done = (self.stepCount >= self.maxSteps or
+                self.connection.simulation.getSubscriptionResults()[tc.VAR_MIN_EXPECTED_VEHICLES] <= 0)
+        return self._observe(), self.rewardFunction(self.egoVehicle), done, {'step': self.stepCount}
+
+    def _observe(self):
+        self.dataProcess.set_surrounding_data(self.envIndex, self.egoVehicle.surroundings, self.egoVehicle.get_speed())
+        return self.dataProcess.get_env_observation(self.envIndex)
+
+    def _apply_action(self, action):
+        self.egoVehicle.apply_action(action)
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
@@ -0,0 +1,196 @@
+# coding:utf-8
+import bisect
+import operator
+import numpy as np
+import traci.constants as tc
+
+LEFT = -1
+MID = 0
+RIGHT = 1
+
+
+class NeighborTable:
+    """columnar view of one context subscription result, one row per vehicle"""
+    def __init__(self):
+        self.size = 0
+        self.nameList = []
+        self.edgeList = []
+        self.edgesList = []
+        self.positionX = np.zeros(0)
+        self.positionY = np.zeros(0)
+        self.relativePositionX = np.zeros(0)
+        self.relativePositionY = np.zeros(0)
+        self.speed = np.zeros(0)
+        self.laneIndex = np.zeros(0, dtype=int)
+        self.laneNumber = np.zeros(0, dtype=int)
+        self.lanePosition = np.zeros(0)
+        self.lanePositionLat = np.zeros(0)
+        self.dictList = []
+
+    def clear(self):
+        self.fill({}, {}, 0, 0)
+
+    def fill(self, neighbor_dict, lane_number_dict, x, y):
+        values = list(neighbor_dict.values())
+        self.size = len(values)
+        self.nameList = list(neighbor_dict.keys())
+        self.edgeList = [value[tc.VAR_ROAD_ID] for value in values]
+        self.edgesList = [value[tc.VAR_EDGES] for value in values]
+        position = np.array([value[tc.VAR_POSITION] for value in values], dtype=float).reshape(-1, 2)
+        self.positionX = position[:, 0]
+        self.positionY = position[:, 1]
+        self.relativePositionX = self.positionX - x
+        self.relativePositionY = self.positionY - y
+        self.speed = np.fromiter((value[tc.VAR_SPEED] for value in values), float, self.size)
+        self.laneIndex = np.fromiter((value[tc.VAR_LANE_INDEX] for value in values), int, self.size)
+        self.laneNumber = np.fromiter((lane_number_dict[edge] for edge in self.edgeList), int, self.size)
+        self.lanePosition = np.fromiter((value[tc.VAR_LANEPOSITION] for value in values), float, self.size)
+        self.lanePositionLat = np.fromiter((value[tc.VAR_LANEPOSITION_LAT] for value in values), float, self.size)
+        self.dictList = [None] * self.size
+
+    def lane_offset(self, lane_number, lane_index):  # -1 left, 0 same lane, 1 right of the given lane
+        return (self.laneNumber - self.laneIndex) - (lane_number - lane_index)
+
+    def classify(self, lane_number, lane_index):
+        """row indices of the (leader, follower) vehicles in the left, mid and right lane, nearest first"""
+        offset = self.lane_offset(lane_number, lane_index)
+        leader = self.relativePositionX > 0
+        follower = self.relativePositionX < 0
+        rows = {}
+        for lane in (LEFT, MID, RIGHT):
+            in_lane = offset == lane
+            leader_rows = np.flatnonzero(in_lane & leader)
+            follower_rows = np.flatnonzero(in_lane & follower)
+            leader_rows = leader_rows[np.argsort(self.relativePositionX[leader_rows], kind='stable')]
+            follower_rows = follower_rows[np.argsort(-self.relativePositionX[follower_rows], kind='stable')]
+            rows[lane] = (leader_rows, follower_rows)
+        return rows
+
+    def get_dict(self, row):  # the dict is built once per fill and shared by all lists that hold the row
+        vehicle = self.dictList[row]
+        if vehicle is None:
+            relative_x = float(self.relativePositionX[row])
+            vehicle = {'name': self.nameList[row],
+                       'position_x': float(self.positionX[row]),
+                       'position_y': float(self.positionY[row]),
+                       'relative_position_x': relative_x,
+                       'relative_position_y': float(self.relativePositionY[row]),
+                       'speed': float(self.speed[row]),
+                       'edge': self.edgeList[row],
+                       'edges': self.edgesList[row],
+                       'lane_index': int(self.laneIndex[row]),
+                       'lane_number': int(self.laneNumber[row]),
+                       'lane_position': float(self.lanePosition[row]),
+                       'lane_position_lat': float(self.lanePositionLat[row]),
+                       'relative_lane_position': relative_x,
+                       'relative_lane_position_abs': abs(relative_x)}
+            self.dictList[row] = vehicle
+        return vehicle
+
+    def get_dict_list(self, rows):
+        return [self.get_dict(row) for row in rows]
+
+
+class NeighborListView:
+    """read-only list of neighbor dicts, the dicts are only built when they are read"""
+    def __init__(self, table):
+        self.table = table
+
+    def __len__(self):
+        return self.table.size
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return self.table.get_dict_list(range(self.table.size)[item])
+        if item < 0:
+            item += self.table.size
+        if not 0 <= item < self.table.size:
+            raise IndexError("neighbor index out of range")
+        return self.table.get_dict(item)
+
+    def __iter__(self):
+        for row in range(self.table.size):
+            yield self.table.get_dict(row)
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+class NeighborIndex:
+    """neighbor dicts per lane in longitudinal order, queried by bisect in O(log n)
+
+    Lanes are keyed by lane_number - lane_index, 1 is the leftmost lane of the edge. The lanes are
+    rebuilt once per step by grouping and one list sort per lane, all lists handed out by the
+    queries share that order, so nothing downstream has to sort again.
+    """
+    def __init__(self):
+        self.laneDict = {}  # lane key -> vehicle dicts sorted by position_x
+        self.positionDict = {}  # lane key -> their position_x, for bisect
+
+    def update(self, vehicle_list):
+        lane_dict = {}
+        for vehicle in vehicle_list:
+            lane = vehicle['lane_number'] - vehicle['lane_index']
+            lane_list = lane_dict.get(lane)
+            if lane_list is None:
+                lane_dict[lane] = [vehicle]
+            else:
+                lane_list.append(vehicle)
+        key_x = operator.itemgetter('position_x')
+        position_dict = {}
+        for lane, lane_list in lane_dict.items():
+            lane_list.sort(key=key_x)
+            position_dict[lane] = list(map(key_x, lane_list))
+        self.laneDict = lane_dict
+        self.positionDict = position_dict
+
+    def leaders(self, lane, x):
+        """vehicles ahead of x in the lane, nearest first"""
+        position = self.positionDict.get(lane)
+        if position is None:
+            return []
+        return self.laneDict[lane][bisect.bisect_right(position, x):]
+
+    def followers(self, lane, x):
+        """vehicles behind x in the lane, nearest first"""
+        position = self.positionDict.get(lane)
+        if position is None:
+            return []
+        i = bisect.bisect_left(position, x)
+        return self.laneDict[lane][i - 1::-1] if i > 0 else []
+
+    def nearest_leader(self, lane, x):
+        position = self.positionDict.get(lane)
+        if position is None:
+            return None
+        i = bisect.bisect_right(position, x)
+        return self.laneDict[lane][i] if i < len(position) else None
+
+    def nearest_follower(self, lane, x):
+        position = self.positionDict.get(lane)
+        if position is None:
+            return None
+        i = bisect.bisect_left(position, x)
+        return self.laneDict[lane][i - 1] if i > 0 else None
+
+    def gap(self, lane, x):
+        """(follower, leader) around x in the lane, None where there is no vehicle"""
+        return self.nearest_follower(lane, x), self.nearest_leader(lane, x)
+
+    def k_nearest(self, lane, x, k):
+        """the k vehicles of the lane closest to x, nearest first, by merging outwards from x"""
+        position = self.positionDict.get(lane)
+        if position is None:
+            return []
+        vehicles = self.laneDict[lane]
+        behind = bisect.bisect_left(position, x) - 1
+        ahead = behind + 1
+        result = []
+        while len(result) < k and (behind >= 0 or ahead < len(position)):
+            if ahead < len(position) and (behind < 0 or position[ahead] - x <= x - position[behind]):
+                result.append(vehicles[ahead])
+                ahead += 1
+            else:
+                result.append(vehicles[behind])
+                behind -= 1
+        return result
@@ -0,0 +1,164 @@
+# coding:utf-8
+import numpy as np
+from RL_brain import BatchDataProcess, LANE_NUMBER, VEHICLE_DATA_SIZE
+
+OBSERVATION_SIZE = LANE_NUMBER * VEHICLE_DATA_SIZE
+ACTIVATIONS = ('relu', 'tanh')
+INT8_MAX = 127
+# int8 x int8 sums stay exact in float32 below 2 ** 24, the accumulation then runs on BLAS
+EXACT_FLOAT32_INPUTS = 2 ** 24 // (INT8_MAX * INT8_MAX)
+
+
+def save_weights(path, weights, biases, activation='relu', observation_mean=None, observation_std=None,
+                 quantize=None):
+    """write an MLP in the .npz layout PolicyEngine.load reads
+
+    weights[i] has the shape (inputs, outputs) of layer i, the first layer takes the flattened
+    (LANE_NUMBER, VEHICLE_DATA_SIZE) observation, the last one gives one Q-value per action.
+    quantize='int8' stores the weights as int8 with one float32 scale per output.
+    """
+    arrays = {'activation': np.array(activation)}
+    for i, (weight, bias) in enumerate(zip(weights, biases)):
+        weight = np.asarray(weight, dtype=np.float32)
+        if quantize == 'int8':
+            weight, scale = quantize_int8(weight)
+            arrays['scale%d' % i] = scale
+        arrays['w%d' % i] = weight
+        arrays['b%d' % i] = np.asarray(bias, dtype=np.float32)
+    if observation_mean is not None:
+        arrays['observation_mean'] = np.asarray(observation_mean, dtype=np.float32).reshape(OBSERVATION_SIZE)
+        arrays['observation_std'] = np.asarray(observation_std, dtype=np.float32).reshape(OBSERVATION_SIZE)
+    np.savez(path, **arrays)
+
+
+def quantize_int8(weight):
+    """(int8 weight, float32 scale per output column), symmetric, weight ~ int8 weight * scale"""
+    scale = np.abs(weight).max(axis=0) / INT8_MAX
+    scale[scale == 0] = 1.0
+    return np.round(weight / scale).astype(np.int8), scale.astype(np.float32)
+
+
+class PolicyEngine:
+    """batched forward passes of an MLP/DQN over DataProcess observations, NumPy only
+
+    The layers are (weight, bias) pairs. Every layer is a single matmul into a preallocated buffer:
+    the bias is the last row of the weight matrix and every activation buffer ends with a column of
+    ones, the activation function then writes in place into the input buffer of the next layer. The
+    observation normalization is folded into the first layer at load time.
+
+    dtype='int8' runs the layers on int8 weights with per-output scales and activations quantized per
+    row. The integer products are accumulated exactly, in float32 matmuls as long as a layer has fewer
+    than EXACT_FLOAT32_INPUTS inputs and in int32 otherwise, so the results match an int8 deployment.
+    """
+    def __init__(self, weights, biases, activation='relu', observation_mean=None, observation_std=None,
+                 dtype='float32', max_batch=64):
+        if activation not in ACTIVATIONS:
+            raise ValueError("activation must be one of %s, not %r" % (', '.join(ACTIVATIONS), activation))
+        if dtype not in ('float32', 'int8'):
+            raise ValueError("dtype must be 'float32' or 'int8', not %r" % dtype)
+        weights = [np.asarray(weight, dtype=np.float64) for weight in weights]
+        biases = [np.asarray(bias, dtype=np.float64) for bias in biases]
+        if weights[0].shape[0] != OBSERVATION_SIZE:
+            raise ValueError("the first layer takes %d inputs, the observation has %d"
+                             % (weights[0].shape[0], OBSERVATION_SIZE))
+        if observation_mean is not None:  # (x - mean) / std @ w + b = x @ (w / std) + (b - (mean / std) @ w)
+            std = np.asarray(observation_std, dtype=np.float64).reshape(OBSERVATION_SIZE)
+            mean = np.asarray(observation_mean, dtype=np.float64).reshape(OBSERVATION_SIZE)
+            biases[0] = biases[0] - (mean / std) @ weights[0]
+            weights[0] = weights[0] / std[:, None]
+        self.activation = activation
+        self.dtype = dtype
+        self.actionNumber = weights[-1].shape[1]
+        # (weight with the bias as last row, None, None) or (int8 weight, its scales, bias) per layer
+        self.layerList = []
+        for weight, bias in zip(weights, biases):
+            fused = np.vstack([weight, bias[None, :]]).astype(np.float32)
+            if dtype == 'int8':
+                # the bias row stays float, it is added after the int32 accumulation
+                weight_int8, scale = quantize_int8(fused[:-1])
+                accumulate = np.float32 if len(weight_int8) < EXACT_FLOAT32_INPUTS else np.int32
+                self.layerList.append((weight_int8.astype(accumulate), scale, fused[-1]))
+            else:
+                self.layerList.append((fused, None, None))
+        self.maxBatch = 0
+        self.dataProcess = BatchDataProcess(1)  # observation buffer of decide()
+        self._allocate(max_batch)
+
+    @classmethod
+    def load(cls, path, dtype=None, max_batch=64):
+        """engine of an .npz written by save_weights, dtype defaults to the dtype the weights are stored in"""
+        with np.load(path) as arrays:
+            weights, biases = [], []
+            while 'w%d' % len(weights) in arrays:
+                i = len(weights)
+                weight = arrays['w%d' % i]
+                if weight.dtype == np.int8:
+                    dtype = 'int8' if dtype is None else dtype
+                    weight = weight * arrays['scale%d' % i]
+                weights.append(weight)
+                biases.append(arrays['b%d' % i])
+            activation = str(arrays['activation']) if 'activation' in arrays else 'relu'
+            mean = arrays['observation_mean'] if 'observation_mean' in arrays else None
+            std = arrays['observation_std'] if 'observation_std' in arrays else None
+        return cls(weights, biases, activation, mean, std, dtype or 'float32', max_batch)
+
+    def _allocate(self, max_batch):
+        """buffers for max_batch observations: the input of every layer, with a last column of ones for the
+        bias, and the contiguous matmul output of every layer"""
+        self.maxBatch = max_batch
+        self.inputList = []
+        self.preActivationList = []
+        for weight, scale, bias in self.layerList:
+            buffer = np.empty((max_batch, weight.shape[0] + (0 if scale is None else 1)), dtype=np.float32)
+            buffer[:, -1] = 1.0
+            self.inputList.append(buffer)
+            self.preActivationList.append(np.empty((max_batch, weight.shape[1]), dtype=np.float32))
+        if self.dtype == 'int8':
+            self.quantizedList = [np.empty((max_batch, weight.shape[0]), dtype=weight.dtype)
+                                  for weight, scale, bias in self.layerList]
+            self.accumulatorList = [np.empty((max_batch, weight.shape[1]), dtype=weight.dtype)
+                                    for weight, scale, bias in self.layerList]
+
+    def forward(self, observation):
+        """Q-values of a (n, LANE_NUMBER, VEHICLE_DATA_SIZE) or single observation, a view of the output buffer
+
+        The result is overwritten by the next call.
+        """
+        observation = np.asarray(observation)
+        n = 1 if observation.ndim == 2 else len(observation)
+        if n > self.maxBatch:
+            self._allocate(max(n, 2 * self.maxBatch))
+        self.inputList[0][:n, :OBSERVATION_SIZE] = observation.reshape(n, OBSERVATION_SIZE)
+        last = len(self.layerList) - 1
+        for i, (weight, scale, bias) in enumerate(self.layerList):
+            out = self.preActivationList[i][:n]
+            if scale is None:
+                np.matmul(self.inputList[i][:n], weight, out=out)
+            else:
+                self._int8_layer(i, n, weight, scale, bias, out)
+            if i != last:
+                if self.activation == 'relu':
+                    np.maximum(out, 0.0, out=self.inputList[i + 1][:n, :-1])
+                else:
+                    np.tanh(out, out=self.inputList[i + 1][:n, :-1])
+        return self.preActivationList[last][:n]
+
+    def _int8_layer(self, i, n, weight, scale, bias, out):
+        x = self.inputList[i][:n, :-1]
+        x_scale = np.abs(x).max(axis=1) / INT8_MAX
+        x_scale[x_scale == 0] = 1.0
+        quantized = self.quantizedList[i][:n]
+        np.rint(x / x_scale[:, None], out=quantized, casting='unsafe')
+        accumulator = self.accumulatorList[i][:n]
+        np.matmul(quantized, weight, out=accumulator)
+        np.multiply(accumulator, x_scale[:, None] * scale, out=out)
+        out += bias
+
+    def act(self, observation):
+        """greedy action of every observation"""
+        return self.forward(observation).argmax(axis=1)
+
+    def decide(self, ego_vehicle):
+        """greedy action for the current surroundings of an EgoVehicle"""
+        self.dataProcess.set_surrounding_data(0, ego_vehicle.surroundings, ego_vehicle.get_speed())
+        return int(self.forward(self.dataProcess.get_env_observation(0))[0].argmax())
@@ -0,0 +1,132 @@
+# coding:utf-8
+import os
+import sys
+import json
+import shutil
+import hashlib
+import tempfile
+import xml.etree.ElementTree as ET
+import numpy as np
+
+CACHE_VERSION = 2
+CACHE_DIR_NAME = '.netcache'
+
+
+def file_hash(path):
+    sha = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def _parse_shape(shape):
+    return [tuple(float(v) for v in point.split(',')[:2]) for point in shape.split()]
+
+
+def compile_network(net_file, cache_path):
+    """stream-parse a SUMO .net.xml and write the binary cache into cache_path"""
+    edges = []  # (id, first lane row, lane number, internal, from node, to node)
+    lanes = []  # (id, edge row, index, length, speed, passenger allowed, first shape row, shape point number)
+    points = []
+    edge_lanes = None
+    for event, elem in ET.iterparse(net_file, events=('start', 'end')):
+        if elem.tag == 'edge':
+            if event == 'start':
+                edge_lanes = []
+            else:
+                edges.append((elem.get('id'), len(lanes), len(edge_lanes), elem.get('function') == 'internal',
+                              elem.get('from', ''), elem.get('to', '')))
+                edge_lanes.sort(key=lambda lane: lane[2])
+                lanes.extend(edge_lanes)
+                edge_lanes = None
+                elem.clear()
+        elif elem.tag == 'lane' and event == 'end' and edge_lanes is not None:
+            shape = _parse_shape(elem.get('shape', ''))
+            passenger = ('passenger' in elem.get('allow', 'passenger').split() and
+                         'passenger' not in elem.get('disallow', '').split())
+            edge_lanes.append((elem.get('id'), len(edges), int(elem.get('index')), float(elem.get('length')),
+                               float(elem.get('speed')), passenger, len(points), len(shape)))
+            points.extend(shape)
+        elif event == 'end' and elem.tag not in ('lane', 'edge'):
+            elem.clear()
+
+    id_len = max([len(e[0]) for e in edges] + [len(e[4]) for e in edges] + [len(e[5]) for e in edges] +
+                 [len(l[0]) for l in lanes] + [1])
+    edge_array = np.array(edges, dtype=[('id', 'U%d' % id_len), ('lane_start', 'i4'), ('lane_number', 'i4'),
+                                        ('internal', '?'), ('from', 'U%d' % id_len), ('to', 'U%d' % id_len)])
+    lane_array = np.array(lanes, dtype=[('id', 'U%d' % id_len), ('edge', 'i4'), ('index', 'i4'), ('length', 'f8'),
+                                        ('speed', 'f8'), ('passenger', '?'), ('shape_start', 'i4'),
+                                        ('shape_number', 'i4')])
+    shape_array = np.array(points, dtype='f8').reshape(-1, 2)
+
+    # written to a temporary directory first so that concurrent workers never see half a cache
+    parent = os.path.dirname(cache_path)
+    os.makedirs(parent, exist_ok=True)
+    tmp_path = tempfile.mkdtemp(dir=parent)
+    np.save(os.path.join(tmp_path, 'edges.npy'), edge_array)
+    np.save(os.path.join(tmp_path, 'lanes.npy'), lane_array)
+    np.save(os.path.join(tmp_path, 'shapes.npy'), shape_array)
+    with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+        json.dump({'version': CACHE_VERSION, 'source': os.path.abspath(net_file)}, f)
+    try:
+        os.rename(tmp_path, cache_path)
+    except OSError:  # another process finished the same cache first
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+
+class RoadNetwork:
+    def __init__(self, net_file, cache_dir=None):
+        self.netFile = net_file
+        if cache_dir is None:
+            cache_dir = os.path.join(os.path.dirname(os.path.abspath(net_file)), CACHE_DIR_NAME)
+        self.hash = file_hash(net_file)
+        self.cachePath = os.path.join(cache_dir, '%s-%s-v%d' % (os.path.basename(net_file), self.hash[:16],
+                                                                  CACHE_VERSION))
+        if not os.path.isdir(self.cachePath):
+            compile_network(net_file, self.cachePath)
+        self.edges = np.load(os.path.join(self.cachePath, 'edges.npy'), mmap_mode='r')
+        self.lanes = np.load(os.path.join(self.cachePath, 'lanes.npy'), mmap_mode='r')
+        self.shapes = np.load(os.path.join(self.cachePath, 'shapes.npy'), mmap_mode='r')
+        self.edgeIdList = [str(edge_id) for edge_id in self.edges['id']]
+        self.laneNumberDict = dict(zip(self.edgeIdList, self.edges['lane_number'].tolist()))
+        self.edgeRowDict = dict(zip(self.edgeIdList, range(len(self.edgeIdList))))
+        self.laneRowDict = dict(zip([str(lane_id) for lane_id in self.lanes['id']], range(len(self.lanes))))
+        self.laneLengthList = self.lanes['length'].tolist()
+        self.laneMaxSpeedList = self.lanes['speed'].tolist()
+
+    def get_edge_id_list(self):
+        return self.edgeIdList
+
+    def get_lane_number_dict(self):
+        return self.laneNumberDict
+
+    def get_lane_number(self, edge_id):
+        return self.laneNumberDict[edge_id]
+
+    def is_internal(self, edge_id):
+        return bool(self.edges['internal'][self.edgeRowDict[edge_id]])
+
+    def get_edge_nodes(self, edge_id):  # (from node, to node)
+        edge = self.edges[self.edgeRowDict[edge_id]]
+        return str(edge['from']), str(edge['to'])
+
+    def get_lane_allows_passenger(self, lane_id):
+        return bool(self.lanes['passenger'][self.laneRowDict[lane_id]])
+
+    def get_lane_length(self, lane_id):
+        return self.laneLengthList[self.laneRowDict[lane_id]]
+
+    def get_lane_max_speed(self, lane_id):
+        return self.laneMaxSpeedList[self.laneRowDict[lane_id]]
+
+    def get_lane_shape(self, lane_id):
+        lane = self.lanes[self.laneRowDict[lane_id]]
+        return self.shapes[lane['shape_start']:lane['shape_start'] + lane['shape_number']]
+
+
+if __name__ == "__main__":
+    # compile the caches ahead of time, e.g. python roadNetwork.py data/motorway.net.xml back_data/highway.net.xml
+    for path in sys.argv[1:] or ['data/motorway.net.xml', 'back_data/highway.net.xml']:
+        network = RoadNetwork(path)
+        print("%s: %d edges, %d lanes -> %s" % (path, len(network.edges), len(network.lanes), network.cachePath))
@@ -36,34 +36,56 @@ else:
 from sumolib import checkBinary  # noqa
 import traci  # noqa
 import traci.constants as tc
-from egoVehicle import EgoVehicle
-from surrounding import Surrounding
+from egoGroup import EgoGroup
+from egoFleet import EgoFleet
+from surrounding import Surrounding, ContextFilter
 from surrounding import Traffic
 from  RL_brain import DataProcess
+from roadNetwork import RoadNetwork
+from traciProfiler import TraciProfiler
+from episodeTrace import TraceRecorder
+from kinematicSim import KinematicSimulation
+from telemetry import TelemetryLogger, LEVEL_OFF
+from policyEngine import PolicyEngine
 
 # surroundings = Surrounding("ego")
 # data_process = DataProcess()
 
 
-def run():
-    """execute the TraCI control loop"""
+def run(network=None, connection=None, recorder=None, ego_ids=('ego',), perception_interval=0.0, telemetry=None,
+        print_data=False, policy=None, context_filter=None):
+    """execute the TraCI control loop, recorder records the first of ego_ids, telemetry (TelemetryLogger) logs
+    every ego on every step, policy (PolicyEngine) plans the missions of the egos without one, context_filter
+    (ContextFilter) narrows the context subscriptions of the egos"""
+    if connection is None:
+        connection = traci
     step = 0
-    ego_vehicle = None
+    ego_group = EgoGroup(network=network, connection=connection, perception_interval=perception_interval,
+                         context_filter=context_filter)
     # surroundings.surrounding_init()
-    while traci.simulation.getMinExpectedNumber() > 0:
-        traci.simulationStep()
+    connection.simulation.subscribe((tc.VAR_MIN_EXPECTED_VEHICLES,))
+    while connection.simulation.getSubscriptionResults()[tc.VAR_MIN_EXPECTED_VEHICLES] > 0:
+        connection.simulationStep()
         step += 1
         if step == 1001:
-            ego_vehicle = EgoVehicle('ego')
-        if ego_vehicle is not None:
+            for ego_id in ego_ids:
+                ego_group.add(ego_id, recorder=recorder if ego_id == ego_ids[0] else None)
+        if len(ego_group):
             if step == 1410:
                 # gap_front_vehicle = {'name': "left1", 'virtual': 0, 'lane_index': 1}
                 # gap_rear_vehicle = {'name': "left2", 'virtual': 0, 'lane_index': 1}
                 # ego_vehicle.lane_change_plan(gap_front_vehicle, gap_rear_vehicle)
-                ego_vehicle.lane_keep_plan()
-            ego_vehicle.fresh_data()
-            ego_vehicle.print_data()
-            ego_vehicle.drive()
+                for ego_vehicle in ego_group:
+                    ego_vehicle.lane_keep_plan()
+            ego_group.fresh_data()
+            for ego_vehicle in ego_group:
+                if policy is not None:
+                    ego_vehicle.policy_plan(policy)
+                if telemetry is not None:
+                    telemetry.log(step, ego_vehicle)
+                if print_data:
+                    ego_vehicle.print_data()
+            ego_group.drive()
 
 
             # surroundings.get_surroundings()
@@ -79,10 +101,60 @@ def run():
     sys.stdout.flush()
 
 
+def run_fleet(network=None, connection=None, ego_ids=('ego',), telemetry=None):
+    """the control loop of run() with all egos in one EgoFleet"""
+    if connection is None:
+        connection = traci
+    step = 0
+    ego_fleet = EgoFleet(network=network, connection=connection)
+    connection.simulation.subscribe((tc.VAR_MIN_EXPECTED_VEHICLES,))
+    while connection.simulation.getSubscriptionResults()[tc.VAR_MIN_EXPECTED_VEHICLES] > 0:
+        connection.simulationStep()
+        step += 1
+        if step == 1001:
+            for ego_id in ego_ids:
+                ego_fleet.add(ego_id)
+        if len(ego_fleet):
+            if step == 1410:
+                ego_fleet.lane_keep_plan()
+            ego_fleet.fresh_data()
+            if telemetry is not None:
+                telemetry.log_fleet(step, ego_fleet)
+            ego_fleet.drive()
+    sys.stdout.flush()
+
+
 def get_options():
     optParser = optparse.OptionParser()
     optParser.add_option("--nogui", action="store_true",
                          default=False, help="run the commandline version of sumo")
+    optParser.add_option("--profile", action="store_true",
+                         default=False, help="count and time the traci calls, written to traci_profile.json/csv")
+    optParser.add_option("--kinematic", action="store_true",
+                         default=False, help="run against the in-process kinematic stand-in instead of sumo")
+    optParser.add_option("--record", metavar="PATH",
+                         help="record the ego subscription results into the trace PATH for offline replay")
+    optParser.add_option("--perception", type="float", default=0.0, metavar="SECONDS",
+                         help="interval of the ego perception updates, 0 updates on every step")
+    optParser.add_option("--telemetry", metavar="PATH",
+                         help="write the per-step ego telemetry to PATH, read it with telemetry.py PATH; off by default")
+    optParser.add_option("--telemetry-level", type="int", default=1, dest="telemetry_level",
+                         help="0 off, 1 ego state and control, 2 also leader and mission")
+    optParser.add_option("--telemetry-every", type="int", default=1, dest="telemetry_every",
+                         help="log every Nth step")
+    optParser.add_option("--print", action="store_true", default=False, dest="print_data",
+                         help="print the ego data on every step")
+    optParser.add_option("--egos", type="int", default=1,
+                         help="number of controlled ego vehicles (ego, ego1, ego2 ...)")
+    optParser.add_option("--policy", metavar="PATH",
+                         help="let the policy weights in PATH (.npz of policyEngine.save_weights) plan the missions")
+    optParser.add_option("--policy-dtype", dest="policy_dtype", choices=('float32', 'int8'),
+                         help="run the policy in float32 or int8, default the dtype of the weights")
+    optParser.add_option("--context-filter", action="store_true", default=False, dest="context_filter",
+                         help="subscribe only the ego lane and its neighbours, over a range that grows with the speed")
+    optParser.add_option("--fleet", action="store_true", default=False,
+                         help="drive the egos as one EgoFleet, without --record, --perception, --print, --policy and "
+                              "--context-filter")
     options, args = optParser.parse_args()
     return options
 
@@ -99,10 +171,50 @@ if __name__ == "__main__":
         sumoBinary = checkBinary('sumo-gui')
 
     # first, generate the route file for this simulation
-    traffics = Traffic(trafficBase=0.4, trafficList=None)
-    # this is the normal way of using traci. sumo is started as a
-    # subprocess and then the python script connects and runs
-    traci.start([sumoBinary, "-c", "data/motorway.sumocfg",
-                             "--tripinfo-output", "tripinfo.xml"])
-
-    run()
+    traffics = Traffic(trafficBase=0.4, trafficList=None, egoNumber=options.egos)
+    network = RoadNetwork("data/motorway.net.xml")
+    connection = None
+    if options.kinematic:
+        connection = KinematicSimulation.from_config("data/motorway.sumocfg", network=network)
+    else:
+        # this is the normal way of using traci. sumo is started as a
+        # subprocess and then the python script connects and runs
+        traci.start([sumoBinary, "-c", "data/motorway.sumocfg",
+                                 "--tripinfo-output", "tripinfo.xml"])
+
+    profiler = None
+    if options.profile:
+        profiler = TraciProfiler()
+        if connection is None:
+            profiler.install()
+        else:
+            connection = profiler.wrap(connection)
+    context_filter = ContextFilter() if options.context_filter else None
+    recorder = None
+    if options.record:
+        recorder = TraceRecorder(options.record,
+                                 step_length=(traci if connection is None else connection).simulation.getDeltaT(),
+                                 perception_interval=options.perception, context_filter=context_filter)
+    telemetry = None
+    if options.telemetry and options.telemetry_level > LEVEL_OFF:
+        telemetry = TelemetryLogger(options.telemetry, level=options.telemetry_level, every=options.telemetry_every)
+    ego_ids = ['ego'] + ['ego%d' % i for i in range(1, options.egos)]
+    policy = None
+    if options.policy:
+        policy = PolicyEngine.load(options.policy, dtype=options.policy_dtype)
+    try:
+        if options.fleet:
+            run_fleet(network, connection, ego_ids, telemetry)
+        else:
+            run(network, connection, recorder, ego_ids, options.perception, telemetry, options.print_data, policy,
+                context_filter)
+    finally:
+        if telemetry is not None:
+            telemetry.close()
+        if recorder is not None:
+            recorder.close()
+        if profiler is not None:
+            profiler.uninstall()
+            print(profiler.summary())
+            profiler.export_json("traci_profile.json")
+            profiler.export_csv("traci_profile.csv")
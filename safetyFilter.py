@@ -0,0 +1,102 @@
+# coding:utf-8
+import numpy as np
+from neighborTable import NeighborListView
+
+TTC_MIN = 2.0  # s
+HEADWAY_MIN = 0.6  # s
+VEHICLE_LENGTH = 5.0  # m, bumper to bumper distance is the centre distance minus this
+LATERAL_CLEARANCE = 2.0  # m, centre distance below which two vehicles overlap laterally
+LATERAL_HORIZON = 1.0  # s the lateral command is swept ahead
+MAX_DECEL = 8.0  # m/s^2, the hardest braking the filter commands
+
+
+class SafetyFilter:
+    """clamps the ego commands against time-to-collision and time headway to every neighbour
+
+    The neighbours are taken as arrays once per perception (and extrapolated at constant speed between
+    two perceptions). Each step the lateral speed is dropped if a vehicle beside or closing in from
+    behind is inside the band the ego would sweep, then the longitudinal speed is limited to the
+    largest speed that keeps TTC and headway to every vehicle ahead in that band.
+    """
+    def __init__(self, ttc_min=TTC_MIN, headway_min=HEADWAY_MIN, vehicle_length=VEHICLE_LENGTH,
+                 lateral_clearance=LATERAL_CLEARANCE, lateral_horizon=LATERAL_HORIZON, max_decel=MAX_DECEL):
+        self.ttcMin = ttc_min
+        self.headwayMin = headway_min
+        self.vehicleLength = vehicle_length
+        self.lateralClearance = lateral_clearance
+        self.lateralHorizon = lateral_horizon
+        self.maxDecel = max_decel
+        self.vehicles = None  # neighbour list the arrays below were taken from
+        self.positionX = np.zeros(0)
+        self.positionY = np.zeros(0)
+        self.speed = np.zeros(0)
+        # speed limits for an ego at x = 0 behind each neighbour, from ttc_min and from headway_min
+        self.ttcBound = np.zeros(0)
+        self.headwayBound = np.zeros(0)
+        self.interventions = 0  # steps in which a command was changed
+
+    def _neighbour_arrays(self, ego):
+        vehicles = ego.neighbourVehicles
+        if vehicles is self.vehicles:
+            return
+        self.vehicles = vehicles
+        if isinstance(vehicles, NeighborListView):
+            table = vehicles.table
+            keep = np.ones(table.size, dtype=bool)
+            if ego.id in table.nameList:  # the context subscription contains the ego itself
+                keep[table.nameList.index(ego.id)] = False
+            self.positionX = table.positionX[keep]
+            self.positionY = table.positionY[keep]
+            self.speed = table.speed[keep]
+        else:
+            vehicles = [vehicle for vehicle in vehicles or () if vehicle['name'] != ego.id]
+            self.positionX = np.fromiter((vehicle['position_x'] for vehicle in vehicles), float, len(vehicles))
+            self.positionY = np.fromiter((vehicle['position_y'] for vehicle in vehicles), float, len(vehicles))
+            self.speed = np.fromiter((vehicle['speed'] for vehicle in vehicles), float, len(vehicles))
+        rear_x = self.positionX - self.vehicleLength
+        self.ttcBound = self.speed + rear_x / self.ttcMin
+        self.headwayBound = rear_x / self.headwayMin
+
+    def filter(self, ego, vx_ctl, vy_ctl):
+        """(vx_ctl, vy_ctl) that keep the thresholds, the commands are only ever reduced"""
+        self._neighbour_arrays(ego)
+        if len(self.speed) == 0:
+            return vx_ctl, vy_ctl
+        # array methods instead of np.any/np.min and bounds prepared per perception, the dispatch of each numpy
+        # call costs more than the math on a few dozen rows
+        age = ((ego.tick - 1) % ego.perceptionPeriod) * ego.timeStep  # since the neighbours were perceived
+        position_x = self.positionX
+        ttc_bound = self.ttcBound
+        headway_bound = self.headwayBound
+        if age:
+            shift = self.speed * age
+            position_x = position_x + shift
+            ttc_bound = ttc_bound + shift / self.ttcMin
+            headway_bound = headway_bound + shift / self.headwayMin
+        dy = self.positionY - ego.y
+        filtered_vx, filtered_vy = vx_ctl, vy_ctl
+        if vy_ctl != 0:
+            dx = position_x - ego.x
+            sweep = vy_ctl * self.lateralHorizon
+            distance = np.abs(dy)
+            # beside the ego on the side it moves to, within the swept band
+            target = (dy * sweep > 0) & (distance >= self.lateralClearance) & (distance < abs(sweep) +
+                                                                                self.lateralClearance)
+            gap = -dx - self.vehicleLength  # to the vehicles behind
+            beside = np.abs(dx) < self.vehicleLength
+            rear = (dx < 0) & (((self.speed - vx_ctl) * self.ttcMin > gap) | (gap < self.headwayMin * self.speed))
+            if (target & (beside | rear)).any():
+                filtered_vy = 0.0
+        sweep = filtered_vy * self.lateralHorizon
+        if sweep:
+            dy -= 0.5 * sweep
+        ahead = (np.abs(dy) < 0.5 * abs(sweep) + self.lateralClearance) & (position_x > ego.x)
+        # largest speed with gap / (v - v_front) >= ttc_min and gap / v >= headway_min to every vehicle ahead
+        allowed = np.minimum(ttc_bound - ego.x / self.ttcMin, headway_bound - ego.x / self.headwayMin)[ahead]
+        if allowed.size:
+            allowed = float(allowed.min())
+            if vx_ctl > allowed:
+                filtered_vx = min(vx_ctl, max(allowed, ego.vx - self.maxDecel * ego.timeStep, 0.0))
+        if filtered_vx != vx_ctl or filtered_vy != vy_ctl:
+            self.interventions += 1
+        return filtered_vx, filtered_vy
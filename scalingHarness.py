@@ -0,0 +1,292 @@
+# coding:utf-8
+import os
+import sys
+import gc
+import json
+import time
+import shutil
+import optparse
+import tempfile
+import numpy as np
+
+# we need to import python modules from the $SUMO_HOME/tools directory
+if 'SUMO_HOME' in os.environ:
+    tools = os.path.join(os.environ['SUMO_HOME'], 'tools')
+    sys.path.append(tools)
+else:
+    sys.exit("please declare environment variable 'SUMO_HOME'")
+
+import traci  # noqa
+import traci.constants as tc
+from egoGroup import EgoGroup
+from roadNetwork import RoadNetwork
+from surrounding import ContextFilter
+from kinematicSim import KinematicSimulation, MAIN_LINE
+from benchmark import NET_FILE, STEP_LENGTH, STEP_BUDGET_NS
+
+VEHICLE_COUNTS = (10, 50, 100, 200, 500, 1000, 2000)
+VEHICLE_SPACING = 8.0  # m, least distance of two placed vehicles, length 5 + minGap 2.5 and a margin
+EGO_LANE = 1
+EGO_POSITION = 100.0  # m on the first main line edge
+EGO_CLEARANCE = 30.0  # m kept free around the ego, it departs with speed 0
+INFLOW_SPEED = 25.0  # m/s, the inflow keeps the density of the placed vehicles at this speed
+MAX_INFLOW = 1.5  # vehicles/s the entry takes at most
+WARMUP_STEPS = 100  # control steps before the measurement, the lazy caches fill and the ego gets going
+MEASURE_STEPS = 1000
+PERCENTILES = (50, 90, 99, 99.9)
+PHASES = ('total', 'sim', 'traci', 'control')
+RESULTS_FILE = 'scaling.json'
+
+
+def get_lanes(network):
+    """(edge, lane index, length) of every main line lane passenger cars may use"""
+    lanes = []
+    for edge in MAIN_LINE:
+        for index in range(network.get_lane_number(edge)):
+            lane_id = '%s_%d' % (edge, index)
+            if network.get_lane_allows_passenger(lane_id):
+                lanes.append((edge, index, network.get_lane_length(lane_id)))
+    return lanes
+
+
+def place_vehicles(network, count, rng):
+    """(edge, lane index, position) of up to count vehicles spread evenly over the main line
+
+    The road holds about one vehicle per VEHICLE_SPACING of lane, larger counts are cut to that.
+    """
+    lanes = get_lanes(network)
+    usable = sum(length - VEHICLE_SPACING for edge, index, length in lanes)
+    spacing = max(VEHICLE_SPACING, usable / max(count, 1))
+    placed = []
+    for edge, index, length in lanes:
+        position = VEHICLE_SPACING + rng.uniform(0.0, spacing)  # lanes start shifted against each other
+        while position < length - 1.0:
+            if not (edge == MAIN_LINE[0] and index == EGO_LANE and abs(position - EGO_POSITION) < EGO_CLEARANCE):
+                placed.append((edge, index, position))
+            position += spacing
+    if len(placed) > count:
+        placed = [placed[i] for i in np.sort(rng.choice(len(placed), count, replace=False))]
+    # downstream first, sumo inserts in this order and refuses a vehicle in front of a moving follower
+    placed.sort(key=lambda vehicle: (-MAIN_LINE.index(vehicle[0]), -vehicle[2]))
+    return placed
+
+
+def write_scenario(directory, network, count, seed):
+    """config file of a scenario with count vehicles on the main line at the start and the ego, and the
+    number of vehicles actually placed"""
+    rng = np.random.default_rng(seed)
+    placed = place_vehicles(network, count, rng)
+    route_file = os.path.join(directory, 'scaling.rou.xml')
+    road_length = sum(network.get_lane_length(edge + '_0') for edge in MAIN_LINE)
+    inflow = min(MAX_INFLOW, len(placed) * INFLOW_SPEED / road_length)
+    with open(route_file, 'w') as routes:
+        print("""<routes>
+    <vType id="pkw" accel="2.6" decel="4.5" sigma="0" length="5" minGap="2.5" maxSpeed="25"/>
+    <vType id="pkw_special" accel="0.8" decel="4.5" sigma="0" length="5" minGap="2.5" maxSpeed="0.000001"/>
+    <route id="route_ego" edges="%s"/>
+    <vehicle id="ego" type="pkw_special" route="route_ego" departLane="%d" departPos="%.1f" depart="0"/>"""
+              % (' '.join(MAIN_LINE), EGO_LANE, EGO_POSITION), file=routes)
+        for i, (edge, index, position) in enumerate(placed):
+            print('    <trip id="v%d" type="pkw" depart="0" from="%s" to="%s" departLane="%d" departPos="%.1f" '
+                  'departSpeed="max"/>' % (i, edge, MAIN_LINE[-1], index, position), file=routes)
+        if inflow > 0:
+            print('    <flow id="inflow" type="pkw" from="%s" to="%s" begin="0" end="3600" vehsPerHour="%.1f" '
+                  'departLane="free" departSpeed="max"/>' % (MAIN_LINE[0], MAIN_LINE[-1], 3600 * inflow),
+                  file=routes)
+        print("</routes>", file=routes)
+    config_file = os.path.join(directory, 'scaling.sumocfg')
+    with open(config_file, 'w') as config:
+        print("""<configuration>
+    <input><net-file value="%s"/><route-files value="%s"/></input>
+    <time><begin value="0"/><step-length value="%s"/></time>
+    <processing><lateral-resolution value="1.6"/></processing>
+    <random_number><seed value="%d"/></random_number>
+</configuration>""" % (os.path.abspath(NET_FILE), route_file, STEP_LENGTH, seed), file=config)
+    return config_file, len(placed)
+
+
+class _SocketTimer:
+    """shadows _recvExact of a traci connection and adds up the time spent waiting for sumo"""
+    def __init__(self, connection):
+        self.connection = connection
+        self.ns = 0
+        receive = type(connection)._recvExact
+        perf_counter_ns = time.perf_counter_ns
+
+        def timed_receive():
+            start = perf_counter_ns()
+            try:
+                return receive(connection)
+            finally:
+                self.ns += perf_counter_ns() - start
+        connection._recvExact = timed_receive
+
+    def remove(self):
+        del self.connection._recvExact
+
+
+def summarize(samples):
+    samples = np.asarray(samples, dtype=np.int64)
+    summary = {'mean': float(samples.mean()), 'max': int(samples.max())}
+    for percentile in PERCENTILES:
+        summary['p%g' % percentile] = float(np.percentile(samples, percentile))
+    return summary
+
+
+def run_scenario(network, count, sumo=False, seed=1, steps=MEASURE_STEPS, warmup=WARMUP_STEPS, context_filter=None):
+    """the control loop of runner.run on one generated scenario, timed per step
+
+    total is the whole step. With sumo it is split into sim (waiting for the answer of sumo), traci (the
+    python side of the traci calls, decoding the subscriptions) and control (fresh_data, planning and
+    drive without their traci calls). With the stand-in, sim is its simulationStep and traci is 0.
+    """
+    directory = tempfile.mkdtemp()
+    connection = None
+    timer = None
+    try:
+        config_file, placed = write_scenario(directory, network, count, seed)
+        if sumo:
+            traci.start(['sumo', '-c', config_file, '--no-step-log', '--no-warnings'], label='scaling')
+            connection = traci.getConnection('scaling')
+            timer = _SocketTimer(connection)
+        else:
+            connection = KinematicSimulation.from_config(config_file, seed=seed, network=network)
+        connection.simulation.subscribe((tc.VAR_MIN_EXPECTED_VEHICLES,))
+        ego_group = EgoGroup(network=network, connection=connection, context_filter=context_filter)
+        for i in range(1000):
+            connection.simulationStep()
+            if 'ego' in connection.vehicle.getIDList():
+                break
+        else:
+            raise RuntimeError("the ego was not inserted")
+        ego = ego_group.add('ego')
+        sample = dict((phase, []) for phase in PHASES)
+        vehicles = []
+        context = []
+        perf_counter_ns = time.perf_counter_ns
+        gc_enabled = gc.isenabled()
+        gc.disable()  # a collection lands on a random step, the percentiles would measure gc
+        try:
+            for i in range(warmup + steps):
+                socket_ns = timer.ns if timer else 0
+                start = perf_counter_ns()
+                connection.simulationStep()
+                stepped = perf_counter_ns()
+                step_socket_ns = (timer.ns if timer else 0) - socket_ns
+                arrived = ego_group.fresh_data()
+                if arrived:
+                    raise RuntimeError("the ego left the road after %d steps, use fewer steps" % i)
+                if i > 0 and not ego.missionList:  # the first speed estimate starts from x = 0
+                    ego.lane_keep_plan()
+                ego_group.drive()
+                end = perf_counter_ns()
+                control_socket_ns = (timer.ns if timer else 0) - socket_ns - step_socket_ns
+                if i < warmup:
+                    continue
+                sample['total'].append(end - start)
+                if timer:
+                    sample['sim'].append(step_socket_ns + control_socket_ns)
+                    sample['traci'].append(stepped - start - step_socket_ns)
+                else:
+                    sample['sim'].append(stepped - start)
+                    sample['traci'].append(0)
+                sample['control'].append(end - stepped - control_socket_ns)
+                # running or waiting for insertion, free with the step unlike getIDCount
+                vehicles.append(connection.simulation.getSubscriptionResults()[tc.VAR_MIN_EXPECTED_VEHICLES])
+                context.append(len(ego.egoData.get_context() or ()))
+        finally:
+            if gc_enabled:
+                gc.enable()
+        # the control side includes the traci encoding of its own calls, they are few compared to the step
+        result = {'target_vehicles': count, 'placed_vehicles': placed, 'vehicles_mean': float(np.mean(vehicles)),
+                  'vehicles_max': int(np.max(vehicles)), 'context_mean': float(np.mean(context)), 'steps': steps,
+                  'over_budget': float(np.mean(np.asarray(sample['total']) > STEP_BUDGET_NS)),
+                  'control_over_budget': float(np.mean(np.asarray(sample['control']) > STEP_BUDGET_NS))}
+        for phase in PHASES:
+            result[phase + '_ns'] = summarize(sample[phase])
+        return result
+    finally:
+        if timer is not None:
+            timer.remove()
+        if connection is not None:
+            connection.close()
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def budget_limit(scenarios, phase='total', percentile='p99'):
+    """vehicles of the first scenario whose percentile of phase exceeds the step budget, None if all meet it"""
+    for scenario in sorted(scenarios, key=lambda scenario: scenario['vehicles_mean']):
+        if scenario[phase + '_ns'][percentile] > STEP_BUDGET_NS:
+            return scenario['vehicles_mean']
+    return None
+
+
+def compare(results, reference):
+    """one line per scenario of both files, the ratio of p99 and mean of total and control"""
+    reference_dict = dict((scenario['target_vehicles'], scenario) for scenario in reference['scenarios'])
+    lines = []
+    for scenario in results['scenarios']:
+        old = reference_dict.get(scenario['target_vehicles'])
+        if old is None:
+            continue
+        ratios = ['%s %s %.2fx' % (phase, statistic, scenario[phase + '_ns'][statistic] / old[phase + '_ns'][statistic])
+                  for phase in ('total', 'control') for statistic in ('p99', 'mean')]
+        lines.append('%6d vehicles: %s' % (scenario['target_vehicles'], ', '.join(ratios)))
+    return lines
+
+
+def get_options():
+    optParser = optparse.OptionParser()
+    optParser.add_option("--sumo", action="store_true", default=False,
+                         help="run against sumo instead of the kinematic stand-in")
+    optParser.add_option("--counts", default=','.join(str(count) for count in VEHICLE_COUNTS),
+                         help="comma separated vehicle counts")
+    optParser.add_option("--steps", type="int", default=MEASURE_STEPS, help="measured steps per scenario")
+    optParser.add_option("--warmup", type="int", default=WARMUP_STEPS, help="control steps before measuring")
+    optParser.add_option("--seed", type="int", default=1)
+    optParser.add_option("--output", default=RESULTS_FILE, metavar="PATH", help="results file (JSON)")
+    optParser.add_option("--context-filter", action="store_true", default=False, dest="context_filter",
+                         help="give the ego the default surrounding.ContextFilter")
+    optParser.add_option("--label", default='', help="name of the version under test, stored in the results")
+    optParser.add_option("--compare", metavar="PATH", help="results file of another version to compare with")
+    options, args = optParser.parse_args()
+    return options
+
+
+if __name__ == "__main__":
+    options = get_options()
+    network = RoadNetwork(NET_FILE)
+    scenarios = []
+    print("%8s %8s %8s | %8s %8s %8s %8s | %8s %8s %8s | %7s" % ('target', 'vehicles', 'context', 'p50 ms',
+                                                                  'p90 ms', 'p99 ms', 'max ms', 'sim ms', 'traci ms',
+                                                                  'ctl ms', 'over'))
+    for count in [int(count) for count in options.counts.split(',')]:
+        result = run_scenario(network, count, options.sumo, options.seed, options.steps, options.warmup,
+                              ContextFilter() if options.context_filter else None)
+        scenarios.append(result)
+        total = result['total_ns']
+        print("%8d %8.0f %8.1f | %8.3f %8.3f %8.3f %8.3f | %8.3f %8.3f %8.3f | %6.2f%%"
+              % (count, result['vehicles_mean'], result['context_mean'], total['p50'] / 1e6, total['p90'] / 1e6,
+                 total['p99'] / 1e6, total['max'] / 1e6, result['sim_ns']['mean'] / 1e6,
+                 result['traci_ns']['mean'] / 1e6, result['control_ns']['mean'] / 1e6, 100 * result['over_budget']))
+        sys.stdout.flush()
+    results = {'label': options.label, 'source': 'sumo' if options.sumo else 'kinematic',
+               'python': sys.version.split()[0], 'numpy': np.__version__, 'step_length': STEP_LENGTH,
+               'step_budget_ns': STEP_BUDGET_NS, 'seed': options.seed, 'warmup': options.warmup,
+               'context_filter': options.context_filter,
+               'scenarios': scenarios,
+               'budget_limit_vehicles': budget_limit(scenarios),
+               'control_budget_limit_vehicles': budget_limit(scenarios, 'control')}
+    with open(options.output, 'w') as f:
+        json.dump(results, f, indent=1, sort_keys=True)
+    for name, key in (('step', 'budget_limit_vehicles'), ('control', 'control_budget_limit_vehicles')):
+        limit = results[key]
+        print("%s p99 %s %.0f ms budget" % (name, 'within the' if limit is None else
+                                            'from %.0f vehicles on over the' % limit, STEP_BUDGET_NS / 1e6))
+    print("results written to %s" % options.output)
+    if options.compare:
+        with open(options.compare) as f:
+            reference = json.load(f)
+        print("compared with %s (%s):" % (options.compare, reference.get('label') or reference['source']))
+        for line in compare(results, reference):
+            print(line)
@@ -0,0 +1,156 @@
+# coding:utf-8
+import os
+import json
+import random
+import hashlib
+import tempfile
+import optparse
+import multiprocessing as mp
+from xml.sax.saxutils import XMLGenerator
+
+SCENARIO_DIR = 'data/.scenarios'
+SCENARIO_VERSION = 1  # part of the key, bump it when the generated files change for the same parameters
+
+V_TYPES = (
+    ('pkw_f', {'accel': '0.8', 'decel': '4.5', 'sigma': '0.5', 'length': '5', 'minGap': '2.5', 'maxSpeed': '35',
+               'guiShape': 'passenger', 'color': 'green'}),
+    ('pkw_m', {'accel': '0.8', 'decel': '4.5', 'sigma': '0.5', 'length': '5', 'minGap': '2.5', 'maxSpeed': '25',
+               'guiShape': 'passenger', 'color': 'yellow'}),
+    ('bus', {'accel': '0.8', 'decel': '4.5', 'sigma': '0.5', 'length': '7', 'minGap': '2.5', 'maxSpeed': '20',
+             'guiShape': 'bus', 'color': 'red'}),
+    ('pkw_special', {'accel': '0.8', 'decel': '4.5', 'sigma': '0.5', 'length': '5', 'minGap': '2.5',
+                     'maxSpeed': '0.000001', 'guiShape': 'passenger', 'color': 'blue'}),
+)
+SOURCES = ('gneE0', 'Zadao1')  # main line, on-ramp
+SINKS = ('Zadao2', 'gneE8', 'gneE7')  # off-ramp, the two main line ends
+
+
+def scenario_params(traffic_base=0.4, seed=0, ego_number=1, begin=0, end=500, ego_depart=(0, 10)):
+    """the parameters a scenario file is generated from, everything random is drawn from seed"""
+    return {'version': SCENARIO_VERSION, 'traffic_base': traffic_base, 'seed': seed, 'ego_number': ego_number,
+            'begin': begin, 'end': end, 'ego_depart': list(ego_depart)}
+
+
+def scenario_key(params):
+    return hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()
+
+
+def _demand(params):
+    """(vType mix, source split, sink split, ego departure) of the scenario, the randomized mix of the old
+    Traffic.traffic_init_general"""
+    rng = random.Random(params['seed'])
+    f_rate = rng.uniform(0.4, 0.6)
+    s_rate = rng.uniform(0.05, 0.1)
+    p_s1 = rng.uniform(0.9, 0.95)
+    p_e1 = rng.uniform(0.05, 0.1)
+    p_e2 = rng.uniform(0.3, 0.4)
+    type_rates = (('f', 'pkw_f', f_rate), ('m', 'pkw_m', 1 - f_rate - s_rate), ('bus', 'bus', s_rate))
+    source_rates = (p_s1, 1 - p_s1)
+    sink_rates = (p_e1, p_e2, 1 - p_e1 - p_e2)
+    ego_depart = rng.uniform(*params['ego_depart'])
+    return type_rates, source_rates, sink_rates, ego_depart
+
+
+def write_routes(path, params):
+    """stream the route file of params into path"""
+    type_rates, source_rates, sink_rates, ego_depart = _demand(params)
+    with open(path, 'w', encoding='utf-8') as f:
+        writer = XMLGenerator(f, 'UTF-8', short_empty_elements=True)
+        writer.startDocument()
+        writer.startElement('routes', {})
+
+        def element(name, attributes):
+            writer.ignorableWhitespace('\n    ')
+            writer.startElement(name, attributes)
+            writer.endElement(name)
+
+        for type_id, attributes in V_TYPES:
+            element('vType', dict({'id': type_id}, **attributes, laneChangeModel='SL2015', latAlignment='center'))
+        for prefix, type_id, type_rate in type_rates:
+            for i, (source, source_rate) in enumerate(zip(SOURCES, source_rates)):
+                for j, (sink, sink_rate) in enumerate(zip(SINKS, sink_rates)):
+                    element('flow', {'id': '%s%d%d' % (prefix, i + 1, j + 1), 'type': type_id, 'from': source,
+                                     'to': sink, 'begin': str(params['begin']), 'end': str(params['end']),
+                                     'probability': '%f' % (params['traffic_base'] * type_rate * source_rate *
+                                                            sink_rate),
+                                     'departLane': 'free', 'departSpeed': 'random'})
+        for i in range(params['ego_number']):
+            element('trip', {'id': 'ego%d' % i if i else 'ego', 'type': 'pkw_special', 'depart': '%.2f' % ego_depart,
+                             'from': 'gneE0', 'to': 'gneE7', 'departLane': 'free', 'departPos': 'free',
+                             'departSpeed': 'random'})
+        writer.ignorableWhitespace('\n')
+        writer.endElement('routes')
+        writer.endDocument()
+
+
+class ScenarioCache:
+    """route files stored under the key of their parameters, each scenario is generated once"""
+    def __init__(self, cache_dir=SCENARIO_DIR):
+        self.cacheDir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def path(self, params):
+        return os.path.join(self.cacheDir, scenario_key(params) + '.rou.xml')
+
+    def has(self, params):
+        return os.path.isfile(self.path(params))
+
+    def get(self, params):
+        """path of the route file of params, generated here if it is not in the cache yet"""
+        path = self.path(params)
+        if not os.path.isfile(path):
+            # written under a temporary name first, concurrent workers only ever replace a complete file
+            # with the same content
+            fd, tmp_path = tempfile.mkstemp(dir=self.cacheDir, suffix='.rou.xml')
+            os.close(fd)
+            try:
+                write_routes(tmp_path, params)
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+        return path
+
+    def generate(self, param_list, processes=None):
+        """paths of the route files of param_list, the missing ones are generated in a process pool"""
+        missing = {}
+        for params in param_list:
+            path = self.path(params)
+            if path not in missing and not os.path.isfile(path):
+                missing[path] = params
+        missing = list(missing.values())
+        if len(missing) > 1 and processes != 1:
+            with mp.get_context('spawn').Pool(processes) as pool:
+                chunk_size = max(1, len(missing) // (4 * (processes or mp.cpu_count())))
+                for _ in pool.imap_unordered(_generate, [(self.cacheDir, params) for params in missing], chunk_size):
+                    pass
+        else:
+            for params in missing:
+                self.get(params)
+        return [self.path(params) for params in param_list]
+
+
+def _generate(job):
+    cache_dir, params = job
+    return ScenarioCache(cache_dir).get(params)
+
+
+def get_options():
+    optParser = optparse.OptionParser()
+    optParser.add_option("--count", type="int", default=1000, help="number of scenarios, seeds 0..count-1")
+    optParser.add_option("--first_seed", type="int", default=0, help="seed of the first scenario")
+    optParser.add_option("--traffic_base", type="float", default=0.4, help="overall flow probability")
+    optParser.add_option("--egos", type="int", default=1, help="number of ego vehicles per scenario")
+    optParser.add_option("--processes", type="int", default=None, help="size of the process pool")
+    options, args = optParser.parse_args()
+    return options
+
+
+if __name__ == "__main__":
+    import time
+    options = get_options()
+    param_list = [scenario_params(options.traffic_base, seed, ego_number=options.egos)
+                  for seed in range(options.first_seed, options.first_seed + options.count)]
+    start = time.time()
+    paths = ScenarioCache().generate(param_list, options.processes)
+    print("%d scenarios in %s, %.2f s" % (len(paths), SCENARIO_DIR, time.time() - start))
@@ -13,13 +13,63 @@ else:
 
 import traci
 import traci.constants as tc
+from neighborTable import NeighborTable, NeighborListView, NeighborIndex, LEFT, MID, RIGHT
+
+CONTEXT_RADIUS = 200.0  # m, of the unfiltered context subscription
+CONTEXT_VARIABLES = [tc.VAR_LANE_INDEX, tc.VAR_POSITION, tc.VAR_SPEED, tc.VAR_ROAD_ID, tc.VAR_LANEPOSITION,
+                     tc.VAR_LANEPOSITION_LAT, tc.VAR_EDGES]
+
+
+class ContextFilter:
+    """the SUMO side filters of the ego context subscription
+
+    lane_offsets are the lanes relative to the ego lane (+1 is the left one), the ramps and every other lane
+    are dropped; None keeps the whole radius. downstream_dist/upstream_dist bound the range ahead/behind
+    along the road. With horizon > 0 both grow to the distance covered in horizon seconds at the ego speed,
+    rounded up to dist_step and capped at max_dist, Surrounding.adapt_context() subscribes again when they
+    change. max_vehicles keeps that many leaders and followers per lane: 1 is filtered by SUMO
+    (addSubscriptionFilterLeadFollow, its leader search leaves the ego out), larger caps cut the classified lists.
+    """
+    def __init__(self, lane_offsets=(-1, 0, 1), downstream_dist=100.0, upstream_dist=60.0, horizon=4.0,
+                 max_dist=CONTEXT_RADIUS, dist_step=20.0, max_vehicles=None):
+        self.laneOffsets = None if lane_offsets is None else list(lane_offsets)
+        self.downstreamDist = downstream_dist
+        self.upstreamDist = upstream_dist
+        self.horizon = horizon
+        self.maxDist = max_dist
+        self.distStep = dist_step
+        self.maxVehicles = max_vehicles
+
+    def _bounded(self, dist, speed):
+        reach = math.ceil(self.horizon * speed / self.distStep) * self.distStep
+        return min(self.maxDist, max(dist, reach))
+
+    def get_params(self):
+        """the constructor arguments, ContextFilter(**get_params()) is the same filter"""
+        return {'lane_offsets': self.laneOffsets, 'downstream_dist': self.downstreamDist,
+                'upstream_dist': self.upstreamDist, 'horizon': self.horizon, 'max_dist': self.maxDist,
+                'dist_step': self.distStep, 'max_vehicles': self.maxVehicles}
+
+    def get_distances(self, speed):
+        """(downstream, upstream) distance for an ego driving at speed"""
+        return self._bounded(self.downstreamDist, speed), self._bounded(self.upstreamDist, speed)
 
 
 class Surrounding:
-    def __init__(self, id,downstreamDist=200.0, upstreamDist=200.0):
+    def __init__(self, id,downstreamDist=200.0, upstreamDist=200.0, network=None, columnar=False, connection=None,
+                 ego_data=None, context_filter=None):
         self.id = id
+        self.connection = traci if connection is None else connection  # traci module or a labeled traci connection
+        self.egoData = ego_data  # EgoData shared with EgoVehicle, replaces the per-step getter calls
+        self.network = network  # compiled RoadNetwork, static lane data is read from it instead of traci
+        self.columnar = columnar  # keep the neighbors in a NeighborTable instead of one dict per vehicle
+        self.neighborTable = NeighborTable()
+        self.classifyRows = None  # columnar mode: {LEFT/MID/RIGHT: (leader rows, follower rows)} of neighborTable
+        self.neighborIndex = NeighborIndex()  # per lane longitudinal order of the neighbors, rebuilt on every classify
         self.downstreamDist = downstreamDist
         self.upstreamDist = upstreamDist
+        self.contextFilter = context_filter  # ContextFilter, None subscribes everything within CONTEXT_RADIUS
+        self.resubscriptions = 0  # context subscriptions sent again for a new speed
         self.neighborList = None
         self.edge = "gneE0"
         self.maxSpeedList = []
@@ -41,48 +91,108 @@ class Surrounding:
         self.edgeLengthDict = None  # for route
         self.laneNumberDict = None  # for all edge
         self.edgeIdList = []  # for for all edge
+        self.step = 0  # advanced by get_surroundings, every derived value is computed at most once per step
+        self.freshStep = {}  # name of the derived value -> step it was last computed in
+        self.laneEdge = None  # edge that laneNumber and maxSpeedList belong to
+        self.route = None  # route that edgeList, edgeDict and the edge lengths belong to
+        self.routeEdge = None  # edge on which the route was last fetched
 
     def get_neighbor_list(self):
+        self._refresh('neighbor', self._get_neighbor_list)
         return self.neighborList
 
     def get_left_leader_neighbor_list(self):
+        self._refresh('classify', self._classify)
         return self.leftLeaderNeighborList
 
     def get_left_follower_neighbor_list(self):
+        self._refresh('classify', self._classify)
         return self.leftFollowerNeighborList
 
     def get_right_leader_neighbor_list(self):
+        self._refresh('classify', self._classify)
         return self.rightLeaderNeighborList
 
     def get_right_follower_neighbor_list(self):
+        self._refresh('classify', self._classify)
         return self.rightFollowerNeighborList
 
     def get_mid_leader_neighbor_list(self):
+        self._refresh('classify', self._classify)
         return self.midLeaderNeighborList
 
     def get_mid_follower_neighbor_list(self):
+        self._refresh('classify', self._classify)
         return self.midFollowerNeighborList
 
     def get_max_speed_list(self):
+        self._refresh('lane_number', self._get_lane_number)
         return self.maxSpeedList
 
     def get_edge_list(self):
+        self._refresh('route', self._get_route)
         return self.edgeList
 
     def get_edge_dict(self):
+        self._refresh('route', self._get_route)
         return self.edgeDict
 
+    def get_edge_length_list(self):
+        self._refresh('route', self._get_route)
+        return self.edgeLengthList
+
+    def get_edge_length_dict(self):
+        self._refresh('route', self._get_route)
+        return self.edgeLengthDict
+
+    def get_neighbor_table(self):
+        self._refresh('neighbor', self._get_neighbor_list)
+        return self.neighborTable
+
+    def get_neighbor_index(self):
+        self._refresh('index', self._update_neighbor_index)
+        return self.neighborIndex
+
+    def get_classify_rows(self):  # only in columnar mode
+        self._refresh('classify', self._classify)
+        return self.classifyRows
+
     def get_all_edge_lane_number_dict(self):
         return self.laneNumberDict
 
     def get_lane_index(self):
+        self._refresh('lane_index', self._get_lane_index)
         return self.laneIndex
 
+    def invalidate_route(self):  # call after rerouting the vehicle, the route is otherwise only re-read on edge change
+        self.routeEdge = None
+        self.freshStep.pop('route', None)
+
+    def _refresh(self, name, func):
+        if self.freshStep.get(name) != self.step:
+            func()
+            self.freshStep[name] = self.step
+
+    def _get_position(self):
+        if self.egoData is not None:
+            self.x, self.y = self.egoData.get_position()
+        else:
+            self.x, self.y = self.connection.vehicle.getPosition(self.id)
+
     def _get_neighbor_list(self):
-        self.neighborDict = traci.vehicle.getContextSubscriptionResults(self.id)
-        self.x = traci.vehicle.getPosition("ego")[0]
-        self.y = traci.vehicle.getPosition("ego")[1]
-        if self.neighborDict != None:
+        self._refresh('position', self._get_position)
+        if self.egoData is not None:
+            self.neighborDict = self.egoData.get_context()
+        else:
+            self.neighborDict = self.connection.vehicle.getContextSubscriptionResults(self.id)
+        if self.columnar:
+            if self.neighborDict != None:
+                self.neighborTable.fill(self.neighborDict, self.laneNumberDict, self.x, self.y)
+                self.neighborList = NeighborListView(self.neighborTable)
+            else:
+                self.neighborTable.clear()
+                self.neighborList = []
+        elif self.neighborDict != None:
             self.neighborList = []
             for name, value in self.neighborDict.items():
                 self.neighborList.append({'name': name,
@@ -105,16 +215,45 @@ class Surrounding:
             self.neighborList = []
 
     def _get_edge(self):
-        self.edge = traci.vehicle.getRoadID(self.id)
-
-    def _get_lane_number(self):
-        self.laneNumber = traci.edge.getLaneNumber(self.edge)
+        if self.egoData is not None:
+            self.edge = self.egoData.get_road_id()
+        else:
+            self.edge = self.connection.vehicle.getRoadID(self.id)
+
+    def _get_lane_number(self):  # lane number and speed limits only change with the edge
+        self._refresh('edge', self._get_edge)
+        if self.edge != self.laneEdge:
+            if self.laneNumberDict is not None and self.edge in self.laneNumberDict:
+                self.laneNumber = self.laneNumberDict[self.edge]
+            elif self.egoData is not None:
+                self.laneNumber = self.egoData.get_lane_number(self.edge)
+            else:
+                self.laneNumber = self.connection.edge.getLaneNumber(self.edge)
+            self._get_max_speed_list()
+            self.laneEdge = self.edge
 
     def _get_lane_index(self):
+        self._refresh('position', self._get_position)
+        self._refresh('lane_number', self._get_lane_number)
         self.laneIndex = self.laneNumber - math.ceil(-self.y / self.laneWidth)
 
+    def _get_route(self):  # the route is re-read on edge change, lengths only when the route itself changed
+        self._refresh('edge', self._get_edge)
+        if self.egoData is not None or self.edge != self.routeEdge:  # the subscribed route is free to compare
+            if self.egoData is not None:
+                route = self.egoData.get_route()
+            else:
+                route = self.connection.vehicle.getRoute(self.id)
+            if route != self.route:
+                self.route = route
+                self._get_edge_list()
+                self._get_edge_dict()
+                self._get_edge_length_list()
+                self._get_edge_length_dict()
+            self.routeEdge = self.edge
+
     def _get_edge_list(self):
-        self.edgeList = list(traci.vehicle.getRoute(self.id))
+        self.edgeList = list(self.route)
 
     def _get_edge_dict(self):
         self.edgeDict = None
@@ -125,88 +264,154 @@ class Surrounding:
         self.edgeLengthList = []
         # self.get_edge_list() # for use alone
         for i in range(len(self.edgeList)):
-            self.edgeLengthList.append(traci.lane.getLength(self.edgeList[i]+"_"+str(0)))
+            if self.network is not None:
+                self.edgeLengthList.append(self.network.get_lane_length(self.edgeList[i]+"_"+str(0)))
+            else:
+                self.edgeLengthList.append(self.connection.lane.getLength(self.edgeList[i]+"_"+str(0)))
 
     def _get_edge_length_dict(self):
-        self.edgeLengthDict = {}
-        # self.get_edge_list() # for use alone
-        for edge in self.edgeList:
-            self.edgeLengthDict[edge] = traci.lane.getLength(edge+"_"+str(0))
+        # self.get_edge_length_list() # for use alone
+        self.edgeLengthDict = dict(zip(self.edgeList, self.edgeLengthList))
 
     def _get_max_speed_list(self):
         self.maxSpeedList = []
-        # self.get_edge()  # for use alone
-        # self.get_lane_index()  # for use alone
-        for i in range(traci.edge.getLaneNumber(self.edge)):
-            self.maxSpeedList.append(traci.lane.getMaxSpeed(self.edge + "_"+str(i)))
-
-    def _classify(self):  # can not use alone
-        self.leftLeaderNeighborList = []
-        self.leftFollowerNeighborList = []
-        self.rightLeaderNeighborList = []
-        self.rightFollowerNeighborList = []
-        self.midLeaderNeighborList = []
-        self.midFollowerNeighborList = []
-        for vehicle in self.neighborList:
-            if vehicle['lane_number'] - vehicle['lane_index'] == self.laneNumber - self.laneIndex:
-                if vehicle['relative_lane_position'] > 0:
-                    self.midLeaderNeighborList.append(vehicle)
-                if vehicle['relative_lane_position'] < 0:
-                    self.midFollowerNeighborList.append(vehicle)
-            if vehicle['lane_number'] - vehicle['lane_index'] == self.laneNumber - self.laneIndex + 1:
-                if vehicle['relative_lane_position'] > 0:
-                    self.rightLeaderNeighborList.append(vehicle)
-                if vehicle['relative_lane_position'] < 0:
-                    self.rightFollowerNeighborList.append(vehicle)
-            if vehicle['lane_number'] - vehicle['lane_index'] == self.laneNumber - self.laneIndex - 1:
-                if vehicle['relative_lane_position'] > 0:
-                    self.leftLeaderNeighborList.append(vehicle)
-                if vehicle['relative_lane_position'] < 0:
-                    self.leftFollowerNeighborList.append(vehicle)
-
-    def get_surroundings(self):
-        self._get_edge()
-        self._get_lane_number()
-        self._get_lane_index()
-        self._get_edge_list()
-        self._get_edge_dict()
-        self._get_edge_length_list()
-        self._get_edge_length_dict()
-        self._get_max_speed_list()
-        self._get_neighbor_list()
-        self._classify()
+        # self.get_lane_number()  # for use alone
+        for i in range(self.laneNumber):
+            if self.network is not None:
+                self.maxSpeedList.append(self.network.get_lane_max_speed(self.edge + "_"+str(i)))
+            else:
+                self.maxSpeedList.append(self.connection.lane.getMaxSpeed(self.edge + "_"+str(i)))
+
+    def _classify(self):
+        self._refresh('neighbor', self._get_neighbor_list)
+        self._refresh('lane_index', self._get_lane_index)
+        if self.columnar:
+            self._classify_columnar()
+            return
+        # every list is ordered nearest first, DataProcess and EgoVehicle take the first entries without sorting
+        self._refresh('index', self._update_neighbor_index)
+        index = self.neighborIndex
+        lane = self.laneNumber - self.laneIndex  # lane key of the index, counted from the left
+        self.midLeaderNeighborList = index.leaders(lane, self.x)
+        self.midFollowerNeighborList = index.followers(lane, self.x)
+        self.rightLeaderNeighborList = index.leaders(lane + 1, self.x)
+        self.rightFollowerNeighborList = index.followers(lane + 1, self.x)
+        self.leftLeaderNeighborList = index.leaders(lane - 1, self.x)
+        self.leftFollowerNeighborList = index.followers(lane - 1, self.x)
+        if self.contextFilter is not None and self.contextFilter.maxVehicles is not None:
+            n = self.contextFilter.maxVehicles
+            self.midLeaderNeighborList = self.midLeaderNeighborList[:n]
+            self.midFollowerNeighborList = self.midFollowerNeighborList[:n]
+            self.rightLeaderNeighborList = self.rightLeaderNeighborList[:n]
+            self.rightFollowerNeighborList = self.rightFollowerNeighborList[:n]
+            self.leftLeaderNeighborList = self.leftLeaderNeighborList[:n]
+            self.leftFollowerNeighborList = self.leftFollowerNeighborList[:n]
+
+    def _update_neighbor_index(self):
+        self._refresh('neighbor', self._get_neighbor_list)
+        self.neighborIndex.update(self.neighborList)
+
+    def _classify_columnar(self):
+        rows = self.neighborTable.classify(self.laneNumber, self.laneIndex)
+        if self.contextFilter is not None and self.contextFilter.maxVehicles is not None:
+            n = self.contextFilter.maxVehicles
+            rows = dict((lane, (leaders[:n], followers[:n])) for lane, (leaders, followers) in rows.items())
+        self.classifyRows = rows
+        self.leftLeaderNeighborList = self.neighborTable.get_dict_list(rows[LEFT][0])
+        self.leftFollowerNeighborList = self.neighborTable.get_dict_list(rows[LEFT][1])
+        self.midLeaderNeighborList = self.neighborTable.get_dict_list(rows[MID][0])
+        self.midFollowerNeighborList = self.neighborTable.get_dict_list(rows[MID][1])
+        self.rightLeaderNeighborList = self.neighborTable.get_dict_list(rows[RIGHT][0])
+        self.rightFollowerNeighborList = self.neighborTable.get_dict_list(rows[RIGHT][1])
+
+    def get_surroundings(self):  # call once per simulation step, values are read lazily by the getters
+        self.step += 1
+
+    def extrapolate(self, x, y, dt):
+        """advance the neighbors of the last perception by dt at constant speed, relative to the ego at (x, y)
+
+        Used between two perceptions instead of get_surroundings. The lists keep the lane and order of the
+        perception, a vehicle that passes the ego stays in its list until the next perception.
+        """
+        self.x, self.y = x, y
+        if self.columnar:
+            table = self.neighborTable
+            table.positionX = table.positionX + table.speed * dt  # the safety filter may hold the old array
+            table.relativePositionX = table.positionX - x
+            table.relativePositionY = table.positionY - y
+            vehicles = [vehicle for vehicle in table.dictList if vehicle is not None]
+        else:
+            vehicles = self.neighborList or ()
+        for vehicle in vehicles:
+            vehicle['position_x'] += vehicle['speed'] * dt
+            relative_x = vehicle['position_x'] - x
+            vehicle['relative_position_x'] = relative_x
+            vehicle['relative_position_y'] = vehicle['position_y'] - y
+            vehicle['relative_lane_position'] = relative_x
+            vehicle['relative_lane_position_abs'] = math.fabs(relative_x)
+
+    def adapt_context(self, speed):
+        """subscribe again if the distances of the ContextFilter for the ego speed grew, or shrank by more than one
+        dist_step; the speed is passed in, the ego moved by moveToXY has no speed of its own in sumo"""
+        if self.contextFilter is None or not self.contextFilter.horizon:
+            return
+        downstream, upstream = self.contextFilter.get_distances(speed)
+        margin = self.contextFilter.distStep
+        if (downstream > self.downstreamDist or upstream > self.upstreamDist or
+                downstream < self.downstreamDist - margin or upstream < self.upstreamDist - margin):
+            self.downstreamDist, self.upstreamDist = downstream, upstream
+            self._subscribe_ego_vehicle_surrounding()
+            self.resubscriptions += 1
 
     def _subscribe_ego_vehicle_surrounding(self):
-        traci.vehicle.subscribeContext(self.id, tc.CMD_GET_VEHICLE_VARIABLE, 200.0,
-                                       [tc.VAR_LANE_INDEX, tc.VAR_POSITION,
-                                        tc.VAR_SPEED, tc.VAR_ROAD_ID, tc.VAR_LANEPOSITION,
-                                        tc.VAR_LANEPOSITION_LAT, tc.VAR_EDGES])
-        # traci.vehicle.addSubscriptionFilterLanes([-2, -1, 0, 1, 2], noOpposite=True,
-        #                                          downstreamDist=self.downstreamDist,
-        #                                          upstreamDist=self.upstreamDist)
+        context_filter = self.contextFilter
+        if context_filter is None:
+            self.connection.vehicle.subscribeContext(self.id, tc.CMD_GET_VEHICLE_VARIABLE, CONTEXT_RADIUS,
+                                                     CONTEXT_VARIABLES)
+            return
+        # the filters apply to the last context subscription, they are sent again with every subscribeContext
+        vehicle = self.connection.vehicle
+        vehicle.subscribeContext(self.id, tc.CMD_GET_VEHICLE_VARIABLE, max(self.downstreamDist, self.upstreamDist),
+                                 CONTEXT_VARIABLES)
+        if context_filter.laneOffsets is not None and context_filter.maxVehicles != 1:
+            vehicle.addSubscriptionFilterLanes(context_filter.laneOffsets, noOpposite=True,
+                                               downstreamDist=self.downstreamDist, upstreamDist=self.upstreamDist)
+            return
+        if context_filter.maxVehicles == 1:
+            vehicle.addSubscriptionFilterLeadFollow(context_filter.laneOffsets or [-1, 0, 1])
+        vehicle.addSubscriptionFilterDownstreamDistance(self.downstreamDist)
+        vehicle.addSubscriptionFilterUpstreamDistance(self.upstreamDist)
 
     def _get_lane_number_dict(self):
-        self.edgeIdList = traci.edge.getIDList()
+        if self.network is not None:
+            self.edgeIdList = self.network.get_edge_id_list()
+            self.laneNumberDict = self.network.get_lane_number_dict()
+            return
+        self.edgeIdList = self.connection.edge.getIDList()
         self.laneNumberDict = {}
         for edge in self.edgeIdList:
-            self.laneNumberDict[edge] = traci.edge.getLaneNumber(edge)
+            self.laneNumberDict[edge] = self.connection.edge.getLaneNumber(edge)
 
     def surrounding_init(self):
+        if self.contextFilter is not None:
+            self.downstreamDist, self.upstreamDist = self.contextFilter.get_distances(0.0)
         self._subscribe_ego_vehicle_surrounding()
         self._get_lane_number_dict()
 
 
 class Traffic:
-    def __init__(self, trafficBase=0.5, trafficList=None):
+    def __init__(self, trafficBase=0.5, trafficList=None, egoNumber=1, routeFile="data/motorway.rou.xml"):
         self.trafficBase = trafficBase
         self.trafficList = trafficList
+        self.routeFile = routeFile  # 随机场景见scenarioGenerator，按参数和seed缓存，不会互相覆盖
+        self.egoNumber = egoNumber  # ego, ego1, ego2 ... 除了ego之外的都在空闲位置出发
         if self.trafficList is None:
             self.traffic_init_general()
         else:
             self.traffic_init_custom()
 
     def traffic_init_custom(self):
-        with open("data/motorway.rou.xml", "w") as routes:
+        with open(self.routeFile, "w") as routes:
             print("""<routes>
                     <vType id="pkw_f" accel="0.8" decel="4.5" sigma="0.5" length="5" minGap="2.5" maxSpeed="35" \
             guiShape="passenger" laneChangeModel="SL2015" latAlignment="center" color="green"/>
@@ -225,10 +430,16 @@ class Traffic:
             print(
                 '     	<trip id="ego" type="pkw_special" depart="30" from="gneE0" to="gneE7" departLane="free" departSpeed ="random"/> ',
                 file=routes)
+            self._print_extra_egos(routes, 'depart="30" from="gneE0" to="gneE7"', tag='trip')
             # print("""       <vehicle id="ego" type="pkw_special" route="route_ego" depart="30" color="blue"/>""",
             #       file=routes)
             print("</routes>", file=routes)
 
+    def _print_extra_egos(self, routes, attributes, tag='vehicle'):
+        for i in range(1, self.egoNumber):
+            print('       <%s id="ego%d" type="pkw_special" %s departLane="free" departPos="free" color="blue"/>'
+                  % (tag, i, attributes), file=routes)
+
     # def traffic_init_general(self):
     #     f_rate = random.uniform(0.4, 0.6)
     #     s_rate = random.uniform(0.05, 0.1)
@@ -311,7 +522,7 @@ class Traffic:
     #         print("</routes>", file=routes)
 
     def traffic_init_general(self):
-        with open("data/motorway.rou.xml", "w") as routes:
+        with open(self.routeFile, "w") as routes:
             print("""<routes>
                 <vType id="pkw_f" accel="0.8" decel="4.5" sigma="0.5" length="5" minGap="2.5" maxSpeed="25" \
         guiShape="passenger" laneChangeModel="SL2015" latAlignment="center" color="green"/>
@@ -328,5 +539,6 @@ class Traffic:
             )
             print("""       <vehicle id="left1" type="pkw_f" route="route_other" departLane="1" depart="0" color="yellow"/>""", file=routes)
             print("""       <vehicle id="ego" type="pkw_special" route="route_ego" departLane="1" depart="10" color="blue"/>""", file=routes)
+            self._print_extra_egos(routes, 'route="route_ego" depart="10"')
             print("""       <vehicle id="left2" type="pkw_m" route="route_other" departLane="1" depart="20" color="yellow"/>""", file=routes)
             print("</routes>", file=routes)
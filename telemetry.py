@@ -0,0 +1,202 @@
+# coding:utf-8
+import json
+import queue
+import struct
+import threading
+import numpy as np
+
+LEVEL_OFF = 0
+LEVEL_STATE = 1  # ego state and control outputs
+LEVEL_FULL = 2  # plus the leading vehicle and the current mission
+
+# name columns (ego, edge, leader) hold an index into the string table of the file
+STATE_FIELDS = [('step', 'i8'), ('time', 'f8'), ('ego', 'i4'), ('x', 'f8'), ('y', 'f8'), ('vx', 'f8'), ('vy', 'f8'),
+                ('speed', 'f8'), ('edge', 'i4'), ('lane_index', 'i2'), ('n_lane', 'i2'), ('y_lane', 'f8'),
+                ('state', 'i1'), ('ax_ctl', 'f8'), ('ay_ctl', 'f8'), ('vx_ctl', 'f8'), ('vy_ctl', 'f8'),
+                ('angle_ctl', 'f8')]
+FULL_FIELDS = STATE_FIELDS + [('leader', 'i4'), ('leader_virtual', 'i1'), ('leader_gap', 'f8'),
+                              ('leader_speed', 'f8'), ('m_type', 'i1'), ('c_type', 'i1'), ('missions', 'i2')]
+NAME_FIELDS = ('ego', 'edge', 'leader')
+_HEADER = struct.Struct('<I')
+
+
+def telemetry_dtype(level):
+    return np.dtype(FULL_FIELDS if level >= LEVEL_FULL else STATE_FIELDS)
+
+
+class TelemetryLogger:
+    """per-step ego telemetry in a preallocated ring of chunks, written to disk by a background thread
+
+    log() only fills one row of the current chunk. A full chunk is handed to the writer thread, which
+    appends it column by column to path: a little-endian uint32 header length, a JSON header (rows,
+    columns, strings added since the last chunk) and the raw columns. log() blocks only if all chunks
+    are waiting for the writer. every=N logs the steps that are a multiple of N.
+    """
+    def __init__(self, path, level=LEVEL_STATE, every=1, chunk_size=1024, chunks=4):
+        self.path = path
+        self.level = level
+        self.every = max(1, every)
+        self.dtype = telemetry_dtype(level)
+        self.buffer = np.zeros((chunks, chunk_size), dtype=self.dtype)
+        self.chunkSize = chunk_size
+        self.stringDict = {}
+        self.newStrings = []
+        self.freeChunks = queue.Queue()
+        self.fullChunks = queue.Queue()
+        for chunk in range(1, chunks):
+            self.freeChunks.put(chunk)
+        self.chunk = 0
+        self.row = 0
+        self.error = None
+        self.file = None  # level LEVEL_OFF logs nothing and leaves path alone
+        self.writer = None
+        if level > LEVEL_OFF:
+            self.file = open(path, 'wb')
+            self.writer = threading.Thread(target=self._write_loop, name='telemetry-writer', daemon=True)
+            self.writer.start()
+
+    def _string_id(self, string):
+        index = self.stringDict.get(string)
+        if index is None:
+            index = self.stringDict[string] = len(self.stringDict)
+            self.newStrings.append(string)
+        return index
+
+    def log(self, step, ego_vehicle):
+        if self.level == LEVEL_OFF:
+            return
+        if step % self.every:  # by step, so that every ego of the step is logged
+            return
+        e = ego_vehicle
+        row = (step, step * e.timeStep, self._string_id(e.id), e.x, e.y, e.vx, e.vy, e.vx0, self._string_id(e.edgeID),
+               e.laneIndex, e.nLane, e.yLane, e.state, e.axCtl, e.ayCtl, e.vxCtl, e.vyCtl, e.angleCtl)
+        if self.level >= LEVEL_FULL:
+            leader = e.leadingVehicle or {}
+            mission = e.missionList[0] if e.missionList else None
+            row += (self._string_id(leader.get('name', '')), leader.get('virtual', 1),
+                    leader.get('relative_position_x', 0.0), leader.get('speed', 0.0),
+                    mission['m_type'] if mission else 0, mission['c_type'] if mission else 0, len(e.missionList))
+        self.buffer[self.chunk, self.row] = row
+        self.row += 1
+        if self.row == self.chunkSize:
+            self.flush()
+
+    def log_fleet(self, step, fleet):
+        """one row per ego of an egoFleet.EgoFleet, filled column by column"""
+        if self.level == LEVEL_OFF or len(fleet) == 0:
+            return
+        if step % self.every:
+            return
+        f = fleet
+        columns = {'step': step, 'time': step * f.timeStep, 'ego': self._string_ids(f.idList), 'x': f.x, 'y': f.y,
+                   'vx': f.vx, 'vy': f.vy, 'speed': f.vx0, 'edge': self._string_ids(f.edgeID),
+                   'lane_index': f.laneIndex, 'n_lane': f.nLane, 'y_lane': f.yLane, 'state': f.state,
+                   'ax_ctl': f.axCtl, 'ay_ctl': f.ayCtl, 'vx_ctl': f.vxCtl, 'vy_ctl': f.vyCtl, 'angle_ctl': f.angleCtl}
+        if self.level >= LEVEL_FULL:
+            columns.update({'leader': self._string_ids(f.leaderName), 'leader_virtual': f.leaderVirtual,
+                            'leader_gap': f.leaderX - f.x, 'leader_speed': f.leaderSpeed, 'm_type': f.stage,
+                            'c_type': f.stage, 'missions': f.get_mission_count()})
+        first = 0
+        while first < len(f):
+            rows = min(len(f) - first, self.chunkSize - self.row)
+            chunk = self.buffer[self.chunk, self.row:self.row + rows]
+            for name, column in columns.items():
+                chunk[name] = column if np.ndim(column) == 0 else column[first:first + rows]
+            first += rows
+            self.row += rows
+            if self.row == self.chunkSize:
+                self.flush()
+
+    def _string_ids(self, strings):
+        return np.fromiter((self._string_id(string) for string in strings), np.int32, len(strings))
+
+    def flush(self):
+        """hand the current chunk to the writer, even if it is not full"""
+        if self.row == 0 or self.writer is None:
+            return
+        if self.error is not None:
+            raise self.error
+        self.fullChunks.put((self.chunk, self.row, self.newStrings))
+        self.newStrings = []
+        self.chunk = self.freeChunks.get()
+        self.row = 0
+
+    def _write_loop(self):
+        while True:
+            item = self.fullChunks.get()
+            if item is None:
+                break
+            chunk, rows, strings = item
+            try:
+                data = self.buffer[chunk, :rows]
+                header = json.dumps({'rows': rows, 'strings': strings,
+                                     'columns': [[name, self.dtype[name].str] for name in self.dtype.names]}).encode()
+                self.file.write(_HEADER.pack(len(header)))
+                self.file.write(header)
+                for name in self.dtype.names:
+                    self.file.write(np.ascontiguousarray(data[name]).tobytes())
+            except Exception as error:  # raised again in the thread that logs
+                self.error = error
+            self.freeChunks.put(chunk)
+
+    def close(self):
+        if self.writer is not None:
+            self.flush()
+            self.fullChunks.put(None)
+            self.writer.join()
+            self.writer = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        if self.error is not None:
+            raise self.error
+
+
+class TelemetryReader:
+    """decodes a telemetry file into one NumPy array per column"""
+    def __init__(self, path):
+        self.strings = []
+        chunk_list = []
+        with open(path, 'rb') as f:
+            while True:
+                size = f.read(_HEADER.size)
+                if len(size) < _HEADER.size:
+                    break
+                header = json.loads(f.read(_HEADER.unpack(size)[0]))
+                self.strings.extend(header['strings'])
+                columns = {}
+                for name, dtype in header['columns']:
+                    dtype = np.dtype(dtype)
+                    columns[name] = np.frombuffer(f.read(dtype.itemsize * header['rows']), dtype=dtype)
+                chunk_list.append(columns)
+        self.columns = {}
+        if chunk_list:
+            for name in chunk_list[0]:
+                self.columns[name] = np.concatenate([columns[name] for columns in chunk_list])
+
+    def __len__(self):
+        return len(self.columns['step']) if self.columns else 0
+
+    def get(self, name):
+        return self.columns[name]
+
+    def get_names(self, name):
+        """a name column (ego, edge, leader) as an array of strings"""
+        return np.array(self.strings, dtype=object)[self.columns[name]] if len(self) else np.zeros(0, dtype=object)
+
+    def select(self, ego_id):
+        """the columns of one ego"""
+        mask = self.columns['ego'] == self.strings.index(ego_id)
+        return dict((name, column[mask]) for name, column in self.columns.items())
+
+
+if __name__ == "__main__":
+    # summary of a telemetry file, e.g. python telemetry.py telemetry.bin
+    import sys
+    reader = TelemetryReader(sys.argv[1])
+    print("%d rows, columns: %s" % (len(reader), ', '.join(reader.columns)))
+    for ego_id in sorted(set(reader.get_names('ego'))):
+        columns = reader.select(ego_id)
+        print("%s: steps %d-%d, mean speed %.2f m/s, lane changes %d"
+              % (ego_id, columns['step'][0], columns['step'][-1], columns['vx'].mean(),
+                 int(np.count_nonzero(np.diff(columns['lane_index'])))))
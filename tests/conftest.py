@@ -0,0 +1,30 @@
+# coding:utf-8
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+if 'SUMO_HOME' not in os.environ:  # the modules only need the sumo tools, the eclipse-sumo wheel ships them
+    try:
+        import sumo
+        os.environ['SUMO_HOME'] = sumo.SUMO_HOME
+    except ImportError:
+        pass
+
+NET_FILE = os.path.join(ROOT, 'data', 'motorway.net.xml')
+BENCH_DIR = os.path.join(ROOT, 'data', 'bench')
+
+
+def write_config(directory, routes, step_length=0.1, end=None):
+    """a sumo config of motorway.net.xml with the route file content routes, for KinematicSimulation"""
+    route_file = os.path.join(str(directory), 'test.rou.xml')
+    with open(route_file, 'w') as f:
+        f.write('<routes>\n%s\n</routes>\n' % routes)
+    config_file = os.path.join(str(directory), 'test.sumocfg')
+    with open(config_file, 'w') as f:
+        f.write('<configuration>\n'
+                '    <input><net-file value="%s"/><route-files value="%s"/></input>\n'
+                '    <time><begin value="0"/><step-length value="%s"/>%s</time>\n'
+                '</configuration>\n' % (NET_FILE, route_file, step_length,
+                                        '' if end is None else '<end value="%s"/>' % end))
+    return config_file
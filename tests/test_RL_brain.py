@@ -0,0 +1,97 @@
+# coding:utf-8
+import os
+import numpy as np
+import pytest
+from conftest import NET_FILE, BENCH_DIR
+from benchmark import FixtureConnection, load_fixture
+from roadNetwork import RoadNetwork
+from egoVehicle import EgoVehicle
+from RL_brain import DataProcess, BatchDataProcess, SumTree, ReplayBuffer, LANE_NUMBER, VEHICLE_DATA_SIZE
+
+
+def test_sum_tree_prefix_search():
+    rng = np.random.default_rng(0)
+    tree = SumTree(100)
+    assert tree.capacity == 128
+    priorities = rng.random(100)
+    tree.update(np.arange(100), priorities)
+    tree.update([3, 3, 50], [0.0, 2.0, 0.0])  # the last write of an index wins
+    priorities[3], priorities[50] = 2.0, 0.0
+    assert tree.total() == pytest.approx(priorities.sum())
+    assert np.array_equal(tree.get([3, 50, 99]), priorities[[3, 50, 99]])
+    values = rng.random(1000) * tree.total()
+    expected = np.searchsorted(np.cumsum(priorities), values, side='right')
+    assert np.array_equal(tree.find(values), expected)
+    assert 50 not in tree.find(values)
+
+
+def test_sum_tree_of_one_leaf():
+    tree = SumTree(1)
+    tree.update([0], [0.5])
+    assert tree.total() == 0.5
+    assert list(tree.find([0.0, 0.49])) == [0, 0]
+
+
+def transitions(n, start=0):
+    observation = np.arange(start, start + n, dtype=np.float32)[:, None, None] * np.ones((LANE_NUMBER,
+                                                                                          VEHICLE_DATA_SIZE))
+    return observation, np.arange(start, start + n) % 3, np.arange(start, start + n, dtype=np.float32), \
+        observation + 1, np.arange(start, start + n) % 2 == 0
+
+
+def test_replay_buffer_wraps_around():
+    buffer = ReplayBuffer(5, seed=0)
+    buffer.add_batch(*transitions(3))
+    buffer.add_batch(*transitions(4, start=3))
+    assert len(buffer) == 5 and buffer.position == 2
+    assert list(buffer.reward) == [5, 6, 2, 3, 4]
+    observation, action, reward, next_observation, done, weight, rows = buffer.sample(64)
+    assert np.array_equal(observation[:, 0, 0], reward)
+    assert np.array_equal(next_observation, observation + 1)
+    assert np.array_equal(action, reward.astype(int) % 3)
+    assert set(rows) == {0, 1, 2, 3, 4}  # new transitions all have the maximum priority
+    assert np.allclose(weight, 1.0)
+
+
+def test_replay_buffer_samples_by_priority():
+    buffer = ReplayBuffer(8, seed=1, alpha=1.0, beta=1.0, epsilon=0.0)
+    buffer.add_batch(*transitions(8))
+    buffer.update_priorities(np.arange(8), [0, 0, 0, 0, 0, 0, 1.0, 3.0])
+    rows = buffer.sample(4000)[6]
+    assert set(rows) == {6, 7}
+    assert np.mean(rows == 7) == pytest.approx(0.75, abs=0.02)
+    weight = buffer.sample(8)[5]
+    assert weight.max() == 1.0 and weight.min() == pytest.approx(1.0 / 3.0)
+
+
+def test_replay_buffer_reopens_its_memmaps(tmp_path):
+    directory = str(tmp_path / 'replay')
+    buffer = ReplayBuffer(6, directory=directory)
+    buffer.add_batch(*transitions(4))
+    buffer.update_priorities([1], [10.0])
+    buffer.flush()
+    reopened = ReplayBuffer(6, directory=directory)
+    assert (len(reopened), reopened.position, reopened.maxPriority) == (4, 4, buffer.maxPriority)
+    assert np.array_equal(reopened.observation, buffer.observation)
+    assert reopened.tree.total() == buffer.tree.total()
+    with pytest.raises(ValueError):
+        ReplayBuffer(7, directory=directory)
+
+
+@pytest.mark.parametrize('columnar', [False, True])
+def test_batch_data_process_matches_data_process(columnar):
+    network = RoadNetwork(NET_FILE)
+    step_list = load_fixture(os.path.join(BENCH_DIR, 'medium.json.gz'))
+    connection = FixtureConnection(step_list, network)
+    ego = EgoVehicle('ego', network=network, connection=connection, columnar=columnar)
+    data_process = DataProcess()
+    batch = BatchDataProcess(3)
+    for i in range(len(step_list)):
+        connection.advance()
+        ego.fresh_data()
+        data_process.set_surrounding_data(ego.surroundings, ego.get_speed())
+        data_process.vehicle_surrounding_data_process()
+        batch.set_surrounding_data(i % 3, ego.surroundings, ego.get_speed())
+        expected = np.array([data_process.get_left_vehicle_data(), data_process.get_mid_vehicle_data(),
+                             data_process.get_right_vehicle_data()], dtype=np.float32)
+        assert np.array_equal(batch.get_env_observation(i % 3), expected)
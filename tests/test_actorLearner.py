@@ -0,0 +1,140 @@
+# coding:utf-8
+import multiprocessing as mp
+import numpy as np
+import pytest
+from actorLearner import TransitionRing, WeightBoard, DQNLearner, OBSERVATION_SCALE
+from RL_brain import ReplayBuffer, LANE_NUMBER, VEHICLE_DATA_SIZE
+from policyEngine import PolicyEngine, OBSERVATION_SIZE
+
+SHAPE = (LANE_NUMBER, VEHICLE_DATA_SIZE)
+LAYERS = (OBSERVATION_SIZE, 16, 4)
+
+
+@pytest.fixture
+def ring():
+    ring = TransitionRing(8)
+    yield ring
+    ring.close()
+    ring.unlink()
+
+
+def push(ring, i):
+    return ring.push(np.full(SHAPE, i), i % 4, float(i), np.full(SHAPE, i + 1), i % 5 == 0)
+
+
+def test_ring_is_bounded_and_wraps(ring):
+    assert all(push(ring, i) for i in range(8))
+    assert not push(ring, 8)  # full until the learner consumes
+    calls = []
+    assert ring.consume(lambda *arrays: calls.append([array.copy() for array in arrays]), max_rows=5) == 5
+    assert all(push(ring, i) for i in range(8, 13))
+    assert len(ring) == 8
+    calls.clear()
+    assert ring.consume(lambda *arrays: calls.append([array.copy() for array in arrays])) == 8
+    assert [list(call[2]) for call in calls] == [[5, 6, 7], [8, 9, 10, 11, 12]]  # wrapped, two calls
+    observation, action, reward, next_observation, done = [np.concatenate(column) for column in zip(*calls)]
+    assert np.array_equal(observation[:, 0, 0], reward)
+    assert np.array_equal(next_observation, observation + 1)
+    assert list(done) == [i % 5 == 0 for i in range(5, 13)]
+    assert ring.consume(lambda *arrays: None) == 0
+
+
+def test_ring_is_shared_by_name(ring):
+    attached = TransitionRing(8, name=ring.name)
+    push(attached, 3)
+    attached.set_policy_version(7)
+    assert len(ring) == 1 and ring.get_policy_version() == 7
+    buffer = ReplayBuffer(16)
+    ring.consume(buffer.add_batch)
+    assert len(buffer) == 1 and buffer.reward[0] == 3.0
+    attached.close()
+
+
+def _produce(name, count):
+    ring = TransitionRing(8, name=name)
+    for i in range(count):
+        while not push(ring, i):
+            pass
+    ring.close()
+
+
+def test_ring_between_processes(ring):
+    count = 500
+    process = mp.get_context('fork').Process(target=_produce, args=(ring.name, count))
+    process.start()
+    rewards = []
+    while len(rewards) < count:
+        ring.consume(lambda observation, action, reward, next_observation, done: rewards.extend(reward))
+    process.join()
+    assert rewards == list(range(count))
+
+
+@pytest.fixture
+def board():
+    board = WeightBoard(LAYERS)
+    yield board
+    board.close()
+    board.unlink()
+
+
+def parameters(value):
+    return [np.full((a, b), value, np.float32) for a, b in zip(LAYERS[:-1], LAYERS[1:])], \
+        [np.full(b, value, np.float32) for b in LAYERS[1:]]
+
+
+def test_board_versions(board):
+    assert board.read() is None
+    assert board.publish(*parameters(1.0)) == 1
+    reader = WeightBoard(LAYERS, name=board.name)
+    version, weights, biases = reader.read()
+    assert version == 1
+    assert [weight.shape for weight in weights] == [(OBSERVATION_SIZE, 16), (16, 4)]
+    assert all((array == 1.0).all() for array in weights + biases)
+    assert reader.read(version) is None
+    assert board.publish(*parameters(2.0)) == 2
+    assert reader.read(version)[0] == 2
+    reader.close()
+
+
+def _publish(name, count):
+    board = WeightBoard(LAYERS, name=name)
+    for i in range(1, count + 1):
+        board.publish(*parameters(float(i)))
+    board.close()
+
+
+def test_board_reads_are_never_torn(board):
+    count = 300
+    process = mp.get_context('fork').Process(target=_publish, args=(board.name, count))
+    process.start()
+    version = 0
+    while version < count:
+        result = board.read(version)
+        if result is None:
+            continue
+        version, weights, biases = result
+        values = np.concatenate([array.ravel() for array in weights + biases])
+        assert (values == values[0]).all()  # one publish, not a mix of two
+    process.join()
+
+
+def test_learner_policy_weights_take_the_raw_observation():
+    rng = np.random.default_rng(0)
+    learner = DQNLearner(hidden_layers=(16,))
+    observation = (rng.random((32,) + SHAPE) * 200).astype(np.float32)
+    expected = learner._forward(observation.reshape(32, OBSERVATION_SIZE) / OBSERVATION_SCALE,
+                                learner.weights, learner.biases)[-1]
+    engine = PolicyEngine(*learner.get_policy_weights())
+    assert np.allclose(engine.forward(observation), expected, rtol=1e-4, atol=1e-4)
+
+
+def test_learner_reduces_the_td_error_on_a_batch():
+    rng = np.random.default_rng(1)
+    learner = DQNLearner(hidden_layers=(32,), learning_rate=1e-3, target_interval=10 ** 6)
+    n = 64
+    batch = ((rng.random((n,) + SHAPE) * 100).astype(np.float32), rng.integers(0, 4, n),
+             rng.random(n).astype(np.float32), (rng.random((n,) + SHAPE) * 100).astype(np.float32), np.ones(n, bool))
+    first = np.abs(learner.train(*batch)).mean()
+    for i in range(200):
+        last = np.abs(learner.train(*batch)).mean()
+    assert last < 0.5 * first
@@ -0,0 +1,58 @@
+# coding:utf-8
+import traci.constants as tc
+from conftest import write_config
+from kinematicSim import KinematicSimulation
+from egoVehicle import EgoVehicle
+
+ROUTES = '''    <vType id="pkw_special" accel="0.8" decel="4.5" length="5" minGap="2.5" maxSpeed="0.000001"/>
+    <route id="route_ego" edges="gneE0 gneE1 gneE2 gneE3 gneE4 gneE5 gneE6 gneE7"/>
+    <vehicle id="ego" type="pkw_special" route="route_ego" depart="0" departLane="1" departSpeed="20"/>'''
+
+
+def drive_off_the_network(tmp_path):
+    """an EgoVehicle with lane keeping missions, until the step after it has left the simulation"""
+    sim = KinematicSimulation.from_config(write_config(tmp_path, ROUTES))
+    sim.simulationStep()
+    ego = EgoVehicle('ego', connection=sim)
+    for i in range(10000):
+        sim.simulationStep()
+        ego.fresh_data()
+        if not ego.egoData.is_present():
+            return sim, ego
+        if i > 0 and len(ego.missionList) == 0:
+            ego.lane_keep_plan()
+        ego.drive()
+    raise AssertionError("the ego did not leave the network")
+
+
+def test_getters_keep_the_last_values_after_the_vehicle_left(tmp_path):
+    sim, ego = drive_off_the_network(tmp_path)
+    ego_data = ego.egoData
+    assert ego_data.get_data() == {}
+    x, y = ego_data.get_position()
+    assert x > 2900  # near the end of gneE7
+    assert ego_data.get_road_id() == 'gneE7'
+    assert ego_data.get_route()[-1] == 'gneE7'
+    assert ego_data.get_lane_index() >= 0
+    assert ego_data.get_speed() >= 0.0
+
+
+def test_fresh_data_keeps_the_state_of_a_departed_ego(tmp_path):
+    sim, ego = drive_off_the_network(tmp_path)
+    state = (ego.x, ego.y, ego.vx, ego.laneIndex, ego.tick, ego.surroundings.step)
+    sim.simulationStep()
+    ego.fresh_data()  # no KeyError from the perception or the ego state
+    assert (ego.x, ego.y, ego.vx, ego.laneIndex, ego.tick, ego.surroundings.step) == state
+    ego.surroundings.get_surroundings()  # Surrounding on its own falls back to the last position
+    assert ego.surroundings.get_lane_index() == ego.laneIndex
+
+
+def test_getters_before_the_first_results(tmp_path):
+    sim = KinematicSimulation.from_config(write_config(tmp_path, ROUTES))
+    ego = EgoVehicle('ego', connection=sim)  # subscribed before the ego departed
+    assert not ego.egoData.is_present()
+    assert ego.egoData.get_position() == (0.0, 0.0)
+    sim.simulationStep()
+    ego.egoData.fresh()
+    assert ego.egoData.is_present()
+    assert ego.egoData.get_position() == ego.egoData.get_data()[tc.VAR_POSITION]
@@ -0,0 +1,106 @@
+# coding:utf-8
+import numpy as np
+from conftest import NET_FILE, write_config
+from kinematicSim import KinematicSimulation
+from roadNetwork import RoadNetwork
+from egoGroup import EgoGroup
+from egoFleet import EgoFleet
+
+EGO_IDS = ('ego', 'ego1', 'ego2', 'ego3')
+ROUTES = '''    <vType id="pkw" accel="2.6" decel="4.5" length="5" minGap="2.5" maxSpeed="25"/>
+    <vType id="pkw_m" accel="2.6" decel="4.5" length="5" minGap="2.5" maxSpeed="18"/>
+    <vType id="pkw_special" accel="0.8" decel="4.5" length="5" minGap="2.5" maxSpeed="0.000001"/>
+    <route id="route_ego" edges="gneE0 gneE1 gneE2 gneE3 gneE4 gneE5 gneE6 gneE7"/>
+    <vehicle id="ego" type="pkw_special" route="route_ego" depart="0" departLane="0" departPos="100"/>
+    <vehicle id="ego1" type="pkw_special" route="route_ego" depart="0" departLane="1" departPos="160"/>
+    <vehicle id="ego2" type="pkw_special" route="route_ego" depart="0" departLane="2" departPos="220"/>
+    <vehicle id="ego3" type="pkw_special" route="route_ego" depart="0" departLane="1" departPos="300"/>
+%s'''
+# (step, ego, action): the same plans go to the EgoGroup and to the fleet, from that step on once the ego is idle
+PLANS = [(2, 'ego3', 'keep'), (5, 'ego', 'left'), (20, 'ego1', 'left'), (30, 'ego2', 'right'),
+         (120, 'ego2', 'left'), (150, 'ego', 'keep')]
+
+
+def traffic():
+    rng = np.random.default_rng(3)
+    trips = []
+    for i in range(24):
+        trips.append('    <trip id="v%d" type="%s" depart="0" from="gneE0" to="gneE7" departLane="%d" '
+                     'departPos="%d" departSpeed="%.1f"/>' % (i, ('pkw', 'pkw_m')[i % 2], i % 3, 20 + 25 * i,
+                                                              rng.uniform(10, 18)))
+    return '\n'.join(trips) + '\n'
+
+
+def start(tmp_path, name):
+    directory = tmp_path / name
+    directory.mkdir()
+    network = RoadNetwork(NET_FILE)
+    sim = KinematicSimulation.from_config(write_config(directory, ROUTES % traffic()), network=network)
+    sim.simulationStep()
+    return network, sim
+
+
+def gap_vehicles(ego, action):
+    if action == 'left':
+        return ego.get_gap_vehicle(ego.leftFrontVehicleList, 1, 0), ego.get_gap_vehicle(ego.leftRearVehicleList, -1, 0)
+    return ego.get_gap_vehicle(ego.rightFrontVehicleList, 1, 2), ego.get_gap_vehicle(ego.rightRearVehicleList, -1, 2)
+
+
+def no_round_trip(*args):
+    raise AssertionError('the fleet reads the subscription results')
+
+
+def test_fleet_matches_the_ego_group(tmp_path, monkeypatch):
+    network, group_sim = start(tmp_path, 'group')
+    group = EgoGroup(network=network, connection=group_sim)
+    for ego_id in EGO_IDS:
+        group.add(ego_id)
+    network, fleet_sim = start(tmp_path, 'fleet')
+    monkeypatch.setattr(fleet_sim.vehicle, 'getPosition', no_round_trip)
+    fleet = EgoFleet(network=network, connection=fleet_sim)
+    for ego_id in EGO_IDS:
+        fleet.add(ego_id)
+    lane_changes = 0
+    pending = list(PLANS)
+    lanes = {ego_id: [] for ego_id in EGO_IDS}
+    for step in range(300):
+        group_sim.simulationStep()
+        fleet_sim.simulationStep()
+        group.fresh_data()
+        fleet.fresh_data()
+        for plan in list(pending):
+            plan_step, ego_id, action = plan
+            ego = group.get_ego(ego_id)
+            if plan_step > step or len(ego.missionList) != 0:  # the fleet does not queue a plan behind another
+                continue
+            pending.remove(plan)
+            if action == 'keep':
+                ego.lane_keep_plan()
+                fleet.lane_keep_plan([ego_id])
+            else:
+                front, rear = gap_vehicles(ego, action)
+                fleet.lane_change_plan(ego_id, dict(front), dict(rear))
+                ego.lane_change_plan(front, rear)
+                lane_changes += 1
+        for ego_id in EGO_IDS:
+            ego, row = group.get_ego(ego_id), fleet.get_row(ego_id)
+            assert (ego.x, ego.y, ego.laneIndex, ego.state) == \
+                (fleet.x[row], fleet.y[row], fleet.laneIndex[row], fleet.state[row]), (step, ego_id)
+            assert (ego.leadingVehicle['name'], ego.followingVehicle['name']) == \
+                (fleet.leaderName[row], fleet.followerName[row]), (step, ego_id)
+            assert len(ego.missionList) == fleet.get_mission_count()[row], (step, ego_id)
+            if ego.state == 2:
+                for gap_vehicle, prefix in ((ego.gapFrontVehicle, 'gapFront'), (ego.gapRearVehicle, 'gapRear')):
+                    assert (gap_vehicle['position_x'], gap_vehicle['speed']) == \
+                        (getattr(fleet, prefix + 'X')[row], getattr(fleet, prefix + 'Speed')[row]), (step, ego_id)
+            # the lane index of the first step is taken without a lane number, as in EgoVehicle
+            if step > 0 and (not lanes[ego_id] or lanes[ego_id][-1] != ego.laneIndex):
+                lanes[ego_id].append(ego.laneIndex)
+        group.drive()
+        fleet.drive()
+        for ego_id in EGO_IDS:
+            ego, row = group.get_ego(ego_id), fleet.get_row(ego_id)
+            assert (ego.vxCtl, ego.vyCtl, ego.axCtl) == (fleet.vxCtl[row], fleet.vyCtl[row], fleet.axCtl[row]), \
+                (step, ego_id)
+    assert not pending and lane_changes == 4
+    assert lanes == {'ego': [0, 1], 'ego1': [1, 2], 'ego2': [2, 1, 2], 'ego3': [1]}
@@ -0,0 +1,53 @@
+# coding:utf-8
+import threading
+import pytest
+import traci
+import traci.constants as tc
+from traci.connection import Connection
+import egoGroup
+from egoGroup import run_batched, get_traci_connection
+
+
+def detached_connection():
+    """a traci Connection without a socket, enough to queue commands"""
+    connection = Connection.__new__(Connection)
+    connection._lock = threading.RLock()
+    connection._string = bytes()
+    connection._queue = []
+    connection._socket = None
+    return connection
+
+
+def move(connection, x):
+    connection._sendCmd(tc.CMD_SET_VEHICLE_VARIABLE, tc.MOVE_TO_XY, 'ego', 'tsdddi', 5, '', 2, x, -4.8, 90.0)
+
+
+def test_set_commands_are_held_back():
+    connection = detached_connection()
+    run_batched(connection, lambda: [move(connection, x) for x in (1.0, 2.0)])
+    assert connection._queue == [tc.CMD_SET_VEHICLE_VARIABLE] * 2
+    assert '_sendExact' not in vars(connection)  # the class method sends again
+
+
+def test_commands_with_an_answer_raise_and_are_dropped():
+    connection = detached_connection()
+
+    def drive():
+        move(connection, 1.0)
+        held_back = connection._string
+        with pytest.raises(RuntimeError):
+            connection._sendCmd(tc.CMD_GET_VEHICLE_VARIABLE, tc.VAR_SPEED, 'ego')
+        assert connection._string == held_back
+        move(connection, 2.0)
+    run_batched(connection, drive)
+    assert connection._queue == [tc.CMD_SET_VEHICLE_VARIABLE] * 2
+    assert '_sendExact' not in vars(connection)
+
+
+def test_batching_is_limited_to_the_pinned_traci(monkeypatch):
+    connection = detached_connection()
+    assert get_traci_connection(connection) is connection
+    monkeypatch.setattr(traci, '__version__', '1.29.0')
+    assert get_traci_connection(connection) is None
+    monkeypatch.setattr(traci, '__version__', '%d.%d.0' % egoGroup.BATCHED_TRACI_VERSION)
+    assert get_traci_connection(object()) is None  # no socket internals, e.g. KinematicSimulation
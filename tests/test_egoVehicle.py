@@ -0,0 +1,83 @@
+# coding:utf-8
+import pytest
+import traci.constants as tc
+from conftest import NET_FILE, write_config
+from kinematicSim import KinematicSimulation
+from roadNetwork import RoadNetwork
+from egoVehicle import EgoVehicle, CHANGE_LEFT, LANE_WIDTH, RADAR_LIMIT
+
+STEP_LENGTH = 0.1
+ROUTES = '''    <vType id="pkw" accel="2.6" decel="4.5" length="5" minGap="2.5" maxSpeed="25"/>
+    <vType id="pkw_slow" accel="2.6" decel="4.5" length="5" minGap="2.5" maxSpeed="15"/>
+    <vType id="pkw_special" accel="0.8" decel="4.5" length="5" minGap="2.5" maxSpeed="0.000001"/>
+    <route id="route_ego" edges="gneE0 gneE1 gneE2 gneE3 gneE4 gneE5 gneE6 gneE7"/>
+    <trip id="a" type="pkw" depart="0" from="gneE0" to="gneE7" departLane="0" departPos="260" departSpeed="25"/>
+    <trip id="b" type="pkw_slow" depart="0" from="gneE0" to="gneE7" departLane="1" departPos="250" departSpeed="15"/>
+    <vehicle id="ego" type="pkw_special" route="route_ego" depart="0" departLane="1" departPos="200"/>
+%s'''
+# one vehicle per lane at the speed limit of its type, every neighbour keeps its speed
+LEFT_REAR = '''    <trip id="c" type="pkw" depart="0" from="gneE0" to="gneE7" departLane="2" departPos="130" departSpeed="25"/>
+'''
+
+
+def start(tmp_path, perception_interval, left_lane='', columnar=False):
+    network = RoadNetwork(NET_FILE)
+    sim = KinematicSimulation.from_config(write_config(tmp_path, ROUTES % left_lane, step_length=STEP_LENGTH), network=network)
+    sim.simulationStep()
+    return sim, EgoVehicle('ego', network=network, connection=sim, perception_interval=perception_interval,
+                           columnar=columnar)
+
+
+def neighbour_lists(ego):
+    return (ego.leftFrontVehicleList, ego.leftRearVehicleList, ego.midFrontVehicleList, ego.midRearVehicleList,
+            ego.rightFrontVehicleList, ego.rightRearVehicleList)
+
+
+@pytest.mark.parametrize('columnar', [False, True])
+def test_neighbour_lists_are_extrapolated_between_perceptions(tmp_path, columnar):
+    sim, ego = start(tmp_path, perception_interval=5 * STEP_LENGTH, left_lane=LEFT_REAR, columnar=columnar)
+    extrapolated = 0
+    for i in range(30):
+        sim.simulationStep()
+        ego.fresh_data()
+        context = ego.egoData.get_context()
+        assert [len(vehicle_list) for vehicle_list in neighbour_lists(ego)] == [0, 1, 1, 0, 1, 0]
+        for vehicle_list in neighbour_lists(ego):
+            for vehicle in vehicle_list:
+                assert vehicle['position_x'] == pytest.approx(context[vehicle['name']][tc.VAR_POSITION][0])
+                assert vehicle['relative_position_x'] == pytest.approx(vehicle['position_x'] - ego.x)
+                assert vehicle['relative_lane_position'] == vehicle['relative_position_x']
+        table = ego.surroundings.get_neighbor_table()
+        if columnar:  # the arrays read by BatchDataProcess and the safety filter follow the dicts
+            rows = [row for row, name in enumerate(table.nameList) if name != 'ego']
+            assert list(table.positionX[rows]) == pytest.approx([context[table.nameList[row]][tc.VAR_POSITION][0]
+                                                                 for row in rows])
+        assert ego.leadingVehicle is ego.midFrontVehicleList[0]
+        assert ego.followingVehicle['virtual'] == 1  # nobody behind in the ego lane
+        assert ego.followingVehicle['position_x'] == ego.x - RADAR_LIMIT
+        extrapolated += (ego.tick - 1) % ego.perceptionPeriod != 0
+        ego.drive()
+    assert extrapolated == 24
+
+
+def test_virtual_gap_vehicles_advance_in_the_target_lane(tmp_path):
+    sim, ego = start(tmp_path, perception_interval=4 * STEP_LENGTH)
+    for i in range(3):
+        sim.simulationStep()
+        ego.fresh_data()
+        ego.drive()
+    ego.apply_action(CHANGE_LEFT)  # nobody in the left lane, both gap vehicles are virtual
+    assert ego.gapFrontVehicle['virtual'] == 1 and ego.gapRearVehicle['virtual'] == 1
+    target_y = ego.y + LANE_WIDTH
+    previous = (ego.gapFrontVehicle['position_x'], ego.gapRearVehicle['position_x'])
+    steps = 0
+    while ego.state == 2:
+        sim.simulationStep()
+        ego.fresh_data()
+        for vehicle, previous_x in zip((ego.gapFrontVehicle, ego.gapRearVehicle), previous):
+            assert vehicle['position_y'] == target_y
+            assert vehicle['position_x'] - previous_x == pytest.approx(vehicle['speed'] * STEP_LENGTH)
+        previous = (ego.gapFrontVehicle['position_x'], ego.gapRearVehicle['position_x'])
+        ego.drive()
+        steps += 1
+    assert steps > ego.perceptionPeriod
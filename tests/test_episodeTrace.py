@@ -0,0 +1,122 @@
+# coding:utf-8
+import numpy as np
+import traci.constants as tc
+from conftest import NET_FILE, write_config
+from kinematicSim import KinematicSimulation
+from roadNetwork import RoadNetwork
+from egoVehicle import EgoVehicle, CHANGE_LEFT
+from surrounding import ContextFilter
+from episodeTrace import TraceRecorder, TraceReader, replay
+
+ROUTES = '''    <vType id="pkw" accel="2.6" decel="4.5" length="5" minGap="2.5" maxSpeed="25"/>
+    <vType id="slow" accel="2.6" decel="4.5" length="5" minGap="2.5" maxSpeed="5"/>
+    <vType id="pkw_special" accel="0.8" decel="4.5" length="5" minGap="2.5" maxSpeed="0.000001"/>
+    <route id="route_ego" edges="gneE0 gneE1 gneE2 gneE3 gneE4 gneE5 gneE6 gneE7"/>
+    <trip id="front" type="pkw" depart="0" from="gneE0" to="gneE7" departLane="2" departPos="290" departSpeed="20"/>
+    <trip id="right" type="pkw" depart="0" from="gneE0" to="gneE7" departLane="0" departPos="240" departSpeed="20"/>
+    <vehicle id="ego" type="pkw_special" route="route_ego" depart="0" departLane="1" departPos="200"/>
+    <trip id="rear" type="slow" depart="0" from="gneE0" to="gneE7" departLane="2" departPos="180" departSpeed="5"/>
+'''
+PLAN_STEP = 5
+
+
+def snapshot(ego):
+    return repr((ego.x, ego.y, ego.vx, ego.vxCtl, ego.vyCtl, ego.laneIndex, ego.state, ego.missionList,
+                 ego.leadingVehicle, ego.followingVehicle, ego.gapFrontVehicle, ego.gapRearVehicle,
+                 ego.surroundings.get_neighbor_list()))
+
+
+def record_lane_change(tmp_path, steps=600, perception_interval=0.0, context_filter=None):
+    """a left lane change of the ego with the context filter, recorded, and the snapshot of every step"""
+    path = str(tmp_path / 'episode')
+    network = RoadNetwork(NET_FILE)
+    sim = KinematicSimulation.from_config(write_config(tmp_path, ROUTES, step_length=0.01),
+                                          network=network)
+    sim.simulationStep()
+    context_filter = ContextFilter(horizon=0.0) if context_filter is None else context_filter
+    recorder = TraceRecorder(path, step_length=sim.simulation.getDeltaT(), perception_interval=perception_interval,
+                             context_filter=context_filter)
+    ego = EgoVehicle('ego', network=network, connection=sim, recorder=recorder,
+                     perception_interval=perception_interval, context_filter=context_filter)
+    snapshot_list = []
+    gap_outside_context = 0
+    for i in range(steps):
+        sim.simulationStep()
+        ego.fresh_data()
+        if i == PLAN_STEP:
+            ego.apply_action(CHANGE_LEFT)
+            assert ego.gapRearVehicle['name'] == 'rear' and ego.gapFrontVehicle['name'] == 'front'
+        if ego.state == 2 and 'front' not in ego.egoData.get_context() and ego.egoData.get_tracked('front'):
+            gap_outside_context += 1
+        snapshot_list.append(snapshot(ego))
+        ego.drive()
+    recorder.close()
+    return path, network, snapshot_list, gap_outside_context
+
+
+def test_replay_follows_tracked_gap_vehicles_outside_the_context(tmp_path):
+    path, network, live, gap_outside_context = record_lane_change(tmp_path)
+    assert gap_outside_context > 0  # the gap front vehicle ran out of the 100 m downstream context
+
+    replayed = []
+
+    def on_step(index, ego, data_process):
+        if index == PLAN_STEP:
+            ego.apply_action(CHANGE_LEFT)
+        replayed.append(snapshot(ego))
+    assert replay(path, network, on_step=on_step) == len(live)
+    assert replayed == live
+
+
+def test_replay_with_the_recorded_perception_interval_and_context_filter(tmp_path):
+    path, network, live, gap_outside_context = record_lane_change(tmp_path, perception_interval=0.05,
+                                                                  context_filter=ContextFilter(max_vehicles=1))
+    assert TraceReader(path).meta['context_filter']['max_vehicles'] == 1
+
+    replayed = []
+
+    def on_step(index, ego, data_process):
+        if index == PLAN_STEP:
+            ego.apply_action(CHANGE_LEFT)
+        replayed.append(snapshot(ego))
+    assert replay(path, network, on_step=on_step) == len(live)
+    assert replayed == live
+
+
+def test_context_beyond_max_vehicles_is_spilled(tmp_path):
+    network = RoadNetwork(NET_FILE)
+    sim = KinematicSimulation.from_config(write_config(tmp_path, ROUTES), network=network)
+    sim.simulationStep()
+    path = str(tmp_path / 'spill')
+    recorder = TraceRecorder(path, max_vehicles=2)
+    ego = EgoVehicle('ego', network=network, connection=sim, recorder=recorder)
+    live = []
+    for i in range(50):
+        sim.simulationStep()
+        ego.fresh_data()
+        live.append((dict(ego.egoData.get_data()), dict(ego.egoData.get_context())))
+        ego.drive()
+    recorder.close()
+    assert max(len(context) for ego_data, context in live) > 2
+    reader = TraceReader(path)
+    assert len(reader) == 50
+    for index, (ego_data, context) in enumerate(live):
+        replayed_ego, replayed_context, tracked = reader.get_step(index)
+        assert replayed_ego == ego_data
+        assert replayed_context == context
+
+
+def test_recording_appends_to_an_existing_trace(tmp_path):
+    path = str(tmp_path / 'append')
+    ego_data = {tc.VAR_POSITION: (1.0, -4.8), tc.VAR_SPEED: 2.0}
+    context = dict(('v%d' % i, {tc.VAR_POSITION: (float(i), -1.6), tc.VAR_SPEED: 1.0}) for i in range(5))
+    for run in range(2):
+        recorder = TraceRecorder(path, max_vehicles=3)
+        recorder.record(ego_data, context, {'v1': {tc.VAR_POSITION: (1.0, -1.6)}})
+        recorder.record({}, {}, {})
+        recorder.close()
+    reader = TraceReader(path)
+    assert len(reader) == 4
+    assert reader.get_step(2) == (ego_data, context, {'v1': {tc.VAR_POSITION: (1.0, -1.6)}})
+    assert reader.get_step(3) == ({}, {}, {})
+    assert np.array_equal(reader.blocks['step'], [0, 1, 2, 3])
@@ -0,0 +1,78 @@
+# coding:utf-8
+import numpy as np
+import traci.constants as tc
+from conftest import write_config
+from kinematicSim import KinematicSimulation
+from surrounding import CONTEXT_VARIABLES
+
+ROUTES = '''    <vType id="pkw" accel="2.6" decel="4.5" length="5" minGap="2.5" maxSpeed="25"/>
+    <vType id="pkw_special" accel="0.8" decel="4.5" length="5" minGap="2.5" maxSpeed="0.000001"/>
+    <route id="route_ego" edges="gneE0 gneE1 gneE2 gneE3 gneE4 gneE5 gneE6 gneE7"/>
+    <vehicle id="ego" type="pkw_special" route="route_ego" depart="0" departLane="1" departPos="100"/>
+%s
+    <flow id="f0" type="pkw" from="gneE0" to="gneE7" begin="0" end="3600" probability="0.5" departLane="free"
+          departSpeed="max"/>'''
+
+
+def placed_trips(count):  # downstream first, the way sumo needs them to insert all of them
+    return '\n'.join('    <trip id="v%d" type="pkw" depart="0" from="gneE0" to="gneE7" departLane="%d" departPos="%d" '
+                     'departSpeed="max"/>' % (i, i % 3, 480 - 12 * (i // 3)) for i in range(count))
+
+
+def make_sim(tmp_path, count=60, seed=3):
+    return KinematicSimulation.from_config(write_config(tmp_path, ROUTES % placed_trips(count), step_length=0.01),
+                                           seed=seed)
+
+
+def test_placed_vehicles_are_inserted_at_their_depart_position(tmp_path):
+    sim = make_sim(tmp_path)
+    sim.simulationStep()
+    assert sim.vehicle.getIDCount() == 61
+    assert 480.0 <= sim.vehicle.getPosition('v0')[0] < 481.0  # inserted and driven for one step
+    assert sim.vehicle.getLaneIndex('v1') == 1
+
+
+def test_context_results_match_the_per_vehicle_values(tmp_path):
+    sim = make_sim(tmp_path)
+    sim.simulationStep()
+    sim.vehicle.subscribeContext('ego', tc.CMD_GET_VEHICLE_VARIABLE, 200.0, CONTEXT_VARIABLES)
+    for i in range(300):
+        sim.vehicle.moveToXY('ego', '', 2, sim.vehicle.getPosition('ego')[0] + 0.2, -4.8, 90, 2)
+        sim.simulationStep()
+    context = sim.vehicle.getContextSubscriptionResults('ego')
+    assert len(context) > 4  # built column by column
+    for name, values in context.items():
+        assert values == sim._values(sim.rowDict[name], CONTEXT_VARIABLES)
+        assert type(values[tc.VAR_SPEED]) is float and type(values[tc.VAR_LANE_INDEX]) is int
+
+
+def test_same_seed_same_run(tmp_path):
+    runs = []
+    for attempt in range(2):
+        sim = make_sim(tmp_path, count=30, seed=5)
+        for i in range(500):
+            sim.simulationStep()
+        rows = np.flatnonzero(sim.active)
+        runs.append(sorted((sim.nameList[row], sim.x[row], sim.slot[row]) for row in rows))
+    assert runs[0] == runs[1]
+
+
+def test_vehicles_keep_their_distance(tmp_path):
+    sim = make_sim(tmp_path)
+    for i in range(1000):
+        sim.simulationStep()
+        rows = np.flatnonzero(sim.active & ~sim.controlled)
+        leader = sim._leaders(np.flatnonzero(sim.active))[rows]
+        ahead = leader >= 0
+        gaps = sim.x[leader[ahead]] - sim.length[leader[ahead]] - sim.x[rows[ahead]]
+        assert (gaps > 0).all()
+
+
+def test_a_second_subscription_adds_its_variables(tmp_path):
+    sim = make_sim(tmp_path, count=3)
+    sim.simulationStep()
+    sim.vehicle.subscribe('ego', (tc.VAR_POSITION, tc.VAR_SPEED, tc.VAR_ROAD_ID))
+    sim.vehicle.subscribe('ego', (tc.VAR_POSITION, tc.VAR_SPEED, tc.VAR_LANE_INDEX))  # as sumo, not replaced
+    sim.simulationStep()
+    assert list(sim.vehicle.getSubscriptionResults('ego')) == [tc.VAR_POSITION, tc.VAR_SPEED, tc.VAR_ROAD_ID,
+                                                               tc.VAR_LANE_INDEX]
@@ -0,0 +1,54 @@
+# coding:utf-8
+from conftest import NET_FILE, write_config
+from kinematicSim import KinematicSimulation
+from laneChangeEnv import LaneChangeEnv, LANE_KEEP
+from scenarioGenerator import ScenarioCache
+
+ROUTES = '''    <vType id="pkw_special" accel="0.8" decel="4.5" length="5" minGap="2.5" maxSpeed="0.000001"/>
+    <vType id="pkw_f" accel="0.8" decel="4.5" length="5" minGap="2.5" maxSpeed="25"/>
+    <route id="route_ego" edges="gneE0 gneE1 gneE2 gneE3 gneE4 gneE5 gneE6 gneE7"/>
+    <vehicle id="ego" type="pkw_special" route="route_ego" depart="0" departLane="1" departSpeed="20"/>
+    <flow id="f0" type="pkw_f" from="gneE0" to="gneE7" begin="0" end="3600" probability="0.3" departLane="free"
+          departSpeed="max"/>'''
+
+
+def make_env(tmp_path, max_steps):
+    config_file = write_config(tmp_path, ROUTES)
+    return LaneChangeEnv(config_file=config_file, net_file=NET_FILE, regenerate_traffic=False, ego_start_step=2,
+                         max_steps=max_steps, simulation=KinematicSimulation.from_config(config_file))
+
+
+def test_step_ends_the_episode_when_the_ego_leaves(tmp_path):
+    env = make_env(tmp_path, max_steps=10000)
+    env.reset()
+    done = False
+    while not done:
+        observation, reward, done, info = env.step(LANE_KEEP)
+    assert info['step'] < 10000  # the ego drove off the end of the network before the step limit
+    assert reward == 0.0
+    assert 'ego' not in env.connection.vehicle.getIDList()
+    env.reset()  # the next episode loads the simulation again
+    assert env.egoVehicle.data
+    env.close()
+
+
+def test_step_limit(tmp_path):
+    env = make_env(tmp_path, max_steps=20)
+    env.reset()
+    for i in range(20):
+        observation, reward, done, info = env.step(LANE_KEEP)
+        assert done == (i == 19)
+    assert observation.shape == env.dataProcess.get_env_observation(0).shape
+    env.close()
+
+
+def test_random_scenarios_replace_the_config_routes(tmp_path):
+    env = make_env(tmp_path, max_steps=10)
+    env.scenarioCache = ScenarioCache(str(tmp_path / 'scenarios'))  # as random_scenarios=True, outside of data/
+    env.egoStartStep = 300
+    for episode in range(2):
+        env.reset()
+        assert env.connection.routeFiles == [env.routeFile]
+        vehicle_ids = env.connection.vehicle.getIDList()
+        assert 'ego' in vehicle_ids and not any(vehicle_id.startswith('f0.') for vehicle_id in vehicle_ids)
+    env.close()
@@ -0,0 +1,60 @@
+# coding:utf-8
+import os
+import random
+from conftest import NET_FILE, BENCH_DIR
+from neighborTable import NeighborIndex
+from benchmark import FixtureConnection, load_fixture
+from roadNetwork import RoadNetwork
+from egoVehicle import EgoVehicle
+
+
+def random_vehicles(n, seed=0):
+    rng = random.Random(seed)
+    return [{'name': 'v%d' % i, 'position_x': rng.uniform(0.0, 500.0), 'lane_number': 4,
+             'lane_index': rng.randrange(4)} for i in range(n)]
+
+
+def test_neighbor_index_queries_match_a_full_scan():
+    vehicles = random_vehicles(200)
+    index = NeighborIndex()
+    index.update(vehicles)
+    for x in (0.0, 123.4, 250.0, 499.0, vehicles[7]['position_x']):
+        for lane in range(6):
+            in_lane = [v for v in vehicles if v['lane_number'] - v['lane_index'] == lane]
+            leaders = sorted((v for v in in_lane if v['position_x'] > x), key=lambda v: v['position_x'])
+            followers = sorted((v for v in in_lane if v['position_x'] < x), key=lambda v: -v['position_x'])
+            assert index.leaders(lane, x) == leaders
+            assert index.followers(lane, x) == followers
+            assert index.gap(lane, x) == (followers[0] if followers else None, leaders[0] if leaders else None)
+            nearest = sorted(in_lane, key=lambda v: abs(v['position_x'] - x))[:5]
+            assert [abs(v['position_x'] - x) for v in index.k_nearest(lane, x, 5)] == \
+                [abs(v['position_x'] - x) for v in nearest]
+
+
+def test_neighbor_index_is_rebuilt_by_every_update():
+    index = NeighborIndex()
+    index.update(random_vehicles(20, seed=1))
+    index.update([{'name': 'a', 'position_x': 10.0, 'lane_number': 3, 'lane_index': 0}])
+    assert index.leaders(3, 0.0) == [{'name': 'a', 'position_x': 10.0, 'lane_number': 3, 'lane_index': 0}]
+    assert all(index.leaders(lane, 0.0) == [] for lane in (1, 2, 4))
+
+
+def test_indexed_and_columnar_classify_agree_on_a_fixture():
+    network = RoadNetwork(NET_FILE)
+    step_list = load_fixture(os.path.join(BENCH_DIR, 'jam.json.gz'))
+    egos = []
+    for columnar in (False, True):
+        connection = FixtureConnection(step_list, network)
+        egos.append((connection, EgoVehicle('ego', network=network, connection=connection, columnar=columnar)))
+    for i in range(len(step_list)):
+        result = []
+        for connection, ego in egos:
+            connection.advance()
+            ego.fresh_data()
+            s = ego.surroundings
+            result.append([[v['name'] for v in neighbor_list] for neighbor_list in (
+                s.get_left_leader_neighbor_list(), s.get_left_follower_neighbor_list(),
+                s.get_mid_leader_neighbor_list(), s.get_mid_follower_neighbor_list(),
+                s.get_right_leader_neighbor_list(), s.get_right_follower_neighbor_list())])
+        assert result[0] == result[1]
+        assert any(result[0])
@@ -0,0 +1,126 @@
+# coding:utf-8
+import os
+import numpy as np
+import pytest
+from conftest import NET_FILE, BENCH_DIR
+from benchmark import FixtureConnection, load_fixture
+from roadNetwork import RoadNetwork
+from egoVehicle import EgoVehicle, NO_ACTION, LANE_KEEP, CHANGE_LEFT, CHANGE_RIGHT
+from RL_brain import BatchDataProcess
+from policyEngine import PolicyEngine, save_weights, quantize_int8, OBSERVATION_SIZE, EXACT_FLOAT32_INPUTS, INT8_MAX
+
+
+def random_mlp(layers, seed=0):
+    rng = np.random.default_rng(seed)
+    sizes = (OBSERVATION_SIZE,) + tuple(layers) + (4,)
+    weights = [rng.normal(0, 1 / np.sqrt(a), (a, b)).astype(np.float32) for a, b in zip(sizes[:-1], sizes[1:])]
+    biases = [rng.normal(0, 0.1, b).astype(np.float32) for b in sizes[1:]]
+    return weights, biases
+
+
+def fixture_observations(steps=120, density='jam'):
+    network = RoadNetwork(NET_FILE)
+    step_list = load_fixture(os.path.join(BENCH_DIR, density + '.json.gz'))[:steps + 1]
+    connection = FixtureConnection(step_list, network)
+    ego = EgoVehicle('ego', network=network, connection=connection)
+    connection.advance()
+    ego.fresh_data()  # the first speed estimate starts from x = 0
+    batch = BatchDataProcess(steps)
+    for i in range(steps):
+        connection.advance()
+        ego.fresh_data()
+        batch.set_surrounding_data(i, ego.surroundings, ego.get_speed())
+    return batch.get_observation().copy()
+
+
+def reference(observation, weights, biases, activation, mean=None, std=None, int8=False):
+    """float64 forward pass, with int8 the per-row activation and per-output weight quantization of an int8
+    deployment and exact integer accumulation"""
+    x = observation.reshape(len(observation), OBSERVATION_SIZE).astype(np.float64)
+    if mean is not None:
+        x = (x - mean) / std
+    for i, (weight, bias) in enumerate(zip(weights, biases)):
+        if int8:
+            if i == 0 and mean is not None:  # the engine folds the normalization into the first layer
+                weight, bias = weight / std[:, None], bias - (mean / std) @ weight
+                x = observation.reshape(len(observation), OBSERVATION_SIZE).astype(np.float64)
+            weight_int8, scale = quantize_int8(np.asarray(weight, dtype=np.float32))
+            x_scale = np.abs(x).max(axis=1) / INT8_MAX
+            x_scale[x_scale == 0] = 1.0
+            quantized = np.rint(x / x_scale[:, None]).astype(np.int64)
+            x = (quantized @ weight_int8.astype(np.int64)) * x_scale[:, None] * scale + bias
+        else:
+            x = x @ weight + bias
+        if i != len(weights) - 1:
+            x = np.maximum(x, 0.0) if activation == 'relu' else np.tanh(x)
+    return x
+
+
+@pytest.mark.parametrize('activation', ['relu', 'tanh'])
+def test_float32_matches_the_reference(activation):
+    observation = fixture_observations()
+    weights, biases = random_mlp((64, 32))
+    flat = observation.reshape(-1, OBSERVATION_SIZE)
+    mean, std = flat.mean(axis=0), flat.std(axis=0) + 1.0
+    engine = PolicyEngine(weights, biases, activation, mean, std, max_batch=8)  # grows on the first call
+    q = engine.forward(observation)
+    assert q.shape == (len(observation), 4)
+    assert np.allclose(q, reference(observation, weights, biases, activation, mean, std), rtol=1e-4, atol=1e-4)
+    assert np.array_equal(engine.forward(observation[0])[0], q[0])  # a single observation
+
+
+@pytest.mark.parametrize('hidden', [64, EXACT_FLOAT32_INPUTS + 16])  # float32 and int32 accumulation
+def test_int8_matches_an_int8_deployment(hidden):
+    observation = fixture_observations()
+    weights, biases = random_mlp((hidden,))
+    engine = PolicyEngine(weights, biases, dtype='int8')
+    expected = reference(observation, weights, biases, 'relu', int8=True)
+    assert np.allclose(engine.forward(observation), expected, rtol=1e-5, atol=1e-5)
+
+
+def test_int8_stays_close_to_float32():
+    observation = fixture_observations()
+    weights, biases = random_mlp((64, 64))
+    float_q = PolicyEngine(weights, biases).forward(observation).copy()
+    int8_q = PolicyEngine(weights, biases, dtype='int8').forward(observation)
+    assert np.abs(int8_q - float_q).max() < 0.05 * np.abs(float_q).max()
+    assert np.mean(int8_q.argmax(axis=1) == float_q.argmax(axis=1)) > 0.9
+
+
+def test_saved_weights_load_in_their_dtype(tmp_path):
+    observation = fixture_observations(20)
+    weights, biases = random_mlp((32,))
+    path = str(tmp_path / 'policy.npz')
+    save_weights(path, weights, biases, activation='tanh')
+    assert np.array_equal(PolicyEngine.load(path).forward(observation),
+                          PolicyEngine(weights, biases, 'tanh').forward(observation))
+    save_weights(path, weights, biases, quantize='int8')
+    engine = PolicyEngine.load(path)
+    assert engine.dtype == 'int8'
+    dequantized = PolicyEngine.load(path, dtype='float32').forward(observation)
+    float_q = PolicyEngine(weights, biases).forward(observation)
+    assert np.abs(dequantized - float_q).max() < 0.05 * np.abs(float_q).max()
+
+
+def test_decide_on_a_fixture_ego():
+    network = RoadNetwork(NET_FILE)
+    step_list = load_fixture(os.path.join(BENCH_DIR, 'light.json.gz'))
+    connection = FixtureConnection(step_list, network)
+    ego = EgoVehicle('ego', network=network, connection=connection)
+    engine = PolicyEngine(*random_mlp((16,)))
+    for i in range(2):
+        connection.advance()
+        ego.fresh_data()
+    action = engine.decide(ego)
+    assert action in (NO_ACTION, LANE_KEEP, CHANGE_LEFT, CHANGE_RIGHT)
+    assert action == int(engine.forward(fixture_observations(1, 'light')[0])[0].argmax())
+
+
+def test_invalid_arguments():
+    weights, biases = random_mlp((8,))
+    with pytest.raises(ValueError):
+        PolicyEngine(weights, biases, activation='sigmoid')
+    with pytest.raises(ValueError):
+        PolicyEngine(weights, biases, dtype='float16')
+    with pytest.raises(ValueError):
+        PolicyEngine([weights[0][1:]] + weights[1:], biases)
@@ -0,0 +1,89 @@
+# coding:utf-8
+import os
+import numpy as np
+from conftest import NET_FILE, write_config
+from kinematicSim import KinematicSimulation
+from roadNetwork import RoadNetwork
+from egoVehicle import EgoVehicle
+from egoFleet import EgoFleet
+from telemetry import TelemetryLogger, TelemetryReader, LEVEL_OFF, LEVEL_STATE, LEVEL_FULL
+
+ROUTES = '''    <vType id="pkw" accel="2.6" decel="4.5" length="5" minGap="2.5" maxSpeed="25"/>
+    <vType id="pkw_special" accel="0.8" decel="4.5" length="5" minGap="2.5" maxSpeed="0.000001"/>
+    <route id="route_ego" edges="gneE0 gneE1 gneE2 gneE3 gneE4 gneE5 gneE6 gneE7"/>
+    <trip id="a" type="pkw" depart="0" from="gneE0" to="gneE7" departLane="1" departPos="300" departSpeed="20"/>
+    <vehicle id="ego" type="pkw_special" route="route_ego" depart="0" departLane="1" departPos="100"/>
+    <vehicle id="ego1" type="pkw_special" route="route_ego" depart="0" departLane="2" departPos="150"/>
+'''
+
+
+def start(tmp_path):
+    network = RoadNetwork(NET_FILE)
+    sim = KinematicSimulation.from_config(write_config(tmp_path, ROUTES), network=network)
+    sim.simulationStep()
+    return network, sim
+
+
+def test_logged_rows_read_back(tmp_path):
+    network, sim = start(tmp_path)
+    egos = [EgoVehicle(ego_id, network=network, connection=sim) for ego_id in ('ego', 'ego1')]
+    path = str(tmp_path / 'telemetry.bin')
+    logger = TelemetryLogger(path, level=LEVEL_FULL, every=3, chunk_size=7, chunks=2)
+    expected = []
+    for step in range(40):
+        sim.simulationStep()
+        for ego in egos:
+            ego.fresh_data()
+            if step == 1:
+                ego.lane_keep_plan()
+            if step % 3 == 0:  # every=3 logs every ego of every third step
+                expected.append((step, ego.id, ego.x, ego.vxCtl, ego.edgeID, ego.leadingVehicle['name'],
+                                 ego.missionList[0]['c_type'] if ego.missionList else 0))
+            logger.log(step, ego)
+            ego.drive()
+    logger.close()
+    reader = TelemetryReader(path)
+    assert len(reader) == len(expected) == 28
+    assert list(reader.get('step')) == [row[0] for row in expected]
+    assert list(reader.get_names('ego')) == [row[1] for row in expected]
+    assert np.array_equal(reader.get('x'), [row[2] for row in expected])
+    assert np.array_equal(reader.get('vx_ctl'), [row[3] for row in expected])
+    assert list(reader.get_names('edge')) == [row[4] for row in expected]
+    assert list(reader.get_names('leader')) == [row[5] for row in expected]
+    assert list(reader.get('c_type')) == [row[6] for row in expected]
+    assert list(reader.select('ego')['step']) == list(reader.select('ego1')['step']) == list(range(0, 40, 3))
+
+
+def test_fleet_rows_read_back(tmp_path):
+    network, sim = start(tmp_path)
+    fleet = EgoFleet(network=network, connection=sim)
+    fleet.add('ego')
+    fleet.add('ego1')
+    path = str(tmp_path / 'fleet.bin')
+    logger = TelemetryLogger(path, level=LEVEL_STATE, every=2, chunk_size=5)
+    x_list = []
+    for step in range(12):
+        sim.simulationStep()
+        fleet.fresh_data()
+        if step % 2 == 0:
+            x_list.append(fleet.x.copy())
+        logger.log_fleet(step, fleet)
+        fleet.step()
+        fleet.drive()
+    logger.close()
+    reader = TelemetryReader(path)
+    assert 'leader' not in reader.columns
+    assert list(reader.get_names('ego')) == ['ego', 'ego1'] * 6
+    assert np.array_equal(reader.get('x'), np.concatenate(x_list))
+
+
+def test_level_off_writes_no_file(tmp_path):
+    network, sim = start(tmp_path)
+    ego = EgoVehicle('ego', network=network, connection=sim)
+    path = str(tmp_path / 'off.bin')
+    logger = TelemetryLogger(path, level=LEVEL_OFF)
+    sim.simulationStep()
+    ego.fresh_data()
+    logger.log(0, ego)
+    logger.close()
+    assert not os.path.exists(path)
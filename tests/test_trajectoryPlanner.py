@@ -0,0 +1,69 @@
+# coding:utf-8
+import traci.constants as tc
+from conftest import NET_FILE, write_config
+from kinematicSim import KinematicSimulation
+from roadNetwork import RoadNetwork
+from egoVehicle import EgoVehicle
+from egoFleet import EgoFleet, PRE_CHANGE, LEFT
+from trajectoryPlanner import CandidatePlanner, MIN_GAP, TIME_HEADWAY
+
+# the left lane is open by the 10 m window of has_pre_change_to_lane_complete right away, but the vehicle
+# behind is closer than MIN_GAP + TIME_HEADWAY * v, the planner has to accelerate the ego first
+ROUTES = '''    <vType id="pkw" accel="2.6" decel="4.5" length="5" minGap="2.5" maxSpeed="8"/>
+    <vType id="pkw_special" accel="0.8" decel="4.5" length="5" minGap="2.5" maxSpeed="0.000001"/>
+    <route id="route_ego" edges="gneE0 gneE1 gneE2 gneE3 gneE4 gneE5 gneE6 gneE7"/>
+    <trip id="front" type="pkw" depart="0" from="gneE0" to="gneE7" departLane="1" departPos="290" departSpeed="8"/>
+    <vehicle id="ego" type="pkw_special" route="route_ego" depart="0" departLane="0" departPos="200"/>
+    <trip id="rear" type="pkw" depart="0" from="gneE0" to="gneE7" departLane="1" departPos="186" departSpeed="8"/>
+'''
+
+
+def start(tmp_path):
+    network = RoadNetwork(NET_FILE)
+    sim = KinematicSimulation.from_config(write_config(tmp_path, ROUTES), network=network)
+    sim.simulationStep()
+    return network, sim
+
+
+def test_candidate_plan_starts_the_lane_change_at_the_planned_time(tmp_path):
+    network, sim = start(tmp_path)
+    ego = EgoVehicle('ego', network=network, connection=sim)
+    for i in range(3):
+        sim.simulationStep()
+        ego.fresh_data()
+        ego.drive()
+    plan = ego.candidate_lane_change_plan(CandidatePlanner())
+    assert plan['gap_rear_vehicle']['name'] == 'rear' and plan['gap_front_vehicle']['name'] == 'front'
+    assert plan['duration'] > 0.5 and plan['ax'] > 0
+    start_tick = ego.missionList[0]['startTick']
+    assert ego.has_pre_change_to_lane_complete() is False  # the 10 m window alone would accept the gap
+    while ego.missionList[0]['c_type'] == 1:
+        ego.drive()
+        sim.simulationStep()
+        ego.fresh_data()
+    assert ego.tick == start_tick + 1  # completed by the drive() of start_tick
+    rear = ego.egoData.get_tracked('rear')
+    assert ego.x - rear[tc.VAR_POSITION][0] >= MIN_GAP + TIME_HEADWAY * rear[tc.VAR_SPEED] - 1.0
+
+
+def test_fleet_lane_change_waits_for_the_duration(tmp_path):
+    network, sim = start(tmp_path)
+    fleet = EgoFleet(network=network, connection=sim)
+    fleet.add('ego')
+    for i in range(3):
+        sim.simulationStep()
+        fleet.fresh_data()
+        fleet.drive()
+    gap_vehicles = []
+    for name in ('front', 'rear'):
+        x, y = sim.vehicle.getPosition(name)
+        gap_vehicles.append({'name': name, 'virtual': 0, 'lane_index': LEFT, 'position_x': x, 'position_y': y,
+                             'speed': sim.vehicle.getSpeed(name), 'relative_position_x': x - fleet.x[0]})
+    fleet.lane_change_plan('ego', gap_vehicles[0], gap_vehicles[1], ax=4.0, duration=1.5)
+    start_tick = fleet.missionStart[0]
+    assert start_tick == fleet.tick + 15
+    while fleet.stage[0] == PRE_CHANGE:
+        fleet.drive()
+        sim.simulationStep()
+        fleet.fresh_data()
+    assert fleet.tick == start_tick + 1
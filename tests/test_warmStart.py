@@ -0,0 +1,51 @@
+# coding:utf-8
+import os
+import pytest
+from sumolib import checkBinary
+from conftest import NET_FILE, write_config
+from laneChangeEnv import LaneChangeEnv, LANE_KEEP
+from warmStart import SnapshotCache
+
+# saveState and loadState are not in KinematicSimulation, the warm start runs in sumo
+pytestmark = pytest.mark.skipif(not os.path.isfile(checkBinary('sumo')), reason='sumo is not installed')
+
+ROUTES = '''    <vType id="pkw_special" accel="0.8" decel="4.5" length="5" minGap="2.5" maxSpeed="0.000001"/>
+    <vType id="pkw_f" accel="0.8" decel="4.5" length="5" minGap="2.5" maxSpeed="25"/>
+    <route id="route_ego" edges="gneE0 gneE1 gneE2 gneE3 gneE4 gneE5 gneE6 gneE7"/>
+    <vehicle id="ego" type="pkw_special" route="route_ego" depart="0" departLane="1"/>
+    <flow id="f0" type="pkw_f" from="gneE0" to="gneE7" begin="0" end="3600" probability="0.3" departLane="free"
+          departSpeed="max"/>'''
+
+
+def vehicle_state(connection):  # rounded, the state is saved with --save-state.precision 8
+    vehicle = connection.vehicle
+    return connection.simulation.getTime(), {vehicle_id: tuple(round(value, 6) for value in
+                                                               vehicle.getPosition(vehicle_id) +
+                                                               (vehicle.getSpeed(vehicle_id),))
+                                              for vehicle_id in vehicle.getIDList()}
+
+
+def test_restored_episodes(tmp_path):
+    config_file = write_config(tmp_path, ROUTES)
+    snapshot_dir = str(tmp_path / 'snapshots')
+    env = LaneChangeEnv(config_file=config_file, net_file=NET_FILE, regenerate_traffic=False, ego_start_step=100,
+                        max_steps=30, warm_start=True, snapshot_dir=snapshot_dir, label='test_warm_start')
+    try:
+        state_list = []
+        for episode in range(3):
+            env.reset()
+            state_list.append(vehicle_state(env.connection))
+            assert len(os.listdir(snapshot_dir)) == 1  # saved by the first episode, restored by the others
+            done = False
+            while not done:
+                observation, reward, done, info = env.step(LANE_KEEP)
+            assert info['step'] == 30
+        assert len(state_list[0][1]) > 1
+        assert state_list[1] == state_list[0]
+        assert state_list[2] == state_list[0]
+        # the cached snapshot restores the state of the pre-roll again
+        cache = SnapshotCache(snapshot_dir)
+        cache.restore(env.connection, os.listdir(snapshot_dir)[0][:-len('.xml.gz')])
+        assert vehicle_state(env.connection) == state_list[0]
+    finally:
+        env.close()
@@ -0,0 +1,158 @@
+# coding:utf-8
+import sys
+import csv
+import json
+import time
+import traci
+
+DOMAINS = ('vehicle', 'edge', 'lane', 'simulation')
+BUCKET_NUMBER = 40  # latency histogram buckets, bucket i holds calls of [2^(i-1), 2^i) ns
+
+
+class _Stat:
+    __slots__ = ('count', 'totalNs', 'maxNs', 'histogram')
+
+    def __init__(self):
+        self.count = 0
+        self.totalNs = 0
+        self.maxNs = 0
+        self.histogram = [0] * BUCKET_NUMBER
+
+
+class TraciProfiler:
+    """counts and times every traci call, per function, per python caller and per simulation step
+
+    Either wrap a connection (profiler.wrap(connection) is passed to EgoVehicle like a connection) or
+    install() it on the traci module, which is what runner.py uses.
+    """
+    def __init__(self, keep_steps=True, trace=False):
+        self.keepSteps = keep_steps  # keep the call counts of every step
+        self.trace = trace  # keep every single call, (step, function, caller, ns)
+        self.step = 0
+        self.stats = {}  # (function, caller) -> _Stat
+        self.stepCalls = {}  # function -> calls in the current step
+        self.stepList = []  # (step, {function: calls})
+        self.events = []
+        self.callerNames = {}  # code object -> qualified name
+        self.installed = {}
+
+    def _caller(self, frame):
+        code = frame.f_code
+        name = self.callerNames.get(code)
+        if name is None:
+            name = getattr(code, 'co_qualname', code.co_name)
+            self.callerNames[code] = name
+        return name
+
+    def _record(self, function, caller, ns):
+        key = (function, caller)
+        stat = self.stats.get(key)
+        if stat is None:
+            stat = self.stats[key] = _Stat()
+        stat.count += 1
+        stat.totalNs += ns
+        if ns > stat.maxNs:
+            stat.maxNs = ns
+        stat.histogram[min(ns.bit_length(), BUCKET_NUMBER - 1)] += 1
+        self.stepCalls[function] = self.stepCalls.get(function, 0) + 1
+        if self.trace:
+            self.events.append((self.step, function, caller, ns))
+
+    def _end_step(self):
+        if self.keepSteps:
+            self.stepList.append((self.step, self.stepCalls))
+        self.stepCalls = {}
+        self.step += 1
+
+    def profile(self, function, name, is_step=False):
+        profiler = self
+        perf_counter_ns = time.perf_counter_ns
+        getframe = sys._getframe
+
+        def profiled(*args, **kwargs):
+            start = perf_counter_ns()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                profiler._record(name, profiler._caller(getframe(1)), perf_counter_ns() - start)
+                if is_step:
+                    profiler._end_step()
+        return profiled
+
+    def wrap(self, connection):
+        return _ProfiledConnection(connection, self)
+
+    def install(self):  # replaces the domains of the traci module itself
+        for domain in DOMAINS:
+            self.installed[domain] = getattr(traci, domain)
+            setattr(traci, domain, _ProfiledDomain(self.installed[domain], domain, self))
+        self.installed['simulationStep'] = traci.simulationStep
+        traci.simulationStep = self.profile(traci.simulationStep, 'simulationStep', is_step=True)
+
+    def uninstall(self):
+        for name, value in self.installed.items():
+            setattr(traci, name, value)
+        self.installed = {}
+
+    def get_rows(self):
+        rows = []
+        for (function, caller), stat in self.stats.items():
+            rows.append({'function': function, 'caller': caller, 'count': stat.count,
+                         'per_step': stat.count / max(self.step, 1), 'total_ms': stat.totalNs / 1e6,
+                         'mean_us': stat.totalNs / stat.count / 1e3, 'max_us': stat.maxNs / 1e3,
+                         'histogram': stat.histogram})
+        rows.sort(key=lambda row: row['total_ms'], reverse=True)
+        return rows
+
+    def summary(self):
+        lines = ["%d steps" % self.step,
+                 "%-40s %-48s %9s %9s %10s %9s %9s" % ('function', 'caller', 'count', 'per step', 'total ms',
+                                                      'mean us', 'max us')]
+        for row in self.get_rows():
+            lines.append("%-40s %-48s %9d %9.2f %10.2f %9.1f %9.1f" % (
+                row['function'], row['caller'], row['count'], row['per_step'], row['total_ms'], row['mean_us'],
+                row['max_us']))
+        return "\n".join(lines)
+
+    def export_json(self, path):
+        with open(path, 'w') as f:
+            json.dump({'steps': self.step, 'bucket_upper_ns': [1 << i for i in range(BUCKET_NUMBER)],
+                       'functions': self.get_rows(),
+                       'step_calls': [{'step': step, 'calls': calls} for step, calls in self.stepList]}, f)
+
+    def export_csv(self, path):  # one line per call with trace=True, otherwise one line per (function, caller)
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            if self.trace:
+                writer.writerow(['step', 'function', 'caller', 'ns'])
+                writer.writerows(self.events)
+            else:
+                writer.writerow(['function', 'caller', 'count', 'total_ms', 'mean_us', 'max_us'])
+                for row in self.get_rows():
+                    writer.writerow([row['function'], row['caller'], row['count'], row['total_ms'], row['mean_us'],
+                                     row['max_us']])
+
+
+class _ProfiledDomain:
+    def __init__(self, domain, name, profiler):
+        self._domain = domain
+        self._name = name
+        self._profiler = profiler
+
+    def __getattr__(self, item):
+        value = getattr(self._domain, item)
+        if callable(value):
+            value = self._profiler.profile(value, self._name + '.' + item)
+        setattr(self, item, value)  # wrapped once, later lookups don't go through __getattr__
+        return value
+
+
+class _ProfiledConnection:
+    def __init__(self, connection, profiler):
+        self._connection = connection
+        for domain in DOMAINS:
+            setattr(self, domain, _ProfiledDomain(getattr(connection, domain), domain, profiler))
+        self.simulationStep = profiler.profile(connection.simulationStep, 'simulationStep', is_step=True)
+
+    def __getattr__(self, item):
+        return getattr(self._connection, item)
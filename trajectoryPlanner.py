@@ -0,0 +1,127 @@
+# coding:utf-8
+import time
+import numpy as np
+from egoVehicle import RADAR_LIMIT, LANE_WIDTH
+
+ACCELERATIONS = np.linspace(-4.0, 4.0, 17)  # m/s^2, held until the lane change starts
+DURATIONS = np.array([0.5, 1.0, 1.5, 2.0, 3.0, 4.0, 5.0, 6.0])  # s until the lane change starts
+CHANGE_TIME = 3.0  # s the gap has to stay open after the lane change started, about the lateral move of change_to_lane
+DT = 0.2  # s, step of the rollout
+MIN_GAP = 10.0  # m, has_pre_change_to_lane_complete() accepts the gap with the same margin
+TIME_HEADWAY = 1.0  # s, added to MIN_GAP at the speed of the vehicle behind
+VIRTUAL_SPEED = 120 / 3.6
+BUDGET = 0.002  # s of planning per call, checked between two batches of gaps
+# cost weights
+TIME_WEIGHT = 1.0  # per s until the lane change
+EFFORT_WEIGHT = 0.05  # per (m/s^2)^2 s
+SPEED_WEIGHT = 4.0  # per mean squared relative deviation from the desired speed
+LEFT, RIGHT = 0, 2  # lane code of the gap, as lane_change_plan expects it
+
+
+class CandidatePlanner:
+    """picks a lane change gap and acceleration by rolling out every candidate at once
+
+    Every gap of the left and right lane (between two neighbours or one neighbour and a virtual vehicle
+    at RADAR_LIMIT) is combined with every acceleration/duration profile. The ego rollouts are checked
+    against constant speed predictions of the current leader until the lane change starts and of the
+    gap vehicles for change_time after that, the cheapest feasible candidate wins. Gaps are evaluated nearest first in batches until budget seconds are used.
+    """
+    def __init__(self, accelerations=ACCELERATIONS, durations=DURATIONS, change_time=CHANGE_TIME, dt=DT,
+                 min_gap=MIN_GAP, time_headway=TIME_HEADWAY, budget=BUDGET, batch_size=8):
+        self.minGap = min_gap
+        self.timeHeadway = time_headway
+        self.budget = budget
+        self.batchSize = batch_size
+        self.dt = dt
+        horizon = max(durations) + change_time
+        self.times = np.arange(1, int(round(horizon / dt)) + 1) * dt  # (K,)
+        a, d = np.meshgrid(np.asarray(accelerations, dtype=float), np.asarray(durations, dtype=float),
+                           indexing='ij')
+        self.profileAcceleration = a.ravel()  # (P,)
+        self.profileDuration = d.ravel()
+        self.activeTime = np.minimum(self.times[None, :], self.profileDuration[:, None])  # (P, K)
+        self.before = self.times[None, :] < self.profileDuration[:, None] - 1e-9  # still in the ego lane
+        self.changing = ~self.before & (self.times[None, :] <= self.profileDuration[:, None] + change_time + 1e-9)
+        self.baseCost = (TIME_WEIGHT * self.profileDuration +
+                         EFFORT_WEIGHT * self.profileAcceleration ** 2 * self.profileDuration)
+
+    def _rollout(self, x0, v0, v_max):
+        speed = np.clip(v0 + self.profileAcceleration[:, None] * self.activeTime, 0.0, v_max)  # (P, K)
+        position = x0 + np.cumsum(speed, axis=1) * self.dt
+        return position, speed
+
+    @staticmethod
+    def _lane_gaps(ego, front_list, rear_list, lane_code):
+        """(rear, front, lane_code) of every gap in one lane"""
+        y = ego.y + (LANE_WIDTH if lane_code == LEFT else -LANE_WIDTH)
+        rear_virtual = {'virtual': 1, 'name': 'virtual_f', 'position_x': ego.x - RADAR_LIMIT, 'position_y': y,
+                        'speed': VIRTUAL_SPEED}
+        front_virtual = {'virtual': 1, 'name': 'virtual_l', 'position_x': ego.x + RADAR_LIMIT, 'position_y': y,
+                         'speed': VIRTUAL_SPEED}
+        lane = [rear_virtual] + rear_list[::-1] + front_list + [front_virtual]  # rear to front
+        return [(lane[i], lane[i + 1], lane_code) for i in range(len(lane) - 1)]
+
+    def get_gaps(self, ego):  # nearest gap first
+        gaps = []
+        if ego.laneIndex < ego.nLane - 1:
+            gaps += self._lane_gaps(ego, ego.leftFrontVehicleList, ego.leftRearVehicleList, LEFT)
+        if ego.laneIndex > 0:
+            gaps += self._lane_gaps(ego, ego.rightFrontVehicleList, ego.rightRearVehicleList, RIGHT)
+        gaps.sort(key=lambda gap: abs(0.5 * (gap[0]['position_x'] + gap[1]['position_x']) - ego.x))
+        return gaps
+
+    def plan(self, ego, desired_speed=None, v_max=None):
+        """the best feasible candidate as dict, None if no candidate is feasible
+
+        desired_speed and v_max default to the speed limit of the ego lane.
+        """
+        start = time.perf_counter()
+        max_speed_list = ego.surroundings.get_max_speed_list()
+        limit = max_speed_list[ego.laneIndex] if 0 <= ego.laneIndex < len(max_speed_list) else VIRTUAL_SPEED
+        v_max = limit if v_max is None else v_max
+        desired_speed = v_max if desired_speed is None else desired_speed
+        position, speed = self._rollout(ego.x, max(ego.vx, 0.0), v_max)
+        leader = ego.leadingVehicle
+        leader_position = leader['position_x'] + leader['speed'] * self.times  # (K,)
+        # until the lane change the ego must stay behind its current leader
+        leader_ok = ((position <= leader_position - self.minGap) | ~self.before).all(axis=1)  # (P,)
+        cost = self.baseCost + SPEED_WEIGHT * ((speed - desired_speed) ** 2).mean(axis=1) / desired_speed ** 2
+        cost = np.where(leader_ok, cost, np.inf)
+        gaps = self.get_gaps(ego)
+        best = None
+        evaluated = 0
+        for first in range(0, len(gaps), self.batchSize):
+            batch = gaps[first:first + self.batchSize]
+            rear_x = np.array([gap[0]['position_x'] for gap in batch])
+            rear_v = np.array([gap[0]['speed'] for gap in batch])
+            front_x = np.array([gap[1]['position_x'] for gap in batch])
+            front_v = np.array([gap[1]['speed'] for gap in batch])
+            rear = (rear_x[:, None] + rear_v[:, None] * self.times)[:, None, :]  # (G, 1, K)
+            front = (front_x[:, None] + front_v[:, None] * self.times)[:, None, :]
+            front_ok = front - position >= self.minGap + self.timeHeadway * speed  # (G, P, K)
+            rear_ok = position - rear >= self.minGap + self.timeHeadway * rear_v[:, None, None]
+            feasible = ((front_ok & rear_ok) | ~self.changing).all(axis=2)  # (G, P)
+            batch_cost = np.where(feasible, cost, np.inf)
+            index = int(np.argmin(batch_cost))
+            evaluated += batch_cost.size
+            if np.isfinite(batch_cost.flat[index]) and (best is None or batch_cost.flat[index] < best[0]):
+                best = (float(batch_cost.flat[index]), batch[index // batch_cost.shape[1]],
+                        index % batch_cost.shape[1])
+            if time.perf_counter() - start > self.budget:
+                break
+        if best is None:
+            return None
+        total_cost, (rear_vehicle, front_vehicle, lane_code), profile = best
+        return {'gap_front_vehicle': self._gap_vehicle(ego, front_vehicle, lane_code),
+                'gap_rear_vehicle': self._gap_vehicle(ego, rear_vehicle, lane_code),
+                'ax': float(self.profileAcceleration[profile]), 'duration': float(self.profileDuration[profile]),
+                'cost': total_cost, 'evaluated': evaluated, 'gaps': len(gaps)}
+
+    @staticmethod
+    def _gap_vehicle(ego, vehicle, lane_code):  # in the form lane_change_plan expects
+        vehicle = dict(vehicle)
+        vehicle.setdefault('virtual', 0)
+        vehicle['relative_position_x'] = vehicle['position_x'] - ego.x
+        vehicle['relative_position_y'] = vehicle['position_y'] - ego.y
+        vehicle['lane_index'] = lane_code
+        return vehicle
@@ -0,0 +1,117 @@
+# coding:utf-8
+import os
+import sys
+import time
+import optparse
+import multiprocessing as mp
+import numpy as np
+
+# we need to import python modules from the $SUMO_HOME/tools directory
+if 'SUMO_HOME' in os.environ:
+    tools = os.path.join(os.environ['SUMO_HOME'], 'tools')
+    sys.path.append(tools)
+else:
+    sys.exit("please declare environment variable 'SUMO_HOME'")
+
+from surrounding import Traffic  # noqa
+from roadNetwork import RoadNetwork
+from laneChangeEnv import LaneChangeEnv, NO_ACTION
+from RL_brain import BatchDataProcess, LANE_NUMBER, VEHICLE_DATA_SIZE
+
+
+def _worker(remote, env_index, n_env, buffer, env_kwargs):
+    data_process = BatchDataProcess(n_env, buffer=np.frombuffer(buffer, dtype=np.float32))
+    env = LaneChangeEnv(label='vec_env_%d' % env_index, data_process=data_process, env_index=env_index,
+                        **env_kwargs)
+    try:
+        while True:
+            command, action = remote.recv()
+            if command == 'step':
+                observation, reward, done, info = env.step(action)
+                if done:  # the next episode starts right away, its first observation replaces the last one
+                    env.reset()
+                remote.send((reward, done))
+            elif command == 'reset':
+                env.reset()
+                remote.send(None)
+            elif command == 'close':
+                break
+    finally:
+        env.close()
+        remote.close()
+
+
+class VecEnv:
+    """K LaneChangeEnv stepped in lockstep, each in its own process with its own SUMO and traci connection
+
+    The observations of all workers are written into one shared (K, 3, 12) float32 buffer,
+    reset() and step() return a view on it without copying. Finished episodes are reset automatically.
+    """
+    def __init__(self, n_env, sumo_binary='sumo', config_file='data/motorway.sumocfg',
+                 net_file='data/motorway.net.xml', seed=0, **env_kwargs):
+        self.nEnv = n_env
+        RoadNetwork(net_file)  # compile the cache once before the workers race for it
+        context = mp.get_context('spawn')
+        self.buffer = context.RawArray('f', n_env * LANE_NUMBER * VEHICLE_DATA_SIZE)
+        self.observation = np.frombuffer(self.buffer, dtype=np.float32).reshape(n_env, LANE_NUMBER,
+                                                                                 VEHICLE_DATA_SIZE)
+        self.rewards = np.zeros(n_env, dtype=np.float32)
+        self.dones = np.zeros(n_env, dtype=bool)
+        self.remotes = []
+        self.processes = []
+        env_kwargs.setdefault('regenerate_traffic', False)  # workers must not rewrite the shared route file
+        for env_index in range(n_env):
+            kwargs = dict(env_kwargs, sumo_binary=sumo_binary, config_file=config_file, net_file=net_file,
+                          seed=seed + 1000 * env_index)
+            remote, worker_remote = context.Pipe()
+            process = context.Process(target=_worker, args=(worker_remote, env_index, n_env, self.buffer, kwargs),
+                                      daemon=True)
+            process.start()
+            worker_remote.close()
+            self.remotes.append(remote)
+            self.processes.append(process)
+
+    def reset(self):
+        for remote in self.remotes:
+            remote.send(('reset', None))
+        for remote in self.remotes:
+            remote.recv()
+        return self.observation
+
+    def step(self, actions=None):
+        for env_index, remote in enumerate(self.remotes):
+            remote.send(('step', NO_ACTION if actions is None else actions[env_index]))
+        for env_index, remote in enumerate(self.remotes):
+            self.rewards[env_index], self.dones[env_index] = remote.recv()
+        return self.observation, self.rewards, self.dones
+
+    def get_observation(self):
+        return self.observation
+
+    def close(self):
+        for remote in self.remotes:
+            remote.send(('close', None))
+            remote.close()
+        for process in self.processes:
+            process.join()
+
+
+def get_options():
+    optParser = optparse.OptionParser()
+    optParser.add_option("--n_env", type="int", default=mp.cpu_count(), help="number of SUMO workers")
+    optParser.add_option("--steps", type="int", default=3000, help="number of lockstep steps")
+    options, args = optParser.parse_args()
+    return options
+
+
+if __name__ == "__main__":
+    options = get_options()
+    traffics = Traffic(trafficBase=0.4, trafficList=None)
+    env = VecEnv(options.n_env)
+    env.reset()
+    start = time.time()
+    for i in range(options.steps):
+        observation, rewards, dones = env.step()
+    elapsed = time.time() - start
+    env.close()
+    print("%d envs, %d steps: %.1f env steps/s" % (options.n_env, options.steps, options.n_env * options.steps / elapsed))
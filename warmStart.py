@@ -0,0 +1,49 @@
+# coding:utf-8
+import os
+import json
+import hashlib
+import tempfile
+import xml.etree.ElementTree as ET
+from roadNetwork import file_hash
+
+SNAPSHOT_DIR = 'data/.snapshots'
+
+
+def route_files_of(config_file):
+    """route files referenced by a .sumocfg, relative to the config file"""
+    config_dir = os.path.dirname(os.path.abspath(config_file))
+    element = ET.parse(config_file).getroot().find('input/route-files')
+    if element is None:
+        return []
+    return [os.path.join(config_dir, path) for path in element.get('value').split(',')]
+
+
+class SnapshotCache:
+    """simulation states saved after the pre-roll, keyed by everything the pre-roll depends on"""
+    def __init__(self, cache_dir=SNAPSHOT_DIR):
+        self.cacheDir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, config_file, traffic_params, seed, pre_roll_steps):
+        sha = hashlib.sha1()
+        sha.update(json.dumps({'traffic': traffic_params, 'seed': seed, 'steps': pre_roll_steps},
+                              sort_keys=True).encode())
+        for path in [config_file] + route_files_of(config_file):
+            sha.update(file_hash(path).encode())
+        return sha.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.cacheDir, key + '.xml.gz')
+
+    def has(self, key):
+        return os.path.isfile(self.path(key))
+
+    def save(self, connection, key):
+        # saved under a temporary name first so that a concurrent worker never loads half a state
+        fd, tmp_path = tempfile.mkstemp(dir=self.cacheDir, suffix='.xml.gz')
+        os.close(fd)
+        connection.simulation.saveState(tmp_path)
+        os.replace(tmp_path, self.path(key))
+
+    def restore(self, connection, key):
+        connection.simulation.loadState(self.path(key))